@@ -14,11 +14,53 @@ from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 from .models import Location, UserProfile, State, POIType
 from .progressive_planner import ProgressivePlanner
 from .neural_net_service import NeuralNetService
+from src.utils.cache import LRUCache
+
+
+_FIELD_CACHE_SIZE = 8192  # 场强缓存上限
+_FIELD_TIME_BUCKET_MINUTES = 15  # 时间量化粒度（分钟）
+# W轴读取的用户状态字段
+_STATE_VECTOR_FIELDS = ('physical_energy', 'mental_energy', 'mood', 'satiety', 'time_pressure')
+
+
+def _time_bucket(time_point: datetime) -> Tuple:
+    """
+    时间点量化到15分钟桶
+    
+    情境层只依赖小时与星期（日期决定星期），同一桶内场强视为相同
+    """
+    return (time_point.date(), time_point.hour,
+            time_point.minute // _FIELD_TIME_BUCKET_MINUTES)
+
+
+def _profile_key(profile: Optional[UserProfile]) -> Tuple:
+    """画像内容组成的缓存键（画像被修改后自然失效）"""
+    if profile is None:
+        return ()
+    return tuple(
+        (name, tuple(sorted(value.items())) if isinstance(value, dict) else value)
+        for name, value in vars(profile).items()
+    )
+
+
+def _state_key(state: State) -> Tuple:
+    """各层及W轴读取到的状态字段组成的缓存键"""
+    location = getattr(state, 'current_location', None)
+    return (
+        location.id if location else None,
+        getattr(state, 'current_time', None),
+        frozenset(getattr(state, 'visited_history', None) or ()),
+        tuple(v.id for v in getattr(state, 'visited', None) or ()),
+        getattr(state, 'remaining_budget', None),
+        getattr(state, 'budget_remaining', None),
+        *(getattr(state, name, None) for name in _STATE_VECTOR_FIELDS)
+    )
 
 
 @dataclass
@@ -67,11 +109,10 @@ class NeuralLayer:
             explanation=f"与您的意图匹配度{semantic_score:.0%}"
         ))
         
-        # 2. 历史模式相似度
-        if state.visited:
-            pattern_score = self._compute_pattern_similarity(
-                option, state.visited
-            )
+        # 2. 历史模式相似度（models.State只记录visited_history编号，无POI历史时跳过）
+        visited = getattr(state, 'visited', None)
+        if visited:
+            pattern_score = self._compute_pattern_similarity(option, visited)
             factors.append(InfluenceFactor(
                 name="模式相似度",
                 value=pattern_score,
@@ -403,15 +444,19 @@ class InfluenceField:
                  planner: ProgressivePlanner,
                  neural_service: NeuralNetService,
                  spatial_intelligence=None,
-                 enable_4d: bool = True):
+                 enable_4d: bool = True,
+                 layer_workers: int = 1):
         """
         Args:
             spatial_intelligence: 大模型（上帝视角），用于W轴因果推理
             enable_4d: 是否启用四维模式
+            layer_workers: 批量计算时并行评估候选三层因子的线程数
+                （1为串行；神经推理/验证API调用期间释放GIL，多线程可重叠等待）
         """
         self.planner = planner
         self.neural = neural_service
         self.spatial_intelligence = spatial_intelligence
+        self.layer_workers = layer_workers
         
         # Z轴三层
         self.layers = {
@@ -438,6 +483,42 @@ class InfluenceField:
         else:
             self.w_axis = None
             self.enable_4d = False
+        
+        # 场强缓存：(POI, 时间桶, 状态, 画像, 当前POI, 上下文) → (场强, 因子, W轴详情)
+        self._field_cache = LRUCache(maxsize=_FIELD_CACHE_SIZE)
+    
+    def clear_field_cache(self):
+        """清空场强缓存"""
+        self._field_cache.clear()
+    
+    def close(self):
+        """释放W轴持有的线程池"""
+        if self.w_axis is not None:
+            self.w_axis.close()
+    
+    def _context_key(self,
+                     time_point: datetime,
+                     state: State,
+                     user_profile: UserProfile,
+                     current_poi: Optional[Location],
+                     context: Optional[Dict]) -> Optional[Tuple]:
+        """
+        同一批候选共享的缓存键部分
+        
+        画像/上下文含列表等不可哈希（或不可排序）的值时返回None，本次不走缓存
+        """
+        try:
+            key = (
+                _time_bucket(time_point),
+                _state_key(state),
+                _profile_key(user_profile),
+                current_poi.id if current_poi else None,
+                tuple(sorted((context or {}).items()))
+            )
+            hash(key)
+        except TypeError:
+            return None
+        return key
     
     def compute_field(self,
                      option: Location,
@@ -456,9 +537,130 @@ class InfluenceField:
         Returns:
             (总场强, 影响因子列表, W轴详情)
         """
-        factors = []
+        context_key = self._context_key(
+            time_point, state, user_profile, current_poi, context
+        )
+        key = (option.id, context_key) if context_key is not None else None
+        cached = self._field_cache.get(key) if key is not None else None
+        if cached is not None:
+            phi, factors, w_details = cached
+            return phi, list(factors), w_details
         
         # ========== Z轴：三维场强计算 ==========
+        factors, layer_failed = self._evaluate_layers(option, time_point, state, user_profile)
+        
+        # 计算三维场强（加权和）
+        if not factors:
+            phi_3d = 0.5  # 默认值
+        else:
+            total_field_strength = sum(f.weighted_value for f in factors)
+            max_possible = sum(f.weight for f in factors)
+            if max_possible > 0:
+                phi_3d = total_field_strength / max_possible
+            else:
+                phi_3d = 0.5
+        
+        # ========== W轴：语义-因果流叠加 ==========
+        phi, factors, w_details = self._apply_w_axis(
+            phi_3d, factors, option, state, current_poi, context
+        )
+        # 有层评估失败的结果只是降级值，不写入缓存
+        if key is not None and not layer_failed:
+            self._field_cache.put(key, (phi, tuple(factors), w_details))
+        return phi, factors, w_details
+    
+    def compute_field_batch(self,
+                           options: List[Location],
+                           time_point: datetime,
+                           state: State,
+                           user_profile: UserProfile,
+                           current_poi: Optional[Location] = None,
+                           context: Optional[Dict] = None
+                           ) -> Tuple[np.ndarray, List[List[InfluenceFactor]], List[Optional[Dict]]]:
+        """
+        批量计算同一时间点、同一状态下多个候选的场强
+        
+        三层因子仍逐个候选评估，因子聚合（加权和/权重和）按(N, F)矩阵
+        一次完成，结果与逐个调用compute_field一致
+        
+        Returns:
+            (场强数组[N], 各候选影响因子列表, 各候选W轴详情)
+        """
+        n = len(options)
+        strengths = np.full(n, 0.5)
+        factors_list: List[List[InfluenceFactor]] = [None] * n
+        w_details_list: List[Optional[Dict]] = [None] * n
+        
+        # 先查缓存，只计算未命中的候选
+        context_key = self._context_key(
+            time_point, state, user_profile, current_poi, context
+        )
+        keys = [
+            (option.id, context_key) if context_key is not None else None
+            for option in options
+        ]
+        misses = []
+        for i, key in enumerate(keys):
+            cached = self._field_cache.get(key) if key is not None else None
+            if cached is None:
+                misses.append(i)
+            else:
+                strengths[i], factors, w_details_list[i] = cached
+                factors_list[i] = list(factors)
+        if not misses:
+            return strengths, factors_list, w_details_list
+        
+        def evaluate(i: int) -> Tuple[List[InfluenceFactor], bool]:
+            return self._evaluate_layers(options[i], time_point, state, user_profile)
+        
+        if self.layer_workers > 1 and len(misses) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.layer_workers, len(misses))) as executor:
+                evaluated = list(executor.map(evaluate, misses))
+        else:
+            evaluated = [evaluate(i) for i in misses]
+        for i, (factors, _) in zip(misses, evaluated):
+            factors_list[i] = factors
+        
+        # 因子个数可能不同（某层评估失败），不足处以权重0补齐
+        width = max(len(factors_list[i]) for i in misses)
+        values = np.zeros((len(misses), width))
+        weights = np.zeros((len(misses), width))
+        for row, i in enumerate(misses):
+            for j, f in enumerate(factors_list[i]):
+                values[row, j] = f.value
+                weights[row, j] = f.weight
+        
+        total = (values * weights).sum(axis=1)
+        max_possible = weights.sum(axis=1)
+        phi_3d = np.full(len(misses), 0.5)
+        np.divide(total, max_possible, out=phi_3d, where=max_possible > 0)
+        
+        for row, (i, (_, layer_failed)) in enumerate(zip(misses, evaluated)):
+            phi, factors_list[i], w_details_list[i] = self._apply_w_axis(
+                float(phi_3d[row]), factors_list[i], options[i],
+                state, current_poi, context
+            )
+            strengths[i] = phi
+            if keys[i] is not None and not layer_failed:
+                self._field_cache.put(
+                    keys[i], (phi, tuple(factors_list[i]), w_details_list[i])
+                )
+        
+        return strengths, factors_list, w_details_list
+    
+    def _evaluate_layers(self,
+                        option: Location,
+                        time_point: datetime,
+                        state: State,
+                        user_profile: UserProfile) -> Tuple[List[InfluenceFactor], bool]:
+        """
+        依次评估Z轴三层（单层失败不影响其他层）
+        
+        Returns:
+            (影响因子列表, 是否有层评估失败)
+        """
+        factors = []
+        failed = False
         
         # Z层1：神经网格层
         try:
@@ -468,6 +670,7 @@ class InfluenceField:
             factors.extend(neural_factors)
         except Exception as e:
             print(f"⚠️ 神经网格层评估失败: {e}")
+            failed = True
         
         # Z层2：数学内核层
         try:
@@ -477,6 +680,7 @@ class InfluenceField:
             factors.extend(math_factors)
         except Exception as e:
             print(f"⚠️ 数学内核层评估失败: {e}")
+            failed = True
         
         # Z层3：情境因子层
         try:
@@ -486,20 +690,18 @@ class InfluenceField:
             factors.extend(context_factors)
         except Exception as e:
             print(f"⚠️ 情境因子层评估失败: {e}")
+            failed = True
         
-        # 计算三维场强（加权和）
-        if not factors:
-            phi_3d = 0.5  # 默认值
-        else:
-            total_field_strength = sum(f.weighted_value for f in factors)
-            max_possible = sum(f.weight for f in factors)
-            if max_possible > 0:
-                phi_3d = total_field_strength / max_possible
-            else:
-                phi_3d = 0.5
-        
-        # ========== W轴：语义-因果流叠加 ==========
-        
+        return factors, failed
+    
+    def _apply_w_axis(self,
+                     phi_3d: float,
+                     factors: List[InfluenceFactor],
+                     option: Location,
+                     state: State,
+                     current_poi: Optional[Location],
+                     context: Optional[Dict]) -> Tuple[float, List[InfluenceFactor], Optional[Dict]]:
+        """叠加W轴关联场力；未启用或计算失败时保持三维场强"""
         w_details = None
         if self.enable_4d and self.w_axis and current_poi:
             try:
@@ -567,10 +769,8 @@ class InfluenceField:
         field_matrix = np.zeros((Y, X))
         
         for y_idx, time in enumerate(y_timepoints):
-            for x_idx, option in enumerate(x_options):
-                field_strength, _, _ = self.compute_field(
-                    option, time, state, profile
-                )
-                field_matrix[y_idx, x_idx] = field_strength
+            field_matrix[y_idx], _, _ = self.compute_field_batch(
+                x_options, time, state, profile
+            )
         
         return field_matrix
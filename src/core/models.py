@@ -7,6 +7,7 @@ from dataclasses import dataclass, field
 from typing import List, Set, Dict, Optional, Tuple
 from enum import Enum
 from datetime import datetime
+import math
 import uuid
 
 
@@ -30,6 +31,12 @@ class POIType(Enum):
     STATION = "station"  # 车站、机场等交通起点
 
 
+# POIType → 紧凑整数编号（按枚举定义顺序），用于查表代替字符串比较
+POI_TYPE_ID: Dict[POIType, int] = {t: i for i, t in enumerate(POIType)}
+# 未知类型的编号（查表数组需多留一位）
+UNKNOWN_TYPE_ID = len(POI_TYPE_ID)
+
+
 @dataclass
 class Location:
     """
@@ -48,6 +55,45 @@ class Location:
     opening_hours: Dict[str, Tuple[float, float]] = field(default_factory=dict)
     average_visit_time: float = 2.0  # 小时
     ticket_price: float = 0.0
+    type_id: int = field(init=False, repr=False, compare=False)  # POI_TYPE_ID编号
+    _trig: Optional[Tuple] = field(default=None, init=False, repr=False, compare=False)  # 见coord_trig
+    
+    def __post_init__(self):
+        """初始化后处理"""
+        self.type_id = POI_TYPE_ID.get(self.type, UNKNOWN_TYPE_ID)
+        # 旧数据中游玩时长可能为空，在构造处统一补默认值，读取处无需再防御
+        if self.average_visit_time is None:
+            self.average_visit_time = 2.0
+    
+    def coord_trig(self) -> Tuple[float, float, float, float, float]:
+        """
+        (lat, lon, 纬度弧度, 经度弧度, 纬度余弦)
+        
+        同一POI会与大量节点计算球面距离，三角量按实例缓存；
+        缓存带上原始坐标，坐标被修改后下次访问自动重算
+        """
+        trig = self._trig
+        if trig is None or trig[0] != self.lat or trig[1] != self.lon:
+            lat_rad = math.radians(self.lat)
+            trig = self._trig = (
+                self.lat, self.lon, lat_rad, math.radians(self.lon), math.cos(lat_rad)
+            )
+        return trig
+    
+    @property
+    def lat_rad(self) -> float:
+        """纬度（弧度）"""
+        return self.coord_trig()[2]
+    
+    @property
+    def lon_rad(self) -> float:
+        """经度（弧度）"""
+        return self.coord_trig()[3]
+    
+    @property
+    def cos_lat(self) -> float:
+        """纬度余弦"""
+        return self.coord_trig()[4]
     
     def is_open(self, time: float) -> bool:
         """
@@ -185,6 +231,52 @@ class DataSource:
     credibility: float = 1.0  # 可信度
 
 
+@dataclass(frozen=True, slots=True)
+class MultiSourceResult:
+    """原则1（多源数据交叉验证）的中间结果"""
+    sources: List[DataSource]
+    consistency: float
+    weighted_rating: float
+    mu: float
+    sigma: float
+    variance: float
+
+
+@dataclass(frozen=True, slots=True)
+class CleaningResult:
+    """原则2（数据清洗）的中间结果"""
+    total_reviews: int
+    valid_reviews: int
+    fake_rate: float
+    positive_rate: float
+    negative_rate: float
+    key_positive: List[str]
+    key_negative: List[str]
+
+
+@dataclass(frozen=True, slots=True)
+class SpatialResult:
+    """原则3（空间合理性）的中间结果"""
+    score: float
+    distance: float
+    actual_distance: float
+    detour_rate: float
+    connectivity: float
+    gnn_score: float
+
+
+@dataclass(frozen=True, slots=True)
+class TemporalResult:
+    """原则4（时间合理性）的中间结果"""
+    score: float
+    is_open: bool
+    crowd_level: float
+    time_sufficient: bool
+    remaining_time: float
+    required_time: float
+    optimal_time: Tuple[float, float]
+
+
 @dataclass
 class NodeVerification:
     """
@@ -8,6 +8,7 @@
 from typing import List, Dict, Optional, Tuple
 import random
 from datetime import datetime
+import numpy as np
 
 from .models import Location, UserProfile
 
@@ -83,6 +84,26 @@ class NeuralNetService:
         
         return random.uniform(0.0, 0.15)
     
+    def detect_fake_batch(self, review_texts: List[str]) -> np.ndarray:
+        """
+        批量检测虚假评论
+        
+        当前为Mock实现：一次生成整批随机虚假率，与逐条detect_fake同分布；
+        接入真实模型后改为整批一次前向推理（见下方TODO）
+        
+        Args:
+            review_texts: 评论文本列表
+            
+        Returns:
+            虚假概率数组，形状(len(review_texts),)
+        """
+        # TODO: 接入真实GAN模型
+        # tokens = self.tokenizer(review_texts, padding=True, truncation=True, return_tensors='pt')
+        # with torch.no_grad():
+        #     fake_probs = self.gan_model(**tokens).logits.softmax(-1)[:, 1].cpu().numpy()
+        
+        return np.random.uniform(0.0, 0.15, len(review_texts))
+    
     def sentiment_analysis(self, text: str) -> float:
         """
         情感分析
@@ -103,6 +124,22 @@ class NeuralNetService:
         
         return random.uniform(0.6, 0.9)
     
+    def sentiment_analysis_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        批量情感分析
+        
+        当前为Mock实现：一次生成整批随机情感分数，与逐条sentiment_analysis同分布
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            情感分数数组 [0, 1]，形状(len(texts),)
+        """
+        # TODO: 接入真实情感分析模型（同detect_fake_batch按批推理）
+        
+        return np.random.uniform(0.6, 0.9, len(texts))
+    
     def gnn_spatial(self, 
                    from_loc: Location,
                    to_loc: Location) -> float:
@@ -104,6 +104,9 @@ class ProgressivePlanner:
         Returns:
             规划会话
         """
+        # 新的规划请求：画像会重新生成，清空上一次的匹配缓存
+        self.scoring_engine.clear_plan_cache()
+        
         # 1. 提取用户画像（使用神经网络）
         if self.nn_service:
             user_profile = self.nn_service.extract_user_profile(
@@ -193,6 +196,11 @@ class ProgressivePlanner:
                     continue
                 print(f"      验证: Trust={verification.overall_trust_score:.2f}")
                 
+                # 违反硬约束的节点无需评分及后续分析
+                if not self.scoring_engine.is_viable(node, verification, state):
+                    print("      ❌ 跳过: 违反硬约束")
+                    continue
+                
                 # 2.3 计算综合评分
                 score = self.scoring_engine.compute_score(
                     node, edges, verification, profile, state
@@ -296,7 +304,7 @@ class ProgressivePlanner:
                 
                 # 🔥 提取张力统计
                 avg_conflict = sum(r['tensions']['conflict'] for r in w_results) / len(w_results)
-                print(f"      平均冲突度: {avg_conflict:.3f}（{"高冲突" if avg_conflict > 0.3 else "低冲突"}）")
+                print(f"      平均冲突度: {avg_conflict:.3f}（{'高冲突' if avg_conflict > 0.3 else '低冲突'}）")
                 
                 # 设置W轴相关字段
                 for option, w_result in zip(options, w_results):
@@ -331,15 +339,27 @@ class ProgressivePlanner:
         options.sort(key=lambda x: x.score, reverse=True)
         
         # 3.5 风险分析（使用SpatialIntelligenceCore）
-        if self.spatial_core:
-            for option in options:
+        if self.spatial_core and options:
+            try:
+                # 批量分析风险等级
+                risk_analyses = self.spatial_core.analyze_with_risk_level_batch(
+                    [option.node for option in options],
+                    state,
+                    session
+                )
+            except Exception as e:
+                print(f"Risk analysis error: {e}")
+                # 降级：逐个候选重新分析，单个候选失败不影响其他候选
+                risk_analyses = [None] * len(options)
+            
+            for option, risk_analysis in zip(options, risk_analyses):
                 try:
-                    # 分析风险等级
-                    risk_analysis = self.spatial_core.analyze_with_risk_level(
-                        option.node,
-                        state,
-                        session
-                    )
+                    if risk_analysis is None:
+                        risk_analysis = self.spatial_core.analyze_with_risk_level(
+                            option.node,
+                            state,
+                            session
+                        )
                     
                     # 设置风险等级
                     option.risk_level = risk_analysis.risk_level
@@ -364,10 +384,11 @@ class ProgressivePlanner:
             try:
                 print(f"   💭 生成人性化解释...")
                 
+                time_str = self._format_time(state.current_time)
                 for rank, option in enumerate(top_options, 1):
                     # 🔥 构建上下文（包含张力信息）
                     context = {
-                        'time': self._format_time(state.current_time),
+                        'time': time_str,
                         'weather': 'sunny',  # TODO: 从session获取
                         'visited_regions': dict(session.region_visit_counts),
                         'c_causal': option.c_causal if option.c_causal else 0.5,
@@ -1022,6 +1043,5 @@ class ProgressivePlanner:
         Returns:
             时间字符串（如"10:30"）
         """
-        h = int(hour)
-        m = int((hour - h) * 60)
+        h, m = divmod(int(round(hour * 60)), 60)
         return f"{h:02d}:{m:02d}"
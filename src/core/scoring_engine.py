@@ -3,14 +3,154 @@
 计算节点的综合评分和匹配度
 """
 
-from typing import List, Dict
+from typing import List, Dict, Tuple, Callable, Optional
 import math
 
+import numpy as np
+
+from src.utils.jit import njit, prange, NUMBA_AVAILABLE
 from .models import (
-    Location, Edge, NodeVerification, UserProfile, State
+    Location, Edge, NodeVerification, UserProfile, State,
+    POIType, POI_TYPE_ID, UNKNOWN_TYPE_ID
 )
 
 
+# 批量评分统一使用float32（分数∈[0,1]，3位有效数字足够，带宽减半）
+SCORE_DTYPE = np.float32
+
+# 六个因子在权重向量/因子矩阵中的列顺序
+_FACTOR_ORDER = ('match', 'trust', 'quality', 'efficiency', 'novelty', 'crowd')
+
+# 节奏档位：景点/餐厅慢节奏，娱乐场所快节奏，其余中等
+_PACE_SLOW, _PACE_MEDIUM, _PACE_FAST = 0, 1, 2
+_PACE_LEVELS = ('slow', 'medium', 'fast')
+
+
+def _build_pace_by_type_id() -> Tuple[int, ...]:
+    """按POI_TYPE_ID顺序构建 type_id → 节奏档位 查找表"""
+    lut = [_PACE_MEDIUM] * (UNKNOWN_TYPE_ID + 1)
+    lut[POI_TYPE_ID[POIType.ATTRACTION]] = _PACE_SLOW
+    lut[POI_TYPE_ID[POIType.RESTAURANT]] = _PACE_SLOW
+    lut[POI_TYPE_ID[POIType.ENTERTAINMENT]] = _PACE_FAST
+    return tuple(lut)
+
+
+_PACE_BY_TYPE_ID = _build_pace_by_type_id()
+_RESTAURANT_TYPE_ID = POI_TYPE_ID[POIType.RESTAURANT]
+
+# POI类型 → 对应的旅行目的
+_TYPE_TO_PURPOSE: Dict[str, Tuple[str, ...]] = {
+    'attraction': ('culture', 'leisure', 'adventure', 'photography'),
+    'restaurant': ('leisure', 'food'),
+    'hotel': ('rest',),
+    'shopping': ('shopping', 'leisure'),
+    'entertainment': ('leisure', 'adventure'),
+}
+_DEFAULT_PURPOSES: Tuple[str, ...] = ('leisure',)
+
+# 按type_id索引的目的查找表（未列出的类型使用默认目的）
+_PURPOSES_BY_TYPE_ID: Tuple[Tuple[str, ...], ...] = tuple(
+    _TYPE_TO_PURPOSE.get(t.value, _DEFAULT_PURPOSES) for t in POI_TYPE_ID
+) + (_DEFAULT_PURPOSES,)
+
+# 标量评分内核模板：权重以字面量嵌入，质量因子的系数预先相乘
+_SCORE_KERNEL_SRC = """
+def _score(match, trust, rating, positive, crowd, edge_time, visited):
+    efficiency = 0.5 if edge_time is None else _exp(edge_time * -0.5)
+    score = ({w_match!r} * match
+             + {w_trust!r} * trust
+             + {w_rating!r} * rating
+             + {w_positive!r} * positive
+             + {w_efficiency!r} * efficiency
+             + (0.0 if visited else {w_novelty!r})
+             + {w_crowd!r} * (1.0 - crowd))
+    return 0.0 if score < 0.0 else (1.0 if score > 1.0 else score)
+"""
+
+
+def _compile_score_kernel(weights: Dict[str, float]) -> Callable[..., float]:
+    """
+    为一组权重生成专用的标量评分函数
+    
+    会话内权重不变，把权重作为常量编译进函数体，
+    省去每次调用时的字典查找。
+    
+    生成函数签名:
+        (match, trust, rating, positive, crowd, edge_time, visited) -> float
+    其中 edge_time 为最短边耗时（无可达边时为None）
+    """
+    src = _SCORE_KERNEL_SRC.format(
+        w_match=float(weights['match']),
+        w_trust=float(weights['trust']),
+        w_rating=float(weights['quality']) * 0.6 / 5.0,
+        w_positive=float(weights['quality']) * 0.4,
+        w_efficiency=float(weights['efficiency']),
+        w_novelty=float(weights['novelty']),
+        w_crowd=float(weights['crowd']),
+    )
+    namespace = {'_exp': math.exp}
+    exec(compile(src, '<score_kernel>', 'exec'), namespace)
+    return namespace['_score']
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _score_batch_kernel(match, trust, rating, positive, crowd,
+                        edge_time, has_edges, visited, weights):
+    """
+    批量评分内核（Numba并行，每个候选独立计算）
+    
+    weights按_FACTOR_ORDER排列；与compute_score的六因子公式一致
+    """
+    n = match.shape[0]
+    out = np.empty(n, dtype=np.float32)
+    w_rating = weights[2] * 0.12
+    w_positive = weights[2] * 0.4
+    for i in prange(n):
+        efficiency = math.exp(-edge_time[i] * 0.5) if has_edges[i] else 0.5
+        novelty = 0.0 if visited[i] else 1.0
+        s = (weights[0] * match[i]
+             + weights[1] * trust[i]
+             + w_rating * rating[i]
+             + w_positive * positive[i]
+             + weights[3] * efficiency
+             + weights[4] * novelty
+             + weights[5] * (1.0 - crowd[i]))
+        out[i] = min(max(s, 0.0), 1.0)
+    return out
+
+
+def _score_batch_numpy(match, trust, rating, positive, crowd,
+                       edge_time, has_edges, visited, weights):
+    """批量评分（NumPy降级实现）：(N, 6)因子矩阵 @ 权重向量"""
+    factors = np.empty((match.shape[0], len(_FACTOR_ORDER)), dtype=SCORE_DTYPE)
+    factors[:, 0] = match
+    factors[:, 1] = trust
+    # f3: 质量（评分归一化 + 正面评价率）
+    factors[:, 2] = rating * SCORE_DTYPE(0.6 / 5.0) + positive * SCORE_DTYPE(0.4)
+    # f4: 效率（无可达边时为0.5）
+    factors[:, 3] = np.where(
+        has_edges, np.exp(edge_time * SCORE_DTYPE(-0.5)), SCORE_DTYPE(0.5)
+    )
+    # f5: 新颖性
+    factors[:, 4] = ~visited
+    # f6: 避免拥挤
+    factors[:, 5] = SCORE_DTYPE(1.0) - crowd
+    
+    scores = factors @ weights
+    np.clip(scores, 0.0, 1.0, out=scores)
+    return scores
+
+
+if NUMBA_AVAILABLE:
+    _score_batch = _score_batch_kernel
+    # 导入时预热一次，避免首个规划请求承担JIT编译开销
+    _score_batch(*(np.zeros(1, dtype=SCORE_DTYPE),) * 6,
+                 np.zeros(1, dtype=bool), np.zeros(1, dtype=bool),
+                 np.zeros(len(_FACTOR_ORDER), dtype=SCORE_DTYPE))
+else:
+    _score_batch = _score_batch_numpy
+
+
 class ScoringEngine:
     """
     评分引擎
@@ -32,13 +172,33 @@ class ScoringEngine:
             config: 配置参数
         """
         self.config = config or self._default_config()
+        
+        # 权重向量（float32，与_FACTOR_ORDER对齐），供批量评分使用
+        weights = self.config['score_weights']
+        self._weight_vec = np.array(
+            [weights[name] for name in _FACTOR_ORDER], dtype=SCORE_DTYPE
+        )
+        # 权重固化的标量评分内核
+        self._score_kernel = _compile_score_kernel(weights)
+        
+        # 偏好匹配缓存 (id(profile), node.id) → match
+        # 规划期间profile不变，匹配度只依赖(节点, 画像)
+        self._match_cache: Dict[Tuple[int, str], float] = {}
+        # 节奏偏好数组缓存 id(pace_pref) → (slow, medium, fast)
+        self._pace_pref_cache: Dict[int, Tuple[float, float, float]] = {}
+    
+    def clear_plan_cache(self):
+        """清空规划期缓存（每次新的规划请求开始时调用）"""
+        self._match_cache.clear()
+        self._pace_pref_cache.clear()
     
     def compute_score(self,
                      node: Location,
                      edges: List[Edge],
                      verification: NodeVerification,
                      profile: UserProfile,
-                     state: State) -> float:
+                     state: State,
+                     fast_reject: bool = False) -> float:
         """
         计算节点综合评分
         
@@ -59,45 +219,146 @@ class ScoringEngine:
             verification: 验证数据
             profile: 用户画像
             state: 当前状态
+            fast_reject: 违反硬约束的节点直接返回0（跳过六个因子）
             
         Returns:
             综合评分 ∈ [0, 1]
         """
-        # 获取权重配置
-        weights = self.config['score_weights']
+        if fast_reject and not self.is_viable(node, verification, state):
+            return 0.0
         
-        # f1: 偏好匹配度
+        # f1: 偏好匹配度（其余因子由内核计算）
         match_score = self.compute_match_score(node, profile)
         
-        # f2: 可信度（四项原则）
-        trust_score = verification.overall_trust_score
-        
-        # f3: 质量分数（评分）
-        quality_score = self._compute_quality_score(verification)
+        # f4使用时间最短的边
+        best_time: Optional[float] = min(e.time for e in edges) if edges else None
+        
+        return self._score_kernel(
+            match_score,
+            verification.overall_trust_score,
+            verification.weighted_rating,
+            verification.positive_rate,
+            verification.predicted_crowd_level,
+            best_time,
+            node.id in state.visited_history
+        )
+    
+    def compute_scores_batch(self,
+                             nodes: List[Location],
+                             edges_list: List[List[Edge]],
+                             verifications: List[NodeVerification],
+                             profile: UserProfile,
+                             state: State,
+                             fast_reject: bool = False) -> np.ndarray:
+        """
+        批量计算节点综合评分（与compute_score等价的向量化版本）
         
-        # f4: 效率分数（距离、时间）
-        efficiency_score = self._compute_efficiency_score(edges, state)
+        每个输入存为一列float32数组（SoA布局），
+        安装numba时由并行内核逐候选计算，否则为一次 (N, 6) @ (6,) 矩阵乘法。
         
-        # f5: 新颖性（未访问过的更高）
-        novelty_score = self._compute_novelty_score(node, state)
+        Args:
+            nodes: POI节点列表
+            edges_list: 每个节点的可达边列表
+            verifications: 每个节点的验证数据
+            profile: 用户画像
+            state: 当前状态
+            fast_reject: 仅对通过filter_candidates的节点评分，其余为0
+            
+        Returns:
+            综合评分数组 (N,)，dtype=float32，∈ [0, 1]
+        """
+        if fast_reject:
+            mask = self.filter_candidates(nodes, verifications, state)
+            scores = np.zeros(len(nodes), dtype=SCORE_DTYPE)
+            if mask.any():
+                idx = np.flatnonzero(mask)
+                scores[idx] = self.compute_scores_batch(
+                    [nodes[i] for i in idx],
+                    [edges_list[i] for i in idx],
+                    [verifications[i] for i in idx],
+                    profile, state
+                )
+            return scores
+        
+        n = len(nodes)
+        if n == 0:
+            return np.empty(0, dtype=SCORE_DTYPE)
+        
+        match = np.empty(n, dtype=SCORE_DTYPE)
+        trust = np.empty(n, dtype=SCORE_DTYPE)
+        rating = np.empty(n, dtype=SCORE_DTYPE)
+        positive = np.empty(n, dtype=SCORE_DTYPE)
+        crowd = np.empty(n, dtype=SCORE_DTYPE)
+        edge_time = np.zeros(n, dtype=SCORE_DTYPE)
+        has_edges = np.zeros(n, dtype=bool)
+        visited = np.empty(n, dtype=bool)
+        
+        visited_history = state.visited_history
+        for i, (node, edges, verification) in enumerate(
+                zip(nodes, edges_list, verifications)):
+            match[i] = self.compute_match_score(node, profile)
+            trust[i] = verification.overall_trust_score
+            rating[i] = verification.weighted_rating
+            positive[i] = verification.positive_rate
+            crowd[i] = verification.predicted_crowd_level
+            if edges:
+                has_edges[i] = True
+                edge_time[i] = min(e.time for e in edges)
+            visited[i] = node.id in visited_history
+        
+        return _score_batch(match, trust, rating, positive, crowd,
+                            edge_time, has_edges, visited, self._weight_vec)
+    
+    def is_viable(self,
+                  node: Location,
+                  verification: NodeVerification,
+                  state: State) -> bool:
+        """
+        硬约束快速判断（在评分之前剪枝）
         
-        # f6: 避免拥挤
-        crowd_score = 1 - verification.predicted_crowd_level
+        以下任一条件成立即淘汰：
+        - 可信度低于 trust_floor
+        - 预测拥挤度高于 crowd_ceiling
+        - 已访问过（且不允许回访）
+        """
+        reject = self.config.get('fast_reject', {})
+        if not reject.get('allow_revisit', False) and node.id in state.visited_history:
+            return False
+        if verification.overall_trust_score < reject.get('trust_floor', 0.3):
+            return False
+        if verification.predicted_crowd_level > reject.get('crowd_ceiling', 0.95):
+            return False
+        return True
+    
+    def filter_candidates(self,
+                          nodes: List[Location],
+                          verifications: List[NodeVerification],
+                          state: State) -> np.ndarray:
+        """
+        批量硬约束过滤
         
-        # 综合评分
-        score = (
-            weights['match'] * match_score +
-            weights['trust'] * trust_score +
-            weights['quality'] * quality_score +
-            weights['efficiency'] * efficiency_score +
-            weights['novelty'] * novelty_score +
-            weights['crowd'] * crowd_score
+        Returns:
+            存活掩码 (N,)，True表示需要参与评分
+        """
+        n = len(nodes)
+        reject = self.config.get('fast_reject', {})
+        trust = np.fromiter(
+            (v.overall_trust_score for v in verifications), dtype=SCORE_DTYPE, count=n
+        )
+        crowd = np.fromiter(
+            (v.predicted_crowd_level for v in verifications), dtype=SCORE_DTYPE, count=n
         )
         
-        # 归一化到 [0, 1]
-        score = max(0.0, min(1.0, score))
+        mask = (trust >= reject.get('trust_floor', 0.3)) & \
+               (crowd <= reject.get('crowd_ceiling', 0.95))
+        if not reject.get('allow_revisit', False):
+            visited_history = state.visited_history
+            visited = np.fromiter(
+                (node.id in visited_history for node in nodes), dtype=bool, count=n
+            )
+            mask &= ~visited
         
-        return score
+        return mask
     
     def compute_match_score(self,
                            node: Location,
@@ -117,6 +378,11 @@ class ScoringEngine:
         Returns:
             匹配度 ∈ [0, 1]
         """
+        key = (id(profile), node.id)
+        cached = self._match_cache.get(key)
+        if cached is not None:
+            return cached
+        
         scores = []
         
         # 1. 类型匹配
@@ -132,12 +398,14 @@ class ScoringEngine:
         scores.append(pace_match)
         
         # 4. 美食匹配（如果是餐厅）
-        if node.type.value == 'restaurant' and profile.food_preference:
+        if node.type_id == _RESTAURANT_TYPE_ID and profile.food_preference:
             food_match = self._match_food(node, profile.food_preference)
             scores.append(food_match)
         
         # 平均匹配度
-        return sum(scores) / len(scores) if scores else 0.5
+        match = sum(scores) / len(scores) if scores else 0.5
+        self._match_cache[key] = match
+        return match
     
     def _match_poi_type_to_purpose(self,
                                     node: Location,
@@ -150,20 +418,13 @@ class ScoringEngine:
         - restaurant → leisure, food
         - hotel → rest
         - shopping → shopping, leisure
-        """
-        type_to_purpose = {
-            'attraction': ['culture', 'leisure', 'adventure', 'photography'],
-            'restaurant': ['leisure', 'food'],
-            'hotel': ['rest'],
-            'shopping': ['shopping', 'leisure'],
-            'entertainment': ['leisure', 'adventure']
-        }
         
-        mapped_purposes = type_to_purpose.get(node.type.value, ['leisure'])
+        完整映射见模块级 _TYPE_TO_PURPOSE
+        """
+        mapped_purposes = _PURPOSES_BY_TYPE_ID[node.type_id]
         
         # 计算匹配分数
-        scores = [purpose.get(p, 0.0) for p in mapped_purposes]
-        return max(scores) if scores else 0.5
+        return max(purpose.get(p, 0.0) for p in mapped_purposes)
     
     def _match_intensity(self,
                         node: Location,
@@ -197,15 +458,13 @@ class ScoringEngine:
         
         景点节奏与用户偏好匹配
         """
-        # 简化：景点默认慢节奏，娱乐场所快节奏
-        if node.type.value in ['attraction', 'restaurant']:
-            poi_pace = 'slow'
-        elif node.type.value == 'entertainment':
-            poi_pace = 'fast'
-        else:
-            poi_pace = 'medium'
+        # 简化：景点默认慢节奏，娱乐场所快节奏（见_PACE_BY_TYPE_ID）
+        pace_arr = self._pace_pref_cache.get(id(pace_pref))
+        if pace_arr is None:
+            pace_arr = tuple(pace_pref.get(level, 0.5) for level in _PACE_LEVELS)
+            self._pace_pref_cache[id(pace_pref)] = pace_arr
         
-        return pace_pref.get(poi_pace, 0.5)
+        return pace_arr[_PACE_BY_TYPE_ID[node.type_id]]
     
     def _match_food(self,
                    node: Location,
@@ -218,59 +477,6 @@ class ScoringEngine:
         # 简化：返回默认值
         return 0.7
     
-    def _compute_quality_score(self,
-                               verification: NodeVerification) -> float:
-        """
-        质量分数
-        
-        基于清洗后的评分和评价率
-        """
-        # 评分归一化（假设满分5分）
-        rating_score = verification.weighted_rating / 5.0
-        
-        # 正面评价率
-        positive_score = verification.positive_rate
-        
-        # 综合
-        return 0.6 * rating_score + 0.4 * positive_score
-    
-    def _compute_efficiency_score(self,
-                                  edges: List[Edge],
-                                  state: State) -> float:
-        """
-        效率分数
-        
-        考虑距离和时间成本
-        
-        算法:
-        选择最佳边（时间最短）
-        Efficiency = 1 / (1 + time)
-        """
-        if not edges:
-            return 0.5
-        
-        # 选择时间最短的边
-        best_edge = min(edges, key=lambda e: e.time)
-        
-        # 效率分数（时间越短分数越高）
-        # 使用衰减函数
-        efficiency = math.exp(-best_edge.time / 2.0)
-        
-        return efficiency
-    
-    def _compute_novelty_score(self,
-                              node: Location,
-                              state: State) -> float:
-        """
-        新颖性分数
-        
-        未访问过的节点新颖性更高
-        """
-        if node.id in state.visited_history:
-            return 0.0  # 已访问过
-        else:
-            return 1.0  # 未访问
-    
     def _default_config(self) -> Dict:
         """默认配置"""
         return {
@@ -281,5 +487,10 @@ class ScoringEngine:
                 'efficiency': 0.15,  # 效率
                 'novelty': 0.10,     # 新颖性
                 'crowd': 0.10        # 避免拥挤
+            },
+            'fast_reject': {
+                'trust_floor': 0.3,     # 可信度下限
+                'crowd_ceiling': 0.95,  # 拥挤度上限
+                'allow_revisit': False  # 是否允许回访
             }
         }
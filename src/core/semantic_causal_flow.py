@@ -18,13 +18,23 @@ Author: GAODE Team
 Date: 2024-12
 """
 
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+import logging
+import math
+import re
 import numpy as np
 
-from .models import Location, UserProfile, State, POIType
+from src.utils.jit import njit, prange, NUMBA_AVAILABLE
+from src.utils.cache import LRUCache
+from .models import Location, UserProfile, State, POIType, POI_TYPE_ID
+
+logger = logging.getLogger(__name__)
 
 
 class SemanticType(Enum):
@@ -47,7 +57,149 @@ class IntensityLevel(Enum):
     EXTREME = 5       # 极限（80-100%）
 
 
-@dataclass
+# 语义类型 → 整数编号（查表索引）
+SEMANTIC_TYPE_ID: Dict[SemanticType, int] = {t: i for i, t in enumerate(SemanticType)}
+
+# S_sem = 0.4·内容连贯 + 0.3·强度互补 + 0.3·状态适配
+_SEMANTIC_WEIGHTS = np.array([0.4, 0.3, 0.3])
+# 逐对标量计算用的同一组权重
+_W_CONTENT, _W_INTENSITY, _W_STATE = _SEMANTIC_WEIGHTS.tolist()
+
+# POI类型 → 语义类型（未列出的类型视为文化体验）
+_POI_TO_SEMANTIC: Dict[POIType, SemanticType] = {
+    POIType.ATTRACTION: SemanticType.STATIC_VIEWING,
+    POIType.RESTAURANT: SemanticType.DINING,
+    POIType.SHOPPING: SemanticType.SHOPPING,
+    POIType.HOTEL: SemanticType.RELAXATION,
+    POIType.ENTERTAINMENT: SemanticType.DYNAMIC_ACTIVITY
+}
+
+# 语义类型 → 强度等级（未列出的类型为中度）
+_SEMANTIC_INTENSITY: Dict[SemanticType, IntensityLevel] = {
+    SemanticType.STATIC_VIEWING: IntensityLevel.LIGHT,
+    SemanticType.DYNAMIC_ACTIVITY: IntensityLevel.INTENSE,
+    SemanticType.RELAXATION: IntensityLevel.REST
+}
+
+# 以下属性表均按语义类型ID排列
+TYPE_NUMERIC = np.array([0.1, 0.9, 0.2, 0.5, 0.6, 0.3, 0.7], dtype=np.float32)
+
+_INTENSITY_BY_TYPE = np.array(
+    [_SEMANTIC_INTENSITY.get(t, IntensityLevel.MODERATE).value for t in SemanticType],
+    dtype=np.int8
+)
+
+# 语义标志位
+_FLAG_INDOOR = 1
+_FLAG_STATIC = 2
+
+_FLAGS_BY_TYPE = np.array([
+    (_FLAG_INDOOR if t in (SemanticType.SHOPPING, SemanticType.DINING) else 0) |
+    (_FLAG_STATIC if t == SemanticType.STATIC_VIEWING else 0)
+    for t in SemanticType
+], dtype=np.uint8)
+
+_CULTURAL_BY_TYPE = np.array(
+    [0.8 if t == SemanticType.CULTURAL else 0.3 for t in SemanticType],
+    dtype=np.float32
+)
+
+# 强度互补查表：行=体力档（低/中/高），列=下一POI强度等级-1
+INTENSITY_LUT = np.array([
+    # REST  LIGHT  MOD   INTENSE EXTREME
+    [1.0,  1.0,   -0.6, -0.6,   -0.6],   # 体力低：需要休息
+    [0.6,  0.9,   0.9,  -0.3,   -0.3],   # 体力中等：适合中度
+    [0.5,  0.5,   0.5,  0.8,    0.8]     # 体力充沛：接受高强度
+])
+
+# 强度转移矩阵（前后强度组合的合理性），行=当前强度-1，列=下一强度-1
+_INTENSITY_TRANSITION = np.array([
+    # REST  LIGHT  MOD   INTENSE EXTREME
+    [0.5,  0.9,   0.8,  0.6,    0.3],   # 从REST
+    [0.7,  0.7,   0.9,  0.7,    0.4],   # 从LIGHT
+    [0.8,  0.8,   0.7,  0.6,    0.3],   # 从MODERATE
+    [0.9,  0.8,   0.6,  0.3,    0.1],   # 从INTENSE
+    [1.0,  0.9,   0.7,  0.2,   -0.3]    # 从EXTREME
+], dtype=np.float32)
+_INTENSITY_TRANSITION.flags.writeable = False  # 全局共享，禁止原地修改
+
+# 内容连贯性：手工相似度表与嵌入余弦相似度的混合权重
+_SIM_TABLE_BLEND = 0.7
+_COSINE_BLEND = 0.3
+
+# 连续高强度（前后强度均≥4）的叠加疲劳惩罚
+_CONSECUTIVE_INTENSE_PENALTY = 0.3
+
+# 因果张力：区域与知名地标
+_REGIONS = ("鼓浪屿", "厦大", "曾厝垵", "中山路", "环岛路")
+_OTHER_REGION = "其他"
+_REGION_NAMES = _REGIONS + (_OTHER_REGION,)
+_REGION_ID: Dict[str, int] = {r: i for i, r in enumerate(_REGION_NAMES)}
+_OTHER_REGION_ID = _REGION_ID[_OTHER_REGION]
+_REGION_RE = re.compile("|".join(map(re.escape, _REGIONS)))
+
+_FAMOUS_NAMES = ("厦大", "鼓浪屿", "环岛路", "曾厝垵", "中山路",
+                 "拙政园", "虎丘", "平江路", "姑苏")
+_FAMOUS_RE = re.compile("|".join(map(re.escape, _FAMOUS_NAMES)))
+
+_RESTAURANT_TYPE_ID = POI_TYPE_ID[POIType.RESTAURANT]
+
+# 张力列顺序（批量结果与单个结果共用）
+_TENSION_KEYS = ('novelty', 'continuity', 'energy', 'conflict')
+
+# LLM因果评估prompt模板（配合str.format_map使用）
+_PROMPT_TMPL = """评估旅行决策合理性（0-1分）：
+
+当前：{current}
+候选：{candidate}（{region}区域）
+时间：{hour:g}点 | 天气：{weather}
+该区域已访问：{visit_count}次
+
+评估要点：
+1. 区域重复：首次+0.3，第2次-0.25，第3次-0.4
+2. 时间合理：中午餐厅+0.4，其他时段餐厅-0.2
+3. 天气适配：雨天室内+0.2，雨天户外-0.3
+4. 景点知名度：知名景点+0.15
+5. 类型连续：重复类型-0.15
+
+只返回一个0-1之间的数字（如0.85），不要解释。"""
+
+
+# 语义目录（按需登记的POI）上限，超过后以当前批次重建
+_CATALOG_MAX_SIZE = 16384
+
+# prompt → LLM得分缓存容量（按分析器实例，同一规划会话内大量prompt完全相同）
+_PROMPT_CACHE_SIZE = 1024
+
+# 8维语义嵌入模板：第i行为语义类型i的嵌入，持续时间列取默认2小时，
+# 按POI计算时只需覆盖持续时间列
+_EMB_DURATION = 1
+_DEFAULT_DURATION = 2.0
+
+BASE_EMBEDDINGS = np.column_stack([
+    _INTENSITY_BY_TYPE / 5.0,  # 强度归一化
+    np.full(len(SemanticType), _DEFAULT_DURATION / 4.0),  # 假设最长4小时
+    (_FLAGS_BY_TYPE & _FLAG_INDOOR) != 0,
+    (_FLAGS_BY_TYPE & _FLAG_STATIC) != 0,
+    _CULTURAL_BY_TYPE,
+    _INTENSITY_BY_TYPE / 5.0,  # 体力需求
+    TYPE_NUMERIC,
+    np.zeros(len(SemanticType))  # 预留维度
+]).astype(np.float32)
+
+# 单位嵌入按int8量化（嵌入各维非负，[0, 1] → [0, 127]），内积乘以统一比例还原
+_EMB_Q_LEVELS = 127
+_EMB_Q_SCALE = 1.0 / _EMB_Q_LEVELS ** 2
+
+# POI类型ID → 语义类型ID（末位对应未知POI类型）
+_SEMANTIC_ID_BY_POI_TYPE_ID = np.array(
+    [SEMANTIC_TYPE_ID[_POI_TO_SEMANTIC.get(t, SemanticType.CULTURAL)] for t in POI_TYPE_ID]
+    + [SEMANTIC_TYPE_ID[SemanticType.CULTURAL]],
+    dtype=np.int8
+)
+
+
+@dataclass(slots=True)
 class UserStateVector:
     """用户状态向量"""
     physical_energy: float  # 体力 0-1
@@ -67,7 +219,63 @@ class UserStateVector:
         ])
 
 
-@dataclass
+# 用户状态分桶：阈值类字段按语义规则的阈值分档（不改变任何规则分支），
+# 体力另有连续项，按1/255量化
+_ENERGY_BANDS = (0.4, 0.7)     # 体力 >0.4 / >0.7
+_MENTAL_BANDS = (0.4,)         # 精力 <0.4
+_SATIETY_LOW = 0.3             # 饱腹感 <0.3
+_SATIETY_HIGH = 0.7            # 饱腹感 >0.7
+_MOOD_BANDS = (0.4,)           # 心情 <0.4
+
+# 各档位的代表值（体力档位给出取值区间）
+_ENERGY_BAND_RANGES = (
+    (0.0, 0.4),
+    (math.nextafter(0.4, 1.0), 0.7),
+    (math.nextafter(0.7, 1.0), 1.0)
+)
+_MENTAL_BAND_VALUES = (0.0, 1.0)
+_SATIETY_BAND_VALUES = (0.0, 0.5, 1.0)
+_MOOD_BAND_VALUES = (0.0, 1.0)
+
+
+def _bucket_state(us: UserStateVector) -> int:
+    """
+    将用户状态压缩为整数分桶键
+    
+    位布局：[体力量化值:8][体力档:2][精力档:1][饱腹档:2][心情档:1]
+    时间压力不参与语义评分，不计入键
+    """
+    energy_q = min(max(int(round(us.physical_energy * 255)), 0), 255)
+    key = energy_q
+    key = (key << 2) | bisect_left(_ENERGY_BANDS, us.physical_energy)
+    key = (key << 1) | bisect_right(_MENTAL_BANDS, us.mental_energy)
+    key = (key << 2) | (us.satiety >= _SATIETY_LOW) + (us.satiety > _SATIETY_HIGH)
+    key = (key << 1) | bisect_right(_MOOD_BANDS, us.mood)
+    return key
+
+
+def _unbucket_state(key: int) -> UserStateVector:
+    """由分桶键还原代表性用户状态（与原状态落在相同的规则分支）"""
+    mood_band = key & 0b1
+    key >>= 1
+    satiety_band = key & 0b11
+    key >>= 2
+    mental_band = key & 0b1
+    key >>= 1
+    energy_band = key & 0b11
+    energy_q = key >> 2
+    
+    low, high = _ENERGY_BAND_RANGES[energy_band]
+    return UserStateVector(
+        physical_energy=min(max(energy_q / 255, low), high),
+        mental_energy=_MENTAL_BAND_VALUES[mental_band],
+        mood=_MOOD_BAND_VALUES[mood_band],
+        satiety=_SATIETY_BAND_VALUES[satiety_band],
+        time_pressure=0.0
+    )
+
+
+@dataclass(slots=True)
 class SemanticVector:
     """语义向量"""
     semantic_type: SemanticType
@@ -81,31 +289,137 @@ class SemanticVector:
     physical_demand: float  # 体力需求 0-1
     
     def to_embedding(self) -> np.ndarray:
-        """转换为嵌入向量"""
-        # 8维语义嵌入
-        return np.array([
-            self.intensity_level.value / 5.0,  # 强度归一化
-            self.duration / 4.0,  # 假设最长4小时
-            1.0 if self.is_indoor else 0.0,
-            1.0 if self.is_static else 0.0,
-            self.cultural_depth,
-            self.physical_demand,
-            self._type_to_numeric(),
-            0.0  # 预留维度
-        ])
+        """
+        转换为嵌入向量
+        
+        8维语义嵌入取自BASE_EMBEDDINGS中该语义类型的模板行，
+        只覆盖随POI变化的持续时间
+        """
+        embedding = BASE_EMBEDDINGS[SEMANTIC_TYPE_ID[self.semantic_type]].copy()
+        embedding[_EMB_DURATION] = self.duration / 4.0  # 假设最长4小时
+        return embedding
     
     def _type_to_numeric(self) -> float:
         """类型转数值"""
-        type_map = {
-            SemanticType.STATIC_VIEWING: 0.1,
-            SemanticType.DYNAMIC_ACTIVITY: 0.9,
-            SemanticType.RELAXATION: 0.2,
-            SemanticType.DINING: 0.5,
-            SemanticType.SHOPPING: 0.6,
-            SemanticType.CULTURAL: 0.3,
-            SemanticType.NATURAL: 0.7
-        }
-        return type_map.get(self.semantic_type, 0.5)
+        return float(TYPE_NUMERIC[SEMANTIC_TYPE_ID[self.semantic_type]])
+
+
+@dataclass(slots=True)
+class SemanticSoA:
+    """
+    POI语义的列式存储（Structure of Arrays）
+    
+    每列按POI下标对齐，index把POI ID映射到下标
+    """
+    index: Dict[str, int]
+    type_id: np.ndarray          # 语义类型ID，int8
+    intensity: np.ndarray        # 强度等级1-5，int8
+    duration: np.ndarray         # 持续时间（小时），float32
+    flags: np.ndarray            # 标志位（室内/静态），uint8
+    cultural_depth: np.ndarray   # float32
+    physical_demand: np.ndarray  # float32
+    embeddings: np.ndarray       # (n, 8)语义嵌入，float32
+    unit_embeddings_q: np.ndarray  # 按行L2归一化后量化的嵌入（余弦≈内积·_EMB_Q_SCALE），int8
+    
+    @classmethod
+    def from_pois(cls, pois: List[Location]) -> 'SemanticSoA':
+        """从POI列表一次性构建全部语义列"""
+        n = len(pois)
+        poi_type_ids = np.fromiter((poi.type_id for poi in pois), dtype=np.int16, count=n)
+        type_id = _SEMANTIC_ID_BY_POI_TYPE_ID[poi_type_ids]
+        intensity = _INTENSITY_BY_TYPE[type_id]
+        duration = np.fromiter(
+            (getattr(poi, 'average_visit_time', _DEFAULT_DURATION) or _DEFAULT_DURATION
+             for poi in pois),
+            dtype=np.float32, count=n
+        )
+        flags = _FLAGS_BY_TYPE[type_id]
+        cultural_depth = _CULTURAL_BY_TYPE[type_id]
+        physical_demand = intensity.astype(np.float32) / 5.0
+        
+        embeddings = BASE_EMBEDDINGS[type_id]
+        embeddings[:, _EMB_DURATION] = duration / 4.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        unit_embeddings = embeddings / np.maximum(norms, np.float32(1e-6))
+        unit_embeddings_q = np.round(unit_embeddings * _EMB_Q_LEVELS).astype(np.int8)
+        
+        return cls(
+            index={poi.id: i for i, poi in enumerate(pois)},
+            type_id=type_id,
+            intensity=intensity,
+            duration=duration,
+            flags=flags,
+            cultural_depth=cultural_depth,
+            physical_demand=physical_demand,
+            embeddings=embeddings,
+            unit_embeddings_q=unit_embeddings_q
+        )
+    
+    def take(self, rows: np.ndarray) -> 'SemanticSoA':
+        """按下标取子集（index不随之重建）"""
+        return SemanticSoA(
+            index={},
+            type_id=self.type_id[rows],
+            intensity=self.intensity[rows],
+            duration=self.duration[rows],
+            flags=self.flags[rows],
+            cultural_depth=self.cultural_depth[rows],
+            physical_demand=self.physical_demand[rows],
+            embeddings=self.embeddings[rows],
+            unit_embeddings_q=self.unit_embeddings_q[rows]
+        )
+    
+    def head(self, n: int) -> 'SemanticSoA':
+        """前n行的视图（index共享，写入视图即写入本列）"""
+        return SemanticSoA(
+            index=self.index,
+            type_id=self.type_id[:n],
+            intensity=self.intensity[:n],
+            duration=self.duration[:n],
+            flags=self.flags[:n],
+            cultural_depth=self.cultural_depth[:n],
+            physical_demand=self.physical_demand[:n],
+            embeddings=self.embeddings[:n],
+            unit_embeddings_q=self.unit_embeddings_q[:n]
+        )
+    
+    def grow(self, capacity: int) -> 'SemanticSoA':
+        """扩容到capacity行的新列缓冲，复制已登记的行（index共享）"""
+        n = len(self.index)
+        
+        def extend(column: np.ndarray) -> np.ndarray:
+            buffer = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            buffer[:n] = column[:n]
+            return buffer
+        
+        return SemanticSoA(
+            index=self.index,
+            type_id=extend(self.type_id),
+            intensity=extend(self.intensity),
+            duration=extend(self.duration),
+            flags=extend(self.flags),
+            cultural_depth=extend(self.cultural_depth),
+            physical_demand=extend(self.physical_demand),
+            embeddings=extend(self.embeddings),
+            unit_embeddings_q=extend(self.unit_embeddings_q)
+        )
+    
+    def assign(self, row: int, other: 'SemanticSoA'):
+        """用other的各行原地覆盖从row开始的行（index不变）"""
+        end = row + len(other.type_id)
+        self.type_id[row:end] = other.type_id
+        self.intensity[row:end] = other.intensity
+        self.duration[row:end] = other.duration
+        self.flags[row:end] = other.flags
+        self.cultural_depth[row:end] = other.cultural_depth
+        self.physical_demand[row:end] = other.physical_demand
+        self.embeddings[row:end] = other.embeddings
+        self.unit_embeddings_q[row:end] = other.unit_embeddings_q
+
+
+def _semantic_signature(poi: Location) -> Tuple:
+    """决定语义列与解释文本的POI属性"""
+    return (poi.type_id, poi.average_visit_time, poi.name)
 
 
 class SemanticFlowAnalyzer:
@@ -118,12 +432,35 @@ class SemanticFlowAnalyzer:
     - 用户状态适配性
     """
     
+    # 强度转移矩阵（所有实例共享的只读常量）
+    intensity_transition_matrix = _INTENSITY_TRANSITION
+    
     def __init__(self):
         # 语义相似度矩阵（基于POI类型）
         self.semantic_similarity_matrix = self._init_similarity_matrix()
         
-        # 强度转移矩阵（前后强度组合的合理性）
-        self.intensity_transition_matrix = self._init_intensity_matrix()
+        # POI语义列式缓存（precompute_poi_semantics整体填充，评分时遇到新POI按需追加）
+        # 按需追加写入容量倍增的列缓冲，poi_semantics是其中已登记行的视图
+        self._semantic_buffer = SemanticSoA.from_pois([])
+        self._semantic_rows = 0  # 列缓冲中已写入的行数
+        self.poi_semantics = self._semantic_buffer
+        self._poi_catalog: Dict[str, Location] = {}
+        
+        # 目录内POI对的得分缓存，键为(当前POI ID, 下一POI ID, 状态分桶)
+        self._cached_semantic = lru_cache(maxsize=8192)(self._semantic_by_id)
+    
+    def precompute_poi_semantics(self, pois: List[Location]) -> SemanticSoA:
+        """
+        预计算POI目录的语义列
+        
+        之后的评分按POI ID直接取下标，不再逐个构造语义向量；
+        目录变化后旧的得分缓存一并失效
+        """
+        self.poi_semantics = self._semantic_buffer = SemanticSoA.from_pois(pois)
+        self._semantic_rows = len(pois)
+        self._poi_catalog = {poi.id: poi for poi in pois}
+        self._cached_semantic.cache_clear()
+        return self.poi_semantics
     
     def compute_semantic_score(self,
                               current_poi: Location,
@@ -143,30 +480,36 @@ class SemanticFlowAnalyzer:
         - -0.5~0: 轻微冲突
         - -1.0: 严重冲突
         """
-        # 提取语义向量
-        current_semantic = self._extract_semantic(current_poi)
-        next_semantic = self._extract_semantic(next_poi)
-        
-        # 1. 内容语义连贯性（40%权重）
-        content_score = self._compute_content_coherence(
-            current_semantic, next_semantic
+        # 登记到目录后按POI对走缓存（状态按规则阈值分桶）
+        self._register_pois((current_poi, next_poi))
+        return self._cached_semantic(
+            current_poi.id, next_poi.id, _bucket_state(user_state)
         )
-        
-        # 2. 强度语义互补性（30%权重）
-        intensity_score = self._compute_intensity_complementarity(
-            current_semantic, next_semantic, user_state
+    
+    def _semantic_by_id(self, cur_id: str, next_id: str, state_bucket: int) -> Tuple[float, str]:
+        """按POI ID与状态分桶计算语义流得分（供LRU缓存包装）"""
+        return self._score_pair(
+            self._poi_catalog[cur_id], self._poi_catalog[next_id],
+            _unbucket_state(state_bucket)
         )
+    
+    def _score_pair(self,
+                    current_poi: Location,
+                    next_poi: Location,
+                    user_state: UserStateVector) -> Tuple[float, str]:
+        """
+        计算单个POI对的语义流得分与解释
         
-        # 3. 用户状态适配性（30%权重）
-        state_score = self._compute_state_fitness(
-            next_semantic, user_state
+        两个POI须已登记到语义目录（经compute_semantic_score进入时已登记）
+        """
+        # 单个POI对按目录行逐项标量计算，避免N=1时的数组开销
+        index = self.poi_semantics.index
+        content_score, intensity_score, state_score = self._pair_components(
+            index[current_poi.id], index[next_poi.id], user_state
         )
-        
-        # 加权综合
         S_sem = (
-            0.4 * content_score +
-            0.3 * intensity_score +
-            0.3 * state_score
+            _W_CONTENT * content_score + _W_INTENSITY * intensity_score
+            + _W_STATE * state_score
         )
         
         # 生成解释
@@ -177,28 +520,157 @@ class SemanticFlowAnalyzer:
         
         return S_sem, explanation
     
-    def _extract_semantic(self, poi: Location) -> SemanticVector:
-        """从POI提取语义向量"""
-        # 根据POI类型映射语义类型
-        type_mapping = {
-            POIType.ATTRACTION: SemanticType.STATIC_VIEWING,
-            POIType.RESTAURANT: SemanticType.DINING,
-            POIType.SHOPPING: SemanticType.SHOPPING,
-            POIType.HOTEL: SemanticType.RELAXATION,
-            POIType.ENTERTAINMENT: SemanticType.DYNAMIC_ACTIVITY
-        }
+    def _pair_components(self,
+                         cur: int,
+                         nxt: int,
+                         user_state: UserStateVector) -> Tuple[float, float, float]:
+        """
+        单个POI对的三项语义分量（规则与_semantic_components逐项一致）
         
-        semantic_type = type_mapping.get(poi.type, SemanticType.CULTURAL)
+        Args:
+            cur, nxt: 当前POI与下一POI在语义目录中的行下标
+        """
+        soa = self.poi_semantics
+        next_type = int(soa.type_id[nxt])
+        cur_flags, next_flags = int(soa.flags[cur]), int(soa.flags[nxt])
+        cur_intensity, next_intensity = int(soa.intensity[cur]), int(soa.intensity[nxt])
+        
+        # 1. 内容语义连贯性（int8量化嵌入内积还原余弦）
+        cosine = int(np.dot(
+            soa.unit_embeddings_q[cur], soa.unit_embeddings_q[nxt].astype(np.int32)
+        )) * _EMB_Q_SCALE
+        content = (
+            _SIM_TABLE_BLEND * float(self.semantic_similarity_matrix[soa.type_id[cur], next_type])
+            + _COSINE_BLEND * cosine
+        )
+        if cur_flags & next_flags & _FLAG_STATIC and soa.duration[cur] + soa.duration[nxt] > 3:
+            content -= 0.4
+        if (cur_flags ^ next_flags) & _FLAG_INDOOR:
+            content += 0.2
+        content = min(max(content, -1.0), 1.0)
+        
+        # 2. 强度语义互补性
+        energy_row = bisect_left(_ENERGY_BANDS, user_state.physical_energy)
+        intensity = float(INTENSITY_LUT[energy_row, next_intensity - 1])
+        if cur_intensity >= 4 and next_intensity >= 4:
+            intensity -= _CONSECUTIVE_INTENSE_PENALTY
+        
+        # 3. 用户状态适配性
+        state = (1.0 - abs(next_intensity / 5.0 - user_state.physical_energy)) * 0.4
+        if user_state.mental_energy < 0.4 and next_flags & _FLAG_STATIC:
+            state -= 0.3
+        if next_type == SEMANTIC_TYPE_ID[SemanticType.DINING]:
+            if user_state.satiety < 0.3:
+                state += 0.8
+            elif user_state.satiety > 0.7:
+                state -= 0.5
+        if user_state.mood < 0.4 and next_type in (
+            SEMANTIC_TYPE_ID[SemanticType.RELAXATION],
+            SEMANTIC_TYPE_ID[SemanticType.NATURAL]
+        ):
+            state += 0.5
+        state = min(max(state, -1.0), 1.0)
+        
+        return content, intensity, state
+    
+    def batch_compute_semantic_score(self,
+                                     current_poi: Location,
+                                     next_pois: List[Location],
+                                     user_state: UserStateVector,
+                                     history: List[Location]) -> np.ndarray:
+        """
+        批量计算语义流得分（同一当前POI，N个候选）
         
-        # 推断强度等级
-        if semantic_type == SemanticType.STATIC_VIEWING:
-            intensity = IntensityLevel.LIGHT
-        elif semantic_type == SemanticType.DYNAMIC_ACTIVITY:
-            intensity = IntensityLevel.INTENSE
-        elif semantic_type == SemanticType.RELAXATION:
-            intensity = IntensityLevel.REST
-        else:
-            intensity = IntensityLevel.MODERATE
+        Returns:
+            S_sem数组，shape=(N,)，dtype=float32
+        """
+        if not next_pois:
+            return np.zeros(0, dtype=np.float32)
+        
+        # 与逐个评分使用同一分桶代表状态，两条路径结果一致
+        user_state = _unbucket_state(_bucket_state(user_state))
+        components = self._semantic_components(current_poi, next_pois, user_state)
+        return (components @ _SEMANTIC_WEIGHTS).astype(np.float32)
+    
+    def _semantic_components(self,
+                             current_poi: Location,
+                             next_pois: List[Location],
+                             user_state: UserStateVector) -> np.ndarray:
+        """
+        计算三项语义分量
+        
+        Returns:
+            (N, 3)矩阵，列依次为 内容连贯性、强度互补性、状态适配性
+            （分量保持float64，保证解释文本的阈值判断与逐个计算一致）
+        """
+        # 查取语义列（当前POI为单行，与候选广播）
+        current = self._lookup_semantics([current_poi])
+        nexts = self._lookup_semantics(next_pois)
+        
+        # 1. 内容语义连贯性（40%权重）
+        content = self._compute_content_coherence(current, nexts)
+        
+        # 2. 强度语义互补性（30%权重）
+        intensity = self._compute_intensity_complementarity(current, nexts, user_state)
+        
+        # 3. 用户状态适配性（30%权重）
+        state = self._compute_state_fitness(nexts, user_state)
+        
+        return np.stack([content, intensity, state], axis=1)
+    
+    def _lookup_semantics(self, pois: List[Location]) -> SemanticSoA:
+        """取POI的语义列（未登记的POI先追加到目录），按下标取子集"""
+        self._register_pois(pois)
+        index = self.poi_semantics.index
+        return self.poi_semantics.take(
+            np.fromiter((index[poi.id] for poi in pois), dtype=np.intp, count=len(pois))
+        )
+    
+    def _register_pois(self, pois: Sequence[Location]):
+        """
+        把POI登记到语义目录
+        
+        新POI的语义列写入列缓冲末尾（容量不足时倍增，均摊O(1)）；
+        同ID的POI属性变化时覆盖该行，旧的得分缓存一并失效；
+        目录超过上限时以本批POI重建
+        """
+        catalog = self._poi_catalog
+        fresh: Dict[str, Location] = {}
+        for poi in pois:
+            known = catalog.get(poi.id)
+            if known is poi:
+                continue
+            if known is None:
+                fresh.setdefault(poi.id, poi)
+            elif _semantic_signature(known) != _semantic_signature(poi):
+                self.poi_semantics.assign(
+                    self.poi_semantics.index[poi.id], SemanticSoA.from_pois([poi])
+                )
+                catalog[poi.id] = poi
+                self._cached_semantic.cache_clear()
+        if not fresh:
+            return
+        
+        if self._semantic_rows + len(fresh) > _CATALOG_MAX_SIZE:
+            self.precompute_poi_semantics(list({poi.id: poi for poi in pois}.values()))
+            return
+        buffer = self._semantic_buffer
+        start = self._semantic_rows
+        end = self._semantic_rows = start + len(fresh)
+        if end > len(buffer.type_id):
+            buffer = self._semantic_buffer = buffer.grow(
+                min(max(end, 2 * len(buffer.type_id), 64), _CATALOG_MAX_SIZE)
+            )
+        buffer.assign(start, SemanticSoA.from_pois(list(fresh.values())))
+        buffer.index.update((poi_id, row) for row, poi_id in enumerate(fresh, start))
+        catalog.update(fresh)
+        self.poi_semantics = buffer.head(end)
+    
+    def _extract_semantic(self, poi: Location) -> SemanticVector:
+        """从POI提取语义向量"""
+        # 根据POI类型映射语义类型，再推断强度等级
+        semantic_type = _POI_TO_SEMANTIC.get(poi.type, SemanticType.CULTURAL)
+        intensity = _SEMANTIC_INTENSITY.get(semantic_type, IntensityLevel.MODERATE)
         
         return SemanticVector(
             semantic_type=semantic_type,
@@ -211,91 +683,72 @@ class SemanticFlowAnalyzer:
         )
     
     def _compute_content_coherence(self,
-                                   current: SemanticVector,
-                                   next: SemanticVector) -> float:
-        """计算内容连贯性"""
-        # 使用相似度矩阵
-        similarity = self.semantic_similarity_matrix.get(
-            (current.semantic_type, next.semantic_type),
-            0.0
+                                   current: SemanticSoA,
+                                   nexts: SemanticSoA) -> np.ndarray:
+        """计算内容连贯性（对N个候选向量化）"""
+        # 手工相似度矩阵只覆盖少数组合，用嵌入余弦相似度补全其余组合
+        # int8嵌入提升到int16相乘（127²不溢出），求和时自动累加到int64
+        cosine = (
+            nexts.unit_embeddings_q.astype(np.int16)
+            * current.unit_embeddings_q[0].astype(np.int16)
+        ).sum(axis=-1) * _EMB_Q_SCALE
+        similarity = (
+            _SIM_TABLE_BLEND * self.semantic_similarity_matrix[current.type_id, nexts.type_id]
+            + _COSINE_BLEND * cosine
         )
         
         # 检查冲突模式
-        # 1. 连续静态观赏（疲劳）
-        if current.is_static and next.is_static:
-            if current.duration + next.duration > 3:  # 连续超过3小时
-                similarity -= 0.4
+        # 1. 连续静态观赏（疲劳）：连续超过3小时
+        both_static = (current.flags & nexts.flags & _FLAG_STATIC) != 0
+        similarity = similarity - 0.4 * (
+            both_static & (current.duration + nexts.duration > 3)
+        )
         
         # 2. 室内/室外交替（体验丰富）
-        if current.is_indoor != next.is_indoor:
-            similarity += 0.2
+        indoor_switch = ((current.flags ^ nexts.flags) & _FLAG_INDOOR) != 0
+        similarity = similarity + 0.2 * indoor_switch
         
         return np.clip(similarity, -1.0, 1.0)
     
     def _compute_intensity_complementarity(self,
-                                          current: SemanticVector,
-                                          next: SemanticVector,
-                                          user_state: UserStateVector) -> float:
-        """计算强度互补性"""
-        current_intensity = current.intensity_level.value
-        next_intensity = next.intensity_level.value
-        
-        # 强度差
-        intensity_diff = abs(current_intensity - next_intensity)
-        
-        # 根据用户体力评估合理性
-        if user_state.physical_energy > 0.7:
-            # 体力充沛：接受高强度
-            if next_intensity >= 4:
-                return 0.8
-            else:
-                return 0.5
-        elif user_state.physical_energy > 0.4:
-            # 体力中等：适合中度
-            if 2 <= next_intensity <= 3:
-                return 0.9
-            elif next_intensity >= 4:
-                return -0.3  # 不适合高强度
-            else:
-                return 0.6
-        else:
-            # 体力低：需要休息
-            if next_intensity <= 2:
-                return 1.0  # 强烈推荐休息
-            else:
-                return -0.6  # 不适合继续高强度
-        
-        # 检查强度叠加疲劳
-        if current_intensity >= 4 and next_intensity >= 4:
-            return -0.7  # 连续高强度，严重冲突
-        
-        return 0.0
+                                          current: SemanticSoA,
+                                          nexts: SemanticSoA,
+                                          user_state: UserStateVector) -> np.ndarray:
+        """计算强度互补性（对N个候选向量化）"""
+        # 根据用户体力档位查表
+        energy_row = np.searchsorted(_ENERGY_BANDS, user_state.physical_energy)
+        score = INTENSITY_LUT[energy_row, nexts.intensity - 1]
+        
+        # 检查强度叠加疲劳：连续高强度
+        consecutive_intense = (current.intensity >= 4) & (nexts.intensity >= 4)
+        return score - _CONSECUTIVE_INTENSE_PENALTY * consecutive_intense
     
     def _compute_state_fitness(self,
-                              next: SemanticVector,
-                              user_state: UserStateVector) -> float:
-        """计算用户状态适配性"""
-        score = 0.0
-        
-        # 1. 体力适配
-        physical_fitness = 1.0 - abs(next.physical_demand - user_state.physical_energy)
-        score += physical_fitness * 0.4
-        
-        # 2. 精力适配
-        if next.is_static and user_state.mental_energy < 0.4:
-            score -= 0.3  # 精力不足时不适合静态观赏
+                              nexts: SemanticSoA,
+                              user_state: UserStateVector) -> np.ndarray:
+        """计算用户状态适配性（对N个候选向量化）"""
+        # 1. 体力适配（由强度等级计算体力需求，保持float64精度）
+        physical_demand = nexts.intensity / 5.0
+        physical_fitness = 1.0 - np.abs(physical_demand - user_state.physical_energy)
+        score = physical_fitness * 0.4
+        
+        # 2. 精力适配：精力不足时不适合静态观赏
+        if user_state.mental_energy < 0.4:
+            score -= 0.3 * ((nexts.flags & _FLAG_STATIC) != 0)
         
         # 3. 饱腹感适配
-        if next.semantic_type == SemanticType.DINING:
-            if user_state.satiety < 0.3:
-                score += 0.8  # 饿了，推荐餐饮
-            elif user_state.satiety > 0.7:
-                score -= 0.5  # 太饱，不推荐
+        is_dining = nexts.type_id == SEMANTIC_TYPE_ID[SemanticType.DINING]
+        if user_state.satiety < 0.3:
+            score += 0.8 * is_dining  # 饿了，推荐餐饮
+        elif user_state.satiety > 0.7:
+            score -= 0.5 * is_dining  # 太饱，不推荐
         
-        # 4. 心情适配
+        # 4. 心情适配：心情不好，推荐放松
         if user_state.mood < 0.4:
-            if next.semantic_type in [SemanticType.RELAXATION, SemanticType.NATURAL]:
-                score += 0.5  # 心情不好，推荐放松
+            score += 0.5 * np.isin(nexts.type_id, (
+                SEMANTIC_TYPE_ID[SemanticType.RELAXATION],
+                SEMANTIC_TYPE_ID[SemanticType.NATURAL]
+            ))
         
         return np.clip(score, -1.0, 1.0)
     
@@ -325,10 +778,16 @@ class SemanticFlowAnalyzer:
         
         return "；".join(explanations) if explanations else "体验中性"
     
-    def _init_similarity_matrix(self) -> Dict[Tuple[SemanticType, SemanticType], float]:
-        """初始化语义相似度矩阵"""
+    def _init_similarity_matrix(self) -> np.ndarray:
+        """
+        初始化语义相似度矩阵
+        
+        (7, 7)稠密表，按[当前类型ID, 下一类型ID]索引，未定义组合为0
+        """
+        matrix = np.zeros((len(SemanticType), len(SemanticType)), dtype=np.float32)
+        
         # 简化版：只定义关键组合
-        return {
+        pairs = {
             # 文化类连贯
             (SemanticType.CULTURAL, SemanticType.STATIC_VIEWING): 0.8,
             (SemanticType.STATIC_VIEWING, SemanticType.CULTURAL): 0.8,
@@ -343,19 +802,103 @@ class SemanticFlowAnalyzer:
             (SemanticType.STATIC_VIEWING, SemanticType.STATIC_VIEWING): -0.2,  # 连续静态
             (SemanticType.DYNAMIC_ACTIVITY, SemanticType.DYNAMIC_ACTIVITY): -0.4,  # 连续高强度
         }
+        for (cur, nxt), value in pairs.items():
+            matrix[SEMANTIC_TYPE_ID[cur], SEMANTIC_TYPE_ID[nxt]] = value
+        
+        return matrix
+
+
+@njit(parallel=True, cache=True)
+def _tensions_kernel(cur_type_ids, next_type_ids, visit_counts, time_hours,
+                     famous_mask, is_restaurant):
+    """
+    批量张力内核（Numba并行，四项张力单遍融合计算，无中间数组）
     
-    def _init_intensity_matrix(self) -> np.ndarray:
-        """初始化强度转移矩阵"""
-        # 5x5矩阵（5个强度等级）
-        # 行=当前强度，列=下一强度，值=合理性得分
-        return np.array([
-            # REST  LIGHT  MOD   INTENSE EXTREME
-            [0.5,  0.9,   0.8,  0.6,    0.3],   # 从REST
-            [0.7,  0.7,   0.9,  0.7,    0.4],   # 从LIGHT
-            [0.8,  0.8,   0.7,  0.6,    0.3],   # 从MODERATE
-            [0.9,  0.8,   0.6,  0.3,    0.1],   # 从INTENSE
-            [1.0,  0.9,   0.7,  0.2,   -0.3]    # 从EXTREME
-        ])
+    规则与_tensions_numpy一致
+    """
+    n = visit_counts.shape[0]
+    novelty = np.empty(n)
+    continuity = np.empty(n)
+    energy = np.empty(n)
+    conflict = np.empty(n)
+    for i in prange(n):
+        # 1. 新鲜感张力
+        vc = visit_counts[i]
+        if vc == 0:
+            nov = 0.8
+        elif vc == 1:
+            nov = -0.3
+        else:
+            nov = -0.6
+        
+        # 2. 连续性张力
+        con = -0.4 if cur_type_ids[i] == next_type_ids[i] else 0.3
+        if famous_mask[i]:
+            con += 0.2
+        
+        # 3. 体力张力
+        t = time_hours[i]
+        if t < 12:
+            eng = 0.6
+        elif t < 16:
+            eng = 0.2
+        elif t < 18:
+            eng = -0.2
+        else:
+            eng = -0.5
+        if is_restaurant[i] and ((11 <= t <= 13) or (17 <= t <= 19)):
+            eng += 0.4
+        
+        # 4. 冲突度
+        pos = (nov > 0) + (con > 0) + (eng > 0)
+        neg = (nov < 0) + (con < 0) + (eng < 0)
+        
+        novelty[i] = nov
+        continuity[i] = con
+        energy[i] = eng
+        conflict[i] = min(pos, neg) / 3.0 if pos > 0 and neg > 0 else 0.0
+    return novelty, continuity, energy, conflict
+
+
+def _tensions_numpy(cur_type_ids, next_type_ids, visit_counts, time_hours,
+                    famous_mask, is_restaurant):
+    """批量张力（NumPy降级实现）"""
+    # 1. 新鲜感张力：新区域强烈吸引，回访轻度排斥，多次回访强烈排斥
+    novelty = np.select(
+        [visit_counts == 0, visit_counts == 1], [0.8, -0.3], default=-0.6
+    )
+    
+    # 2. 连续性张力：类型重复体验单调，类型切换体验丰富；知名景点逻辑连贯
+    continuity = np.where(cur_type_ids == next_type_ids, -0.4, 0.3) + 0.2 * famous_mask
+    
+    # 3. 体力张力：时间越晚，体力越低；饭点吃饭恢复体力
+    energy = np.select(
+        [time_hours < 12, time_hours < 16, time_hours < 18], [0.6, 0.2, -0.2], default=-0.5
+    )
+    meal_time = (((time_hours >= 11) & (time_hours <= 13))
+                 | ((time_hours >= 17) & (time_hours <= 19)))
+    energy = energy + 0.4 * (is_restaurant & meal_time)
+    
+    # 4. 🔥 冲突度：多个张力方向不一致时，冲突度高
+    stacked = np.stack([novelty, continuity, energy], axis=1)
+    positive_count = (stacked > 0).sum(axis=1)
+    negative_count = (stacked < 0).sum(axis=1)
+    conflict = np.where(
+        (positive_count > 0) & (negative_count > 0),
+        np.minimum(positive_count, negative_count) / stacked.shape[1],
+        0.0
+    )
+    return novelty, continuity, energy, conflict
+
+
+if NUMBA_AVAILABLE:
+    _tensions_batch = _tensions_kernel
+    # 导入时预热一次，避免首个规划请求承担JIT编译开销
+    _tensions_batch(np.zeros(1, dtype=np.int8), np.zeros(1, dtype=np.int8),
+                    np.zeros(1, dtype=np.int16), np.zeros(1, dtype=np.float32),
+                    np.zeros(1, dtype=bool), np.zeros(1, dtype=bool))
+else:
+    _tensions_batch = _tensions_numpy
 
 
 class CausalFlowAnalyzer:
@@ -379,8 +922,26 @@ class CausalFlowAnalyzer:
         self.llm_client = llm_client  # 🔥 新增：LLM客户端
         self.enable_concurrent = enable_concurrent  # 🔥 新增：并发开关
         
+        # 大模型推理接口在初始化时解析一次，热路径不再逐次hasattr
+        self._si_reason = getattr(spatial_intelligence, 'reason_causality', None)
+        self._si_similarity = (
+            getattr(spatial_intelligence, 'compute_poi_similarity', None)
+            if hasattr(spatial_intelligence, 'poi_graph') else None
+        )
+        
         # 因果规则库
         self.causal_rules = self._init_causal_rules()
+        
+        # POI元信息缓存：POI ID → (区域ID, 是否知名地标)
+        self._poi_meta: Dict[str, Tuple[int, bool]] = {}
+        
+        # prompt → LLM得分，跨批次复用（只缓存本实例客户端的结果）
+        self._prompt_scores = LRUCache(maxsize=_PROMPT_CACHE_SIZE)
+    
+    def clear_caches(self):
+        """清空POI元信息与LLM得分缓存"""
+        self._poi_meta.clear()
+        self._prompt_scores.clear()
     
     def compute_causal_score(self,
                             current_poi: Location,
@@ -475,24 +1036,14 @@ class CausalFlowAnalyzer:
         利用SpatialIntelligenceCore的推理能力
         """
         try:
-            # 构造推理问题
-            question = f"从{current_poi.name}到{next_poi.name}，考虑{context}，因果关联度如何？"
-            
             # 调用大模型推理
             # 注：SpatialIntelligenceCore可能需要扩展因果推理接口
-            if hasattr(self.spatial_intelligence, 'reason_causality'):
-                score = self.spatial_intelligence.reason_causality(
-                    current_poi, next_poi, context
-                )
-                return float(score)
-            else:
-                # 降级：使用POI相似度
-                if hasattr(self.spatial_intelligence, 'poi_graph'):
-                    similarity = self.spatial_intelligence.compute_poi_similarity(
-                        current_poi, next_poi
-                    )
-                    return float(similarity)
-        except:
+            if self._si_reason:
+                return float(self._si_reason(current_poi, next_poi, context))
+            # 降级：使用POI相似度
+            if self._si_similarity:
+                return float(self._si_similarity(current_poi, next_poi))
+        except (AttributeError, TypeError, ValueError):
             pass
         
         return 0.6  # 默认中等关联
@@ -502,12 +1053,9 @@ class CausalFlowAnalyzer:
         if not causal_chain:
             return 0.5
         
-        scores = []
-        for link in causal_chain:
-            rule_score = self.causal_rules.get(link['type'], 0.5)
-            scores.append(rule_score)
-        
-        return np.mean(scores)
+        # 因果链最多3环，原生sum比np.mean的数组构造开销小得多
+        scores = [self.causal_rules.get(link['type'], 0.5) for link in causal_chain]
+        return sum(scores) / len(scores)
     
     def _explain_event_causal(self, context: Dict, current: Location, next: Location) -> str:
         """解释事件因果"""
@@ -584,50 +1132,36 @@ class CausalFlowAnalyzer:
         else:
             return self._batch_rule_reason_with_tensions(tasks)
     
-    def _batch_llm_reason(self, tasks: List[Dict]) -> List[float]:
+    def _batch_llm_reason(self, tasks: List[Dict],
+                          cols: Optional[Dict[str, np.ndarray]] = None) -> List[float]:
         """使用LLM客户端批量推理"""
-        # 构建prompts
-        prompts = []
-        for task in tasks:
-            current = task['current']
-            next_poi = task['next']
-            context = task.get('context', {})
-            
-            # 提取关键信息
-            weather = context.get('weather', 'sunny')
-            time_hour = context.get('time_of_day', 10)
-            visited_regions = context.get('visited_regions', {})
-            
-            # 计算区域访问次数
-            region = self._get_region(next_poi)
-            visit_count = visited_regions.get(region, 0)
-            
-            # 构建prompt
-            prompt = f"""评估旅行决策合理性（0-1分）：
-
-当前：{current.name}
-候选：{next_poi.name}（{region}区域）
-时间：{time_hour}点 | 天气：{weather}
-该区域已访问：{visit_count}次
-
-评估要点：
-1. 区域重复：首次+0.3，第2次-0.25，第3次-0.4
-2. 时间合理：中午餐厅+0.4，其他时段餐厅-0.2
-3. 天气适配：雨天室内+0.2，雨天户外-0.3
-4. 景点知名度：知名景点+0.15
-5. 类型连续：重复类型-0.15
-
-只返回一个0-1之间的数字（如0.85），不要解释。"""
-            
-            prompts.append(prompt)
-        
-        # 并发调用LLM
-        results = self.llm_client.batch_reason(
-            prompts, 
-            temperature=0.5, 
-            max_tokens=10,
-            max_workers=10 if self.enable_concurrent else 1
-        )
+        if cols is None:
+            cols = self._vectorize_tasks(tasks)
+        
+        # 构建prompts（区域与访问次数直接取自向量化结果）
+        prompts = [_PROMPT_TMPL.format_map(row) for row in self._prompt_rows(tasks, cols)]
+        
+        # 去重：重复的(当前, 候选, 上下文)组合只调用一次LLM
+        unique_prompts, inverse = np.unique(prompts, return_inverse=True)
+        unique_prompts = unique_prompts.tolist()
+        
+        # 先查跨批次缓存，只把未命中的prompt发给LLM
+        scores = {prompt: self._prompt_scores.get(prompt) for prompt in unique_prompts}
+        missing = [prompt for prompt, score in scores.items() if score is None]
+        if missing:
+            # 并发调用LLM
+            fetched = self.llm_client.batch_reason(
+                missing,
+                temperature=0.5,
+                max_tokens=10,
+                max_workers=min(10, len(missing)) if self.enable_concurrent else 1
+            )
+            for prompt, score in zip(missing, fetched):
+                scores[prompt] = score
+                if score is not None:
+                    self._prompt_scores.put(prompt, float(score))
+        
+        results = [scores[unique_prompts[i]] for i in inverse.ravel()]
         
         # 处理结果（None → 规则推理）
         final_results = []
@@ -640,21 +1174,37 @@ class CausalFlowAnalyzer:
         
         return final_results
     
+    def _prompt_rows(self, tasks: List[Dict], cols: Dict[str, np.ndarray]) -> List[Dict]:
+        """逐任务的prompt填充字段"""
+        return [
+            {
+                'current': task['current'].name,
+                'candidate': task['next'].name,
+                'region': _REGION_NAMES[region_id],
+                'hour': hour,
+                'weather': task.get('context', {}).get('weather', 'sunny'),
+                'visit_count': visit_count,
+            }
+            for task, region_id, hour, visit_count in zip(
+                tasks, cols['region_ids'].tolist(), cols['time_hours'].tolist(),
+                cols['visit_counts'].tolist()
+            )
+        ]
+    
     def _batch_spatial_reason(self, tasks: List[Dict]) -> List[float]:
         """使用旧版spatial_intelligence批量推理（兼容）"""
-        results = []
-        for task in tasks:
-            try:
-                if hasattr(self.spatial_intelligence, 'reason_causality'):
-                    score = self.spatial_intelligence.reason_causality(
-                        task['current'], task['next'], task.get('context', {})
-                    )
-                    results.append(float(score))
-                else:
-                    results.append(0.6)  # 默认
-            except:
-                results.append(0.6)
-        return results
+        return [self._spatial_causal_score(task) for task in tasks]
+    
+    def _spatial_causal_score(self, task: Dict) -> float:
+        """旧版spatial_intelligence单任务推理，接口缺失或失败时取默认0.6"""
+        if not self._si_reason:
+            return 0.6  # 默认
+        try:
+            return float(self._si_reason(
+                task['current'], task['next'], task.get('context', {})
+            ))
+        except (AttributeError, TypeError, ValueError):
+            return 0.6
     
     def _batch_rule_reason(self, tasks: List[Dict]) -> List[float]:
         """纯规则批量推理（降级，向后兼容）"""
@@ -664,17 +1214,13 @@ class CausalFlowAnalyzer:
         """
         纯规则批量推理（返回张力）🔥
         """
-        results = []
-        for task in tasks:
-            tensions = self._compute_tensions(task)
-            c_causal = self._rule_causal_score_simple(task)
-            
-            results.append({
-                'c_causal': c_causal,
-                'tensions': tensions
-            })
+        tensions = self._compute_tensions_batch(tasks)
+        c_causals = self._rule_causal_scores(tensions)
         
-        return results
+        return [
+            {'c_causal': c_causal, 'tensions': row}
+            for c_causal, row in zip(c_causals.tolist(), self._split_tensions(tensions))
+        ]
     
     def _batch_llm_reason_with_tensions(self, tasks: List[Dict]) -> List[Dict]:
         """
@@ -682,18 +1228,17 @@ class CausalFlowAnalyzer:
         
         先用规则计算张力，再用LLM微调c_causal
         """
-        results = []
+        # 任务只向量化一次，张力与prompt共用
+        cols = self._vectorize_tasks(tasks)
         
         # 先用规则计算张力
-        for task in tasks:
-            tensions = self._compute_tensions(task)
-            results.append({
-                'c_causal': 0.5,  # 临时值
-                'tensions': tensions
-            })
+        results = [
+            {'c_causal': 0.5, 'tensions': row}  # c_causal为临时值
+            for row in self._split_tensions(self._compute_tensions_batch(tasks, cols))
+        ]
         
         # 然后用LLM批量计算c_causal（仍然并发）
-        c_causals = self._batch_llm_reason(tasks)
+        c_causals = self._batch_llm_reason(tasks, cols)
         
         # 合并结果
         for i, c_causal in enumerate(c_causals):
@@ -710,21 +1255,9 @@ class CausalFlowAnalyzer:
         旧版spatial_intelligence推理（返回张力）🔥
         """
         results = []
-        for task in tasks:
-            tensions = self._compute_tensions(task)
-            
-            try:
-                if hasattr(self.spatial_intelligence, 'reason_causality'):
-                    c_causal = float(self.spatial_intelligence.reason_causality(
-                        task['current'], task['next'], task.get('context', {})
-                    ))
-                else:
-                    c_causal = 0.6
-            except:
-                c_causal = 0.6
-            
+        for task, tensions in zip(tasks, self._split_tensions(self._compute_tensions_batch(tasks))):
             results.append({
-                'c_causal': c_causal,
+                'c_causal': self._spatial_causal_score(task),
                 'tensions': tensions
             })
         
@@ -748,6 +1281,12 @@ class CausalFlowAnalyzer:
         
         return max(0.1, min(0.95, score))
     
+    def _rule_causal_scores(self, tensions: Dict[str, np.ndarray]) -> np.ndarray:
+        """由张力列批量计算简化规则分数（与_rule_causal_score_simple一致）"""
+        score = (0.5 + tensions['novelty'] * 0.3 + tensions['continuity'] * 0.2
+                 + tensions['energy'] * 0.1)
+        return np.clip(score, 0.1, 0.95)
+    
     def _compute_tensions(self, task: Dict) -> Dict[str, float]:
         """
         计算子张力（🔥 核心修复）
@@ -760,64 +1299,55 @@ class CausalFlowAnalyzer:
                 'conflict': 冲突度 [0, 1]，越高越矛盾
             }
         """
-        current = task['current']
-        next_poi = task['next']
-        context = task.get('context', {})
+        return self._split_tensions(self._compute_tensions_batch([task]))[0]
+    
+    def _split_tensions(self, tensions: Dict[str, np.ndarray]) -> List[Dict[str, float]]:
+        """把张力列拆成逐任务的字典"""
+        columns = [tensions[key].tolist() for key in _TENSION_KEYS]
+        return [dict(zip(_TENSION_KEYS, row)) for row in zip(*columns)]
+    
+    def _vectorize_tasks(self, tasks: List[Dict]) -> Dict[str, np.ndarray]:
+        """把任务列表展开为并行数组（每个任务一行）"""
+        n = len(tasks)
+        contexts = [task.get('context', {}) for task in tasks]
+        metas = [self._get_poi_meta(task['next']) for task in tasks]
         
-        # 1. 新鲜感张力（novelty tension）
-        visited_regions = context.get('visited_regions', {})
-        region = self._get_region(next_poi)
-        visit_count = visited_regions.get(region, 0)
+        return {
+            'current_type_ids': np.fromiter(
+                (task['current'].type_id for task in tasks), dtype=np.int8, count=n),
+            'next_type_ids': np.fromiter(
+                (task['next'].type_id for task in tasks), dtype=np.int8, count=n),
+            'region_ids': np.fromiter(
+                (region_id for region_id, _ in metas), dtype=np.int8, count=n),
+            'visit_counts': np.fromiter(
+                (ctx.get('visited_regions', {}).get(_REGION_NAMES[region_id], 0)
+                 for ctx, (region_id, _) in zip(contexts, metas)),
+                dtype=np.int16, count=n),
+            # 小时可能带小数（如10.5），用float32保存
+            'time_hours': np.fromiter(
+                (ctx.get('time_of_day', 10) for ctx in contexts), dtype=np.float32, count=n),
+            'name_famous_mask': np.fromiter(
+                (famous for _, famous in metas), dtype=bool, count=n),
+        }
+    
+    def _compute_tensions_batch(self, tasks: List[Dict],
+                                cols: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+        """
+        批量计算子张力
         
-        if visit_count == 0:
-            novelty = 0.8  # 新区域，强烈吸引
-        elif visit_count == 1:
-            novelty = -0.3  # 回访，轻度排斥
-        else:
-            novelty = -0.6  # 多次回访，强烈排斥
+        Args:
+            cols: 已有的_vectorize_tasks结果（可选，避免重复展开）
         
-        # 2. 连续性张力（continuity tension）
-        if current.type == next_poi.type:
-            continuity = -0.4  # 类型重复，体验单调
-        else:
-            continuity = 0.3  # 类型切换，体验丰富
-        
-        # 知名度影响连续性
-        famous = ["厦大", "鼓浪屿", "环岛路", "曾厝垵", "中山路",
-                  "拙政园", "虎丘", "平江路", "姑苏"]
-        if any(f in next_poi.name for f in famous):
-            continuity += 0.2  # 知名景点，逻辑连贯
-        
-        # 3. 体力张力（energy tension）
-        time_hour = context.get('time_of_day', 10)
-        
-        # 时间越晚，体力越低
-        if time_hour < 12:
-            energy = 0.6  # 早上精力充沛
-        elif time_hour < 16:
-            energy = 0.2  # 下午适中
-        elif time_hour < 18:
-            energy = -0.2  # 傍晚开始疲惫
-        else:
-            energy = -0.5  # 晚上很累
-        
-        # 餐厅补充体力
-        if next_poi.type.value == 'restaurant':
-            if 11 <= time_hour <= 13 or 17 <= time_hour <= 19:
-                energy += 0.4  # 饭点吃饭，恢复体力
-        
-        # 4. 🔥 冲突度（conflict）- 核心创新
-        # 当多个张力方向不一致时，冲突度高
-        tension_values = [novelty, continuity, energy]
-        positive_count = sum(1 for t in tension_values if t > 0)
-        negative_count = sum(1 for t in tension_values if t < 0)
-        
-        if positive_count > 0 and negative_count > 0:
-            # 有正有负，存在冲突
-            conflict = min(positive_count, negative_count) / len(tension_values)
-        else:
-            # 方向一致，无冲突
-            conflict = 0.0
+        Returns:
+            与_compute_tensions相同的四个键，每个值为长度N的数组
+        """
+        if cols is None:
+            cols = self._vectorize_tasks(tasks)
+        novelty, continuity, energy, conflict = _tensions_batch(
+            cols['current_type_ids'], cols['next_type_ids'], cols['visit_counts'],
+            cols['time_hours'], cols['name_famous_mask'],
+            cols['next_type_ids'] == _RESTAURANT_TYPE_ID
+        )
         
         return {
             'novelty': novelty,
@@ -828,10 +1358,21 @@ class CausalFlowAnalyzer:
     
     def _get_region(self, poi: Location) -> str:
         """获取POI所属区域"""
-        for k in ["鼓浪屿", "厦大", "曾厝垵", "中山路", "环岛路"]:
-            if k in poi.name or k in poi.address:
-                return k
-        return "其他"
+        return _REGION_NAMES[self._get_poi_meta(poi)[0]]
+    
+    def _get_poi_meta(self, poi: Location) -> Tuple[int, bool]:
+        """
+        获取POI的(区域ID, 是否知名地标)，首次见到时用预编译正则各扫描一次
+        
+        名称和地址同时命中多个区域时，按_REGIONS的顺序取优先者
+        """
+        meta = self._poi_meta.get(poi.id)
+        if meta is None:
+            matches = _REGION_RE.findall(poi.name + '\x00' + poi.address)
+            region_id = min(map(_REGION_ID.get, matches), default=_OTHER_REGION_ID)
+            famous = _FAMOUS_RE.search(poi.name) is not None
+            meta = self._poi_meta[poi.id] = (region_id, famous)
+        return meta
 
 
 class SemanticCausalFlow:
@@ -875,7 +1416,10 @@ class SemanticCausalFlow:
         self.epsilon = epsilon
         self.llm_client = llm_client  # 🔥 保存引用
         
-        print(f"✅ W轴初始化完成（δ={delta}, ε={epsilon}）")
+        # 因果推理调用大模型时与语义计算并行（线程池首次需要时创建，close()释放）
+        self._exec: Optional[ThreadPoolExecutor] = None
+        
+        logger.debug("W轴初始化完成（δ=%s, ε=%s）", delta, epsilon)
     
     def compute_w_axis_force(self,
                             current_poi: Location,
@@ -893,15 +1437,29 @@ class SemanticCausalFlow:
         数学模型：
         F_wc = δ·S_sem + ε·C_causal
         """
+        # 因果流需要调用大模型时先提交到线程池，与语义流计算重叠；
+        # 纯规则推理很快，直接在当前线程计算
+        causal_future = None
+        if self.causal_analyzer.spatial_intelligence:
+            if self._exec is None:
+                self._exec = ThreadPoolExecutor(max_workers=2)
+            causal_future = self._exec.submit(
+                self.causal_analyzer.compute_causal_score,
+                current_poi, next_poi, context, state
+            )
+        
         # 1. 计算语义流得分
         S_sem, semantic_explanation = self.semantic_analyzer.compute_semantic_score(
             current_poi, next_poi, user_state, history
         )
         
         # 2. 计算因果流得分
-        C_causal, causal_explanation = self.causal_analyzer.compute_causal_score(
-            current_poi, next_poi, context, state
-        )
+        if causal_future is not None:
+            C_causal, causal_explanation = causal_future.result()
+        else:
+            C_causal, causal_explanation = self.causal_analyzer.compute_causal_score(
+                current_poi, next_poi, context, state
+            )
         
         # 3. 计算关联场力
         F_wc = self.delta * S_sem + self.epsilon * C_causal
@@ -919,6 +1477,17 @@ class SemanticCausalFlow:
         
         return F_wc, details
     
+    def clear_caches(self):
+        """清空语义POI对得分缓存与因果推理缓存"""
+        self.semantic_analyzer._cached_semantic.cache_clear()
+        self.causal_analyzer.clear_caches()
+    
+    def close(self):
+        """释放因果推理线程池"""
+        if self._exec is not None:
+            self._exec.shutdown(wait=True)
+            self._exec = None
+    
     def upgrade_to_4d_potential(self,
                                 phi_3d: float,
                                 f_wc: float) -> float:
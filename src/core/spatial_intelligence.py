@@ -5,13 +5,243 @@
 用户是主人，AI是顾问
 """
 
-from typing import List, Dict, Set, Optional, Tuple
+from typing import List, Dict, Set, Optional, Tuple, Callable
 from dataclasses import dataclass, field
 import numpy as np
 from datetime import datetime
+from functools import lru_cache
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+import math
+from math import radians as _rad, sin as _sin, cos as _cos, sqrt as _sqrt, atan2 as _atan2
 
+from src.utils.jit import njit, prange, NUMBA_AVAILABLE
 from .models import Location, State, PlanningSession, POIType
 
+try:
+    from sklearn.cluster import DBSCAN
+    from sklearn.metrics.pairwise import haversine_distances
+    from sklearn.neighbors import BallTree
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+
+EARTH_RADIUS_KM = 6371.0  # 地球半径（km）
+TRANSPORT_COST_PER_KM = 3.0  # 交通费用（元/km，简化）
+RETURN_BUFFER = 0.5  # 回程缓冲（小时）
+CLUSTER_EPS_KM = 1.5  # 空间聚类邻域半径（km）
+CLUSTER_MIN_SAMPLES = 3
+_SESSION_CACHE_SIZE = 64  # 最多缓存的会话数
+_REACH_CHUNK_ROWS = 128  # 批量可达性每块的候选数
+_REACH_WORKERS = 4
+
+# 风险编码：内核输出整数，按下标还原为字符串
+_RISK_LEVELS = ('info', 'warning', 'critical')
+_RISK_TYPES = (None, 'return', 'budget', 'time')
+
+# 分段查表：bisect_right(阈值, x)得到档位下标，再取对应输出
+_USAGE_THRESHOLDS = (0.3, 0.7, 0.9)
+_USAGE_LABELS = (
+    {'level': 'low', 'description': '充裕', 'emoji': '😊'},
+    {'level': 'medium', 'description': '正常', 'emoji': '👍'},
+    {'level': 'high', 'description': '紧张', 'emoji': '⚠️'},
+    {'level': 'critical', 'description': '即将耗尽', 'emoji': '🚨'},
+)
+_TRAVEL_THRESHOLDS = (1.0,)
+_TRAVEL_MODES = ((5.0, 0.0), (20.0, 0.1))  # (速度km/h, 等待h)：步行 / 打车
+_BUDGET_RISK_THRESHOLDS = (50.0, 100.0)
+_TIME_RISK_THRESHOLDS = (0.5, 1.0)
+_BUCKET_RISK = ('critical', 'warning', None)  # 剩余量档位 → 风险等级
+_BUCKET_RISK_CODE = np.array([2, 1, 0], dtype=np.int8)
+
+
+def _haversine_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    两两球面距离矩阵（km）
+
+    安装了scikit-learn时用其haversine_distances，否则NumPy只算上三角再镜像
+
+    Args:
+        lats, lons: 角度制坐标，形状(N,)
+
+    Returns:
+        形状(N, N)的距离矩阵
+    """
+    lats = np.radians(lats, dtype=np.float64)
+    lons = np.radians(lons, dtype=np.float64)
+    if SKLEARN_AVAILABLE:
+        return haversine_distances(np.column_stack((lats, lons))) * EARTH_RADIUS_KM
+
+    # 距离对称：只算上三角，再镜像到下三角
+    n = len(lats)
+    rows, cols = np.triu_indices(n, k=1)
+    dlat = lats[cols] - lats[rows]
+    dlon = lons[cols] - lons[rows]
+    cos_lat = np.cos(lats)
+
+    a = np.sin(dlat / 2) ** 2 + cos_lat[rows] * cos_lat[cols] * np.sin(dlon / 2) ** 2
+    upper = 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    dist = np.zeros((n, n))
+    dist[rows, cols] = upper
+    dist[cols, rows] = upper
+    return dist
+
+
+def _haversine_from(lat0: float, lon0: float,
+                    lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """从一点到多点的球面距离（km），形状同lats"""
+    lat0, lon0 = np.radians(lat0), np.radians(lon0)
+    lats = np.radians(lats, dtype=np.float64)
+    dlat = lats - lat0
+    dlon = np.radians(lons, dtype=np.float64) - lon0
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat0) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def _spatial_labels(lats: np.ndarray, lons: np.ndarray,
+                    eps_km: float = CLUSTER_EPS_KM,
+                    min_samples: int = CLUSTER_MIN_SAMPLES) -> np.ndarray:
+    """
+    空间聚类标签（0..K-1）
+
+    安装了scikit-learn时用haversine度量的DBSCAN（噪声点各自成簇），
+    否则按eps_km见方的经纬网格分桶
+    """
+    if len(lats) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    if SKLEARN_AVAILABLE:
+        coords = np.radians(np.column_stack((lats, lons)))
+        labels = DBSCAN(
+            eps=eps_km / EARTH_RADIUS_KM, min_samples=min_samples,
+            metric='haversine', algorithm='ball_tree'
+        ).fit_predict(coords)
+        noise = labels < 0
+        labels[noise] = labels.max() + 1 + np.arange(noise.sum())
+        return labels
+    
+    cell_deg = np.degrees(eps_km / EARTH_RADIUS_KM)
+    lat_cells = np.floor(lats / cell_deg)
+    lon_cells = np.floor(lons * np.cos(np.radians(lats)) / cell_deg)
+    _, labels = np.unique(np.column_stack((lat_cells, lon_cells)),
+                          axis=0, return_inverse=True)
+    return labels.reshape(-1)
+
+
+def _travel_time_vec(distance_km: np.ndarray) -> np.ndarray:
+    """旅行时间（小时）：1km内步行5km/h，否则打车20km/h + 0.1h等待"""
+    return np.where(distance_km < 1.0, distance_km / 5, distance_km / 20 + 0.1)
+
+
+@njit(parallel=True, cache=True)
+def _haversine_kernel(lat0, lon0, lats, lons):
+    """从一点到多点的球面距离内核（Numba并行），与_haversine_from一致"""
+    n = lats.shape[0]
+    out = np.empty(n)
+    rlat0 = math.radians(lat0)
+    rlon0 = math.radians(lon0)
+    cos0 = math.cos(rlat0)
+    for i in prange(n):
+        rlat = math.radians(np.float64(lats[i]))
+        dlat = rlat - rlat0
+        dlon = math.radians(np.float64(lons[i])) - rlon0
+        a = math.sin(dlat / 2) ** 2 + cos0 * math.cos(rlat) * math.sin(dlon / 2) ** 2
+        out[i] = 2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return out
+
+
+@njit(parallel=True, cache=True)
+def _impact_kernel(distances, visit_times, tickets, current_time, duration,
+                   remaining_budget, return_times, deadline):
+    """
+    批量影响 + 风险等级内核（Numba并行）
+    
+    规则与ForesightEngine/_determine_risk_level一致；
+    无回程约束时传deadline=inf
+    
+    Returns:
+        (travel_times, total_times, total_costs, budget_after, time_after,
+         risk_level, risk_type)，风险编码见_RISK_LEVELS/_RISK_TYPES
+    """
+    n = distances.shape[0]
+    travel_times = np.empty(n)
+    total_times = np.empty(n)
+    total_costs = np.empty(n)
+    budget_after = np.empty(n)
+    time_after = np.empty(n)
+    risk_level = np.zeros(n, dtype=np.int8)
+    risk_type = np.zeros(n, dtype=np.int8)
+    for i in prange(n):
+        d = distances[i]
+        tt = d / 5 if d < 1.0 else d / 20 + 0.1
+        total = tt + visit_times[i]
+        finish = current_time + total
+        cost = tickets[i] + d * TRANSPORT_COST_PER_KM
+        b_after = remaining_budget - cost
+        t_after = duration - finish
+        
+        if finish + return_times[i] + RETURN_BUFFER > deadline:
+            risk_level[i], risk_type[i] = 2, 1
+        elif b_after < 50:
+            risk_level[i], risk_type[i] = 2, 2
+        elif b_after < 100:
+            risk_level[i], risk_type[i] = 1, 2
+        elif t_after < 0.5:
+            risk_level[i], risk_type[i] = 2, 3
+        elif t_after < 1.0:
+            risk_level[i], risk_type[i] = 1, 3
+        
+        travel_times[i] = tt
+        total_times[i] = total
+        total_costs[i] = cost
+        budget_after[i] = b_after
+        time_after[i] = t_after
+    return (travel_times, total_times, total_costs, budget_after, time_after,
+            risk_level, risk_type)
+
+
+def _impact_numpy(distances, visit_times, tickets, current_time, duration,
+                  remaining_budget, return_times, deadline):
+    """批量影响 + 风险等级（NumPy降级实现）"""
+    travel_times = _travel_time_vec(distances)
+    total_times = travel_times + visit_times
+    finish = current_time + total_times
+    total_costs = tickets + distances * TRANSPORT_COST_PER_KM
+    budget_after = remaining_budget - total_costs
+    time_after = duration - finish
+    
+    late = finish + return_times + RETURN_BUFFER > deadline
+    budget_level = _BUCKET_RISK_CODE[
+        np.searchsorted(_BUDGET_RISK_THRESHOLDS, budget_after, side='right')
+    ]
+    time_level = _BUCKET_RISK_CODE[
+        np.searchsorted(_TIME_RISK_THRESHOLDS, time_after, side='right')
+    ]
+    
+    # 优先级：回程 > 预算 > 时间
+    risk_level = np.where(late, 2, np.where(budget_level > 0, budget_level, time_level))
+    risk_type = np.select([late, budget_level > 0, time_level > 0], [1, 2, 3], default=0)
+    risk_level = risk_level.astype(np.int8)
+    risk_type = risk_type.astype(np.int8)
+    return (travel_times, total_times, total_costs, budget_after, time_after,
+            risk_level, risk_type)
+
+
+if NUMBA_AVAILABLE:
+    _haversine_batch = _haversine_kernel
+    _impact_batch = _impact_kernel
+    # 导入时预热一次，避免首个规划请求承担JIT编译开销
+    _haversine_batch(0.0, 0.0, np.zeros(1), np.zeros(1))
+    _haversine_batch(0.0, 0.0, np.zeros(1, dtype=np.float32), np.zeros(1, dtype=np.float32))
+    _impact_batch(np.zeros(1), np.zeros(1), np.zeros(1), 0.0, 0.0, 0.0,
+                  np.zeros(1), np.inf)
+else:
+    _haversine_batch = _haversine_from
+    _impact_batch = _impact_numpy
+
 
 @dataclass
 class ConstraintStatus:
@@ -20,6 +250,32 @@ class ConstraintStatus:
     budget_usage: Dict = field(default_factory=dict)
     spatial_coverage: Dict = field(default_factory=dict)
     variety: Dict = field(default_factory=dict)
+    
+    def describe(self) -> 'ConstraintStatus':
+        """按数值补齐缺失的description文本（幂等），返回自身"""
+        t = self.time_usage
+        if 'used' in t and 'description' not in t:
+            t['description'] = (f"已用{t['used']:.1f}h / {t['total']:.1f}h "
+                                f"(进度{t['usage_rate']*100:.0f}%)")
+        
+        b = self.budget_usage
+        if 'spent' in b and 'description' not in b:
+            b['description'] = (f"已用¥{b['spent']:.0f} / ¥{b['total']:.0f} "
+                                f"(进度{b['usage_rate']*100:.0f}%)")
+        
+        c = self.spatial_coverage
+        if 'visited_count' in c and 'description' not in c:
+            c['description'] = f"已游览{c['visited_count']}个地点"
+        
+        return self
+    
+    def copy(self) -> 'ConstraintStatus':
+        """复制各部分字典（含其中的字典与列表值），副本的修改不影响原状态"""
+        return ConstraintStatus(*(
+            {k: v.copy() if isinstance(v, (dict, list)) else v for k, v in section.items()}
+            for section in (self.time_usage, self.budget_usage,
+                            self.spatial_coverage, self.variety)
+        ))
 
 
 @dataclass
@@ -30,8 +286,30 @@ class ImpactAnalysis:
     budget_impact: Dict = field(default_factory=dict)
     reachability_impact: Dict = field(default_factory=dict)
     
+    def describe(self) -> 'ImpactAnalysis':
+        """按数值补齐缺失的描述文本（幂等），返回自身"""
+        sp = self.spatial_impact
+        if 'distance_km' in sp and 'description' not in sp:
+            sp['description'] = _distance_description(sp['distance_km'])
+        
+        t = self.time_impact
+        if 'total_time_cost' in t and 'time_status' not in t:
+            t['time_status'] = _time_status(t['total_time_cost'], t['remaining_after'])
+        
+        b = self.budget_impact
+        if 'total_cost' in b and 'budget_status' not in b:
+            b['budget_status'] = _budget_status(b['total_cost'], b['remaining_after'])
+        
+        r = self.reachability_impact
+        if 'reachable_count' in r and 'description' not in r:
+            r['description'] = f"之后还有{r['reachable_count']}个地点在剩余时间和预算内可达"
+            r.setdefault('note', "这只是预测，实际取决于你的选择")
+        
+        return self
+    
     def to_user_message(self) -> str:
         """转换为用户友好的描述"""
+        self.describe()
         messages = []
         
         if self.spatial_impact:
@@ -58,38 +336,119 @@ class SpatialNetwork:
     
     def __init__(self):
         self.nodes: Dict[str, Location] = {}
-        self.edges: Dict[Tuple[str, str], Dict] = {}
+        self.id_to_idx: Dict[str, int] = {}
+        self.node_ids: List[str] = []  # 下标 → poi_id
+        # 边以SoA矩阵存储：dist_matrix[i, j] / time_matrix[i, j]，无边为inf
+        self.dist_matrix: np.ndarray = np.full((0, 0), np.inf, dtype=np.float32)
+        self.time_matrix: np.ndarray = np.full((0, 0), np.inf, dtype=np.float32)
         self.clusters: Dict[str, List[Location]] = {}
+        self.poi_to_cluster: Dict[str, str] = {}  # poi_id → 簇名（反向索引）
+        # 簇名 → {'centroid': (lat, lon), 'count': int, 'ids': 节点下标数组, 'avg_ticket': float}
+        self.cluster_meta: Dict[str, Dict] = {}
+        
+        # 节点属性列（按id_to_idx顺序，由build_index写入）与空间索引
+        # 坐标以连续float32存储（km级距离精度足够），计算时提升为float64
+        self.lat_arr = np.empty(0, dtype=np.float32)
+        self.lon_arr = np.empty(0, dtype=np.float32)
+        self.visit_times = np.empty(0, dtype=np.float64)
+        self.tickets = np.empty(0, dtype=np.float64)
+        self.ball_tree = None
     
     def add_node(self, poi: Location):
         """添加POI节点"""
         self.nodes[poi.id] = poi
+        if poi.id not in self.id_to_idx:
+            self.id_to_idx[poi.id] = len(self.id_to_idx)
+            self.node_ids.append(poi.id)
+            self._reserve(len(self.id_to_idx))
     
     def add_edge(self, from_id: str, to_id: str, distance: float, time: float):
         """添加边（两POI之间的关系）"""
-        self.edges[(from_id, to_id)] = {
-            'distance': distance,
-            'time': time
-        }
+        i = self.id_to_idx[from_id]
+        j = self.id_to_idx[to_id]
+        self.dist_matrix[i, j] = distance
+        self.time_matrix[i, j] = time
+    
+    def set_edges(self, distances: np.ndarray, times: np.ndarray):
+        """
+        整体写入边矩阵（按id_to_idx顺序），自环视为无边
+        """
+        self.dist_matrix = np.array(distances, dtype=np.float32)
+        self.time_matrix = np.array(times, dtype=np.float32)
+        np.fill_diagonal(self.dist_matrix, np.inf)
+        np.fill_diagonal(self.time_matrix, np.inf)
+    
+    def build_index(self):
+        """
+        按id_to_idx顺序抽取节点属性列，并建立空间索引
+        
+        安装了scikit-learn时建haversine度量的BallTree，否则查询退化为线性扫描
+        """
+        order = list(self.nodes.values())  # nodes插入顺序即id_to_idx顺序
+        n = len(order)
+        self.lat_arr = np.fromiter((p.lat for p in order), dtype=np.float32, count=n)
+        self.lon_arr = np.fromiter((p.lon for p in order), dtype=np.float32, count=n)
+        self.visit_times = np.fromiter(
+            (p.average_visit_time for p in order), dtype=np.float64, count=n
+        )
+        self.tickets = np.fromiter(
+            (p.ticket_price for p in order), dtype=np.float64, count=n
+        )
+        self.ball_tree = None
+        if SKLEARN_AVAILABLE and n:
+            self.ball_tree = BallTree(
+                np.radians(np.column_stack((self.lat_arr, self.lon_arr)), dtype=np.float64),
+                metric='haversine'
+            )
+    
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """返回距(lat, lon)不超过radius_km的节点下标"""
+        if self.ball_tree is not None:
+            return self.ball_tree.query_radius(
+                [[math.radians(lat), math.radians(lon)]], r=radius_km / EARTH_RADIUS_KM
+            )[0]
+        return np.flatnonzero(_haversine_batch(lat, lon, self.lat_arr, self.lon_arr) <= radius_km)
     
     def get_distance(self, from_id: str, to_id: str) -> float:
         """获取距离"""
-        if (from_id, to_id) in self.edges:
-            return self.edges[(from_id, to_id)]['distance']
-        return float('inf')
+        i = self.id_to_idx.get(from_id)
+        j = self.id_to_idx.get(to_id)
+        if i is None or j is None:
+            return float('inf')
+        return float(self.dist_matrix[i, j])
     
     def get_travel_time(self, from_id: str, to_id: str) -> float:
         """获取旅行时间"""
-        if (from_id, to_id) in self.edges:
-            return self.edges[(from_id, to_id)]['time']
-        return float('inf')
+        i = self.id_to_idx.get(from_id)
+        j = self.id_to_idx.get(to_id)
+        if i is None or j is None:
+            return float('inf')
+        return float(self.time_matrix[i, j])
+    
+    def _reserve(self, n: int):
+        """保证矩阵至少容纳n个节点（按倍数扩容）"""
+        size = self.dist_matrix.shape[0]
+        if n <= size:
+            return
+        new_size = max(n, 2 * size)
+        for name in ('dist_matrix', 'time_matrix'):
+            grown = np.full((new_size, new_size), np.inf, dtype=np.float32)
+            grown[:size, :size] = getattr(self, name)
+            setattr(self, name, grown)
     
     def get_cluster(self, poi: Location) -> Optional[str]:
         """获取POI所属的簇"""
-        for cluster_name, pois in self.clusters.items():
-            if poi in pois:
-                return cluster_name
-        return None
+        return self.poi_to_cluster.get(poi.id)
+
+
+@dataclass(slots=True)
+class MonitorState:
+    """ConstraintMonitor上次的监控结果与对应输入（增量更新用）"""
+    session: PlanningSession
+    status: ConstraintStatus
+    time_key: Tuple[float, float]  # (current_time, duration)
+    budget_key: Tuple[float, float]  # (remaining_budget, budget)
+    visited: frozenset
 
 
 class ConstraintMonitor:
@@ -99,73 +458,165 @@ class ConstraintMonitor:
     不强制执行，只提醒用户当前状态
     """
     
+    def __init__(self):
+        # id(session) → 上次监控结果；只重算发生变化的部分
+        self._states: Dict[int, MonitorState] = {}
+    
     def monitor(self, 
                current_state: State,
-               session: PlanningSession) -> ConstraintStatus:
+               session: PlanningSession,
+               describe: bool = True) -> ConstraintStatus:
         """
         监控约束状态
         
         返回：当前各项约束的使用情况（描述性）
         不返回：你应该怎么做（指令性）
+        
+        同一会话的连续调用增量更新：时间、预算、空间覆盖中未变化的部分
+        直接复用上次结果（含已生成的描述），只重算变化的部分；
+        缓存的结果归监控器所有，返回的是其副本，调用方修改不影响缓存
+        
+        Args:
+            describe: 是否生成description文本；只需数值时传False，
+                需要时再调用ConstraintStatus.describe()
         """
+        time_key = (current_state.current_time, session.duration)
+        budget_key = (current_state.remaining_budget, session.budget)
+        visited = current_state.visited_history
+        
+        last = self._states.get(id(session))
+        if last is None or last.session is not session:
+            last = None
+        
         status = ConstraintStatus()
         
         # 1. 时间使用
+        if last is not None and last.time_key == time_key:
+            status.time_usage = last.status.time_usage
+        else:
+            status.time_usage = self._time_usage(current_state, session)
+        
+        # 2. 预算使用
+        if last is not None and last.budget_key == budget_key:
+            status.budget_usage = last.status.budget_usage
+        else:
+            status.budget_usage = self._budget_usage(current_state, session)
+        
+        # 3. 空间覆盖（访问了哪些地方）
+        if last is not None and last.visited == visited:
+            status.spatial_coverage = last.status.spatial_coverage
+            visited = last.visited
+        else:
+            status.spatial_coverage = self._spatial_coverage(current_state)
+            visited = frozenset(visited)
+        
+        # 4. 体验多样性（暂时简化）
+        status.variety = last.status.variety if last is not None else {
+            'description': f"多样性评估（基于历史）"
+        }
+        
+        if last is None and len(self._states) >= _SESSION_CACHE_SIZE:
+            self._states.pop(next(iter(self._states)))
+        self._states[id(session)] = MonitorState(
+            session=session, status=status, time_key=time_key,
+            budget_key=budget_key, visited=visited
+        )
+        
+        if describe:
+            status.describe()
+        return status.copy()
+    
+    def _time_usage(self, current_state: State, session: PlanningSession) -> Dict:
+        """时间使用"""
         time_used = current_state.current_time
         time_total = session.duration
         time_remaining = time_total - time_used
         usage_rate = time_used / time_total if time_total > 0 else 0
         
-        status.time_usage = {
+        return {
             'used': time_used,
             'total': time_total,
             'remaining': time_remaining,
             'usage_rate': usage_rate,
-            'status': self._describe_usage(usage_rate),
-            'description': f"已用{time_used:.1f}h / {time_total:.1f}h (进度{usage_rate*100:.0f}%)"
+            'status': self._describe_usage(usage_rate)
         }
-        
-        # 2. 预算使用
+    
+    def _budget_usage(self, current_state: State, session: PlanningSession) -> Dict:
+        """预算使用"""
         budget_spent = session.budget - current_state.remaining_budget
         budget_total = session.budget
         budget_remaining = current_state.remaining_budget
         budget_rate = budget_spent / budget_total if budget_total > 0 else 0
         
-        status.budget_usage = {
+        return {
             'spent': budget_spent,
             'total': budget_total,
             'remaining': budget_remaining,
             'usage_rate': budget_rate,
-            'status': self._describe_usage(budget_rate),
-            'description': f"已用¥{budget_spent:.0f} / ¥{budget_total:.0f} (进度{budget_rate*100:.0f}%)"
+            'status': self._describe_usage(budget_rate)
         }
-        
-        # 3. 空间覆盖（访问了哪些地方）
+    
+    def _spatial_coverage(self, current_state: State) -> Dict:
+        """空间覆盖"""
         visited_count = len(current_state.visited_history)
         
-        status.spatial_coverage = {
+        return {
             'visited_count': visited_count,
-            'visited_ids': list(current_state.visited_history),
-            'description': f"已游览{visited_count}个地点"
-        }
-        
-        # 4. 体验多样性（暂时简化）
-        status.variety = {
-            'description': f"多样性评估（基于历史）"
+            'visited_ids': list(current_state.visited_history)
         }
-        
-        return status
     
     def _describe_usage(self, rate: float) -> Dict:
         """描述使用率（客观描述）"""
-        if rate < 0.3:
-            return {'level': 'low', 'description': '充裕', 'emoji': '😊'}
-        elif rate < 0.7:
-            return {'level': 'medium', 'description': '正常', 'emoji': '👍'}
-        elif rate < 0.9:
-            return {'level': 'high', 'description': '紧张', 'emoji': '⚠️'}
-        else:
-            return {'level': 'critical', 'description': '即将耗尽', 'emoji': '🚨'}
+        return dict(_USAGE_LABELS[bisect_right(_USAGE_THRESHOLDS, rate)])
+
+
+@lru_cache(maxsize=4096)
+def _haversine_cached(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    两点球面距离（km）
+
+    当前位置在一轮候选评估中不变，按坐标缓存可跨调用复用
+    """
+    lat1 = _rad(lat1)
+    lat2 = _rad(lat2)
+    dlat = lat2 - lat1
+    dlon = _rad(lon2) - _rad(lon1)
+    
+    a = _sin(dlat/2)**2 + _cos(lat1) * _cos(lat2) * _sin(dlon/2)**2
+    c = 2 * _atan2(_sqrt(a), _sqrt(1-a))
+    
+    return EARTH_RADIUS_KM * c
+
+
+def _distance_description(distance: float) -> str:
+    """距离的客观描述"""
+    if distance < 1.0:
+        return f"很近（{distance:.1f}km），步行可达"
+    elif distance < 5.0:
+        return f"中等距离（{distance:.1f}km），建议打车"
+    else:
+        return f"较远（{distance:.1f}km），需要交通工具"
+
+
+def _time_status(total_time: float, remaining_time: float) -> str:
+    """时间影响的客观描述（不是建议）"""
+    if remaining_time < 1.0:
+        return f"耗时{total_time:.1f}h，之后仅剩{remaining_time:.1f}h"
+    elif remaining_time < 2.0:
+        return f"耗时{total_time:.1f}h，之后还能游览1个短景点"
+    else:
+        estimated_pois = int(remaining_time / 2.0)
+        return f"耗时{total_time:.1f}h，之后大约能游览{estimated_pois}个景点"
+
+
+def _budget_status(total_cost: float, new_remaining: float) -> str:
+    """预算影响的客观描述"""
+    if new_remaining < 50:
+        return f"花费¥{total_cost:.0f}，之后预算紧张（剩¥{new_remaining:.0f}）"
+    elif new_remaining < 200:
+        return f"花费¥{total_cost:.0f}，之后预算有限（剩¥{new_remaining:.0f}）"
+    else:
+        return f"花费¥{total_cost:.0f}，之后预算充裕（剩¥{new_remaining:.0f}）"
 
 
 class ForesightEngine:
@@ -178,70 +629,197 @@ class ForesightEngine:
     
     def __init__(self, spatial_network: SpatialNetwork):
         self.network = spatial_network
+        
+        # 批量可达性分块并行用的线程池（首次需要时创建，close()释放）
+        self._exec: Optional[ThreadPoolExecutor] = None
     
     def analyze_choice_impact(self,
                              candidate: Location,
                              current_state: State,
-                             session: PlanningSession) -> ImpactAnalysis:
+                             session: PlanningSession,
+                             describe: bool = True) -> ImpactAnalysis:
         """
         分析选择的全局影响
         
         返回：客观的影响分析，不是主观的建议
+        
+        Args:
+            describe: 是否生成描述文本；只需数值（如风险评估）时传False，
+                展示时由to_user_message按需生成
         """
         analysis = ImpactAnalysis()
         
+        # 距离与旅行时间每个候选只算一次，供各项分析共用
+        here = current_state.current_location
+        distance = self._haversine_distance(
+            here.lat, here.lon, candidate.lat, candidate.lon
+        )
+        travel_time = self._estimate_travel_time(distance)
+        
         # 1. 空间影响
-        analysis.spatial_impact = self._analyze_spatial(candidate, current_state)
+        analysis.spatial_impact = self._analyze_spatial(distance)
         
         # 2. 时间影响
-        analysis.time_impact = self._analyze_time(candidate, current_state, session)
+        analysis.time_impact = self._analyze_time(
+            candidate, current_state, session, travel_time
+        )
         
         # 3. 预算影响
-        analysis.budget_impact = self._analyze_budget(candidate, current_state, session)
+        analysis.budget_impact = self._analyze_budget(
+            candidate, current_state, session, distance
+        )
         
         # 4. 可达性影响
         analysis.reachability_impact = self._analyze_reachability(
-            candidate, current_state, session
+            candidate, current_state, session,
+            analysis.time_impact['remaining_after'],
+            analysis.budget_impact['remaining_after']
         )
         
-        return analysis
+        return analysis.describe() if describe else analysis
     
-    def _analyze_spatial(self, candidate: Location, state: State) -> Dict:
-        """分析空间影响"""
-        current_loc = state.current_location
+    def analyze_choice_impact_batch(self,
+                                    candidates: List[Location],
+                                    current_state: State,
+                                    session: PlanningSession,
+                                    describe: bool = True) -> List[ImpactAnalysis]:
+        """
+        批量分析候选的全局影响
         
-        # 计算距离
-        distance = self._haversine_distance(
-            current_loc.lat, current_loc.lon,
-            candidate.lat, candidate.lon
-        )
+        距离/时间/预算一次向量化计算，仅描述文本逐个生成；
+        结果与逐个调用analyze_choice_impact一致
+        """
+        if not candidates:
+            return []
+        
+        cols = self._impact_columns(candidates, current_state, session)
+        analyses = self._impacts_from_columns(candidates, cols, current_state, session)
+        if describe:
+            for analysis in analyses:
+                analysis.describe()
+        return analyses
+    
+    def _impact_columns(self,
+                        candidates: List[Location],
+                        current_state: State,
+                        session: PlanningSession,
+                        return_times: Optional[np.ndarray] = None,
+                        deadline: float = np.inf) -> Dict[str, np.ndarray]:
+        """
+        批量计算影响与风险的数值列（内核一次算完，不生成任何字符串）
         
-        # 简化描述
-        if distance < 1.0:
-            distance_desc = f"很近（{distance:.1f}km），步行可达"
-        elif distance < 5.0:
-            distance_desc = f"中等距离（{distance:.1f}km），建议打车"
-        else:
-            distance_desc = f"较远（{distance:.1f}km），需要交通工具"
+        Args:
+            return_times: 各候选到返程地点的旅行时间，无回程约束时为None
+            deadline: 回程截止时间（小时），无回程约束时为inf
+        """
+        n = len(candidates)
+        here = current_state.current_location
+        lats = np.fromiter((c.lat for c in candidates), dtype=np.float64, count=n)
+        lons = np.fromiter((c.lon for c in candidates), dtype=np.float64, count=n)
+        visit_times = np.fromiter(
+            (c.average_visit_time for c in candidates), dtype=np.float64, count=n
+        )
+        tickets = np.fromiter(
+            (c.ticket_price for c in candidates), dtype=np.float64, count=n
+        )
+        if return_times is None:
+            return_times = np.zeros(n)
+        
+        distances = self._candidate_distances(here, candidates, lats, lons)
+        (travel_times, total_times, total_costs, budget_after, time_after,
+         risk_level, risk_type) = _impact_batch(
+            distances, visit_times, tickets,
+            float(current_state.current_time), float(session.duration),
+            float(current_state.remaining_budget), return_times, float(deadline)
+        )
         
         return {
-            'distance_km': distance,
-            'description': distance_desc
+            'distance': distances,
+            'travel_time': travel_times,
+            'visit_time': visit_times,
+            'total_time': total_times,
+            'time_after': time_after,
+            'ticket': tickets,
+            'transport_cost': distances * TRANSPORT_COST_PER_KM,
+            'total_cost': total_costs,
+            'budget_after': budget_after,
+            'return_time': return_times,
+            'risk_level': risk_level,
+            'risk_type': risk_type,
         }
     
+    def _impacts_from_columns(self,
+                              candidates: List[Location],
+                              cols: Dict[str, np.ndarray],
+                              current_state: State,
+                              session: PlanningSession) -> List[ImpactAnalysis]:
+        """把数值列还原为逐候选的ImpactAnalysis（只含数值，不生成描述文本）"""
+        reachabilities = self._reachability_batch(
+            candidates, current_state, session, cols['time_after'], cols['budget_after']
+        )
+        analyses = []
+        for reachability, row in zip(reachabilities, zip(
+                cols['distance'].tolist(), cols['travel_time'].tolist(),
+                cols['visit_time'].tolist(), cols['total_time'].tolist(),
+                cols['time_after'].tolist(), cols['ticket'].tolist(),
+                cols['transport_cost'].tolist(), cols['total_cost'].tolist(),
+                cols['budget_after'].tolist())):
+            (distance, travel_time, visit_time, total_time, remaining_time,
+             ticket_cost, transport_cost, total_cost, new_remaining) = row
+            analyses.append(ImpactAnalysis(
+                spatial_impact={'distance_km': distance},
+                time_impact={
+                    'travel_time': travel_time,
+                    'visit_time': visit_time,
+                    'total_time_cost': total_time,
+                    'remaining_after': remaining_time
+                },
+                budget_impact={
+                    'ticket_cost': ticket_cost,
+                    'transport_cost': transport_cost,
+                    'total_cost': total_cost,
+                    'remaining_after': new_remaining
+                },
+                reachability_impact=reachability
+            ))
+        
+        return analyses
+    
+    def _candidate_distances(self,
+                             here: Location,
+                             candidates: List[Location],
+                             lats: np.ndarray,
+                             lons: np.ndarray) -> np.ndarray:
+        """
+        当前位置到各候选的距离
+        
+        都在空间网络中时直接取dist_matrix的一行；自环或缺边处退回haversine
+        """
+        id_to_idx = self.network.id_to_idx
+        cur = id_to_idx.get(here.id)
+        rows = [id_to_idx.get(c.id) for c in candidates]
+        if cur is None or None in rows:
+            return _haversine_batch(here.lat, here.lon, lats, lons)
+        
+        distances = self.network.dist_matrix[cur, rows].astype(np.float64)
+        missing = ~np.isfinite(distances)
+        if missing.any():
+            distances[missing] = _haversine_batch(
+                here.lat, here.lon, lats[missing], lons[missing]
+            )
+        return distances
+    
+    def _analyze_spatial(self, distance: float) -> Dict:
+        """分析空间影响"""
+        return {'distance_km': distance}
+    
     def _analyze_time(self, 
                      candidate: Location,
                      state: State,
-                     session: PlanningSession) -> Dict:
+                     session: PlanningSession,
+                     travel_time: float) -> Dict:
         """分析时间影响"""
         
-        # 估算旅行时间
-        distance = self._haversine_distance(
-            state.current_location.lat, state.current_location.lon,
-            candidate.lat, candidate.lon
-        )
-        travel_time = self._estimate_travel_time(distance)
-        
         # 预计游览时间
         visit_time = candidate.average_visit_time
         
@@ -252,107 +830,271 @@ class ForesightEngine:
         new_total_time = state.current_time + total_time
         remaining_time = session.duration - new_total_time
         
-        # 客观描述（不是建议）
-        if remaining_time < 1.0:
-            time_status = f"耗时{total_time:.1f}h，之后仅剩{remaining_time:.1f}h"
-        elif remaining_time < 2.0:
-            time_status = f"耗时{total_time:.1f}h，之后还能游览1个短景点"
-        else:
-            estimated_pois = int(remaining_time / 2.0)
-            time_status = f"耗时{total_time:.1f}h，之后大约能游览{estimated_pois}个景点"
-        
         return {
             'travel_time': travel_time,
             'visit_time': visit_time,
             'total_time_cost': total_time,
-            'remaining_after': remaining_time,
-            'time_status': time_status
+            'remaining_after': remaining_time
         }
     
     def _analyze_budget(self,
                        candidate: Location,
                        state: State,
-                       session: PlanningSession) -> Dict:
+                       session: PlanningSession,
+                       distance: float) -> Dict:
         """分析预算影响"""
         
         # 门票费用
         ticket_cost = candidate.ticket_price
         
         # 估算交通费用（简化）
-        distance = self._haversine_distance(
-            state.current_location.lat, state.current_location.lon,
-            candidate.lat, candidate.lon
-        )
-        transport_cost = distance * 3  # 假设每公里3元
+        transport_cost = distance * TRANSPORT_COST_PER_KM
         
         total_cost = ticket_cost + transport_cost
         
         # 新预算状态
         new_remaining = state.remaining_budget - total_cost
         
-        # 客观描述
-        if new_remaining < 50:
-            budget_status = f"花费¥{total_cost:.0f}，之后预算紧张（剩¥{new_remaining:.0f}）"
-        elif new_remaining < 200:
-            budget_status = f"花费¥{total_cost:.0f}，之后预算有限（剩¥{new_remaining:.0f}）"
-        else:
-            budget_status = f"花费¥{total_cost:.0f}，之后预算充裕（剩¥{new_remaining:.0f}）"
-        
         return {
             'ticket_cost': ticket_cost,
             'transport_cost': transport_cost,
             'total_cost': total_cost,
-            'remaining_after': new_remaining,
-            'budget_status': budget_status
+            'remaining_after': new_remaining
         }
     
     def _analyze_reachability(self,
                              candidate: Location,
                              state: State,
-                             session: PlanningSession) -> Dict:
+                             session: PlanningSession,
+                             remaining_time: Optional[float] = None,
+                             remaining_budget: Optional[float] = None) -> Dict:
         """
         分析可达性影响
         
         选了A之后，还能去哪？（客观分析）
+        
+        先用空间索引按剩余时间的最大行程半径取近邻，再在小结果集上
+        按旅行+游览时间与门票+交通费用精确过滤
+        
+        Args:
+            remaining_time: 游览A之后的剩余时间（小时），缺省时现算
+            remaining_budget: 游览A之后的剩余预算，缺省时现算
         """
-        # 简化实现：返回基本信息
-        return {
-            'description': "可达性分析（基于剩余时间和预算）",
-            'note': "这只是预测，实际取决于你的选择"
-        }
-    
-    def _haversine_distance(self, lat1, lon1, lat2, lon2) -> float:
-        """计算两点距离（km）"""
-        from math import radians, sin, cos, sqrt, atan2
+        network = self.network
+        if not len(network.lat_arr):
+            # 空间网络未初始化：只返回基本信息
+            return {
+                'description': "可达性分析（基于剩余时间和预算）",
+                'note': "这只是预测，实际取决于你的选择"
+            }
+        
+        if remaining_time is None or remaining_budget is None:
+            here = state.current_location
+            distance = self._haversine_distance(
+                here.lat, here.lon, candidate.lat, candidate.lon
+            )
+            remaining_time = session.duration - (
+                state.current_time + self._estimate_travel_time(distance)
+                + candidate.average_visit_time
+            )
+            remaining_budget = state.remaining_budget - (
+                candidate.ticket_price + distance * TRANSPORT_COST_PER_KM
+            )
         
-        R = 6371  # 地球半径（km）
+        # 剩余时间内最远能到哪（步行1km以内，或打车扣除等待时间）
+        walk_speed, _ = _TRAVEL_MODES[0]
+        taxi_speed, taxi_wait = _TRAVEL_MODES[1]
+        max_reach_km = max(
+            min(remaining_time * walk_speed, _TRAVEL_THRESHOLDS[0]),
+            (remaining_time - taxi_wait) * taxi_speed,
+            0.0
+        )
         
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+        idx = np.sort(network.query_radius(candidate.lat, candidate.lon, max_reach_km))
+        reachable = []
+        if len(idx):
+            distances = _haversine_batch(
+                candidate.lat, candidate.lon, network.lat_arr[idx], network.lon_arr[idx]
+            )
+            fits = (
+                (_travel_time_vec(distances) + network.visit_times[idx] <= remaining_time)
+                & (network.tickets[idx] + distances * TRANSPORT_COST_PER_KM <= remaining_budget)
+            )
+            ids = network.node_ids
+            skip = state.visited_history
+            reachable = [
+                ids[i] for i in idx[fits].tolist()
+                if ids[i] != candidate.id and ids[i] not in skip
+            ]
         
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
+        return {
+            'reachable_count': len(reachable),
+            'reachable_ids': reachable
+        }
+    
+    def _reachability_batch(self,
+                            candidates: List[Location],
+                            state: State,
+                            session: PlanningSession,
+                            remaining_times: np.ndarray,
+                            remaining_budgets: np.ndarray) -> List[Dict]:
+        """
+        批量可达性分析，结果与逐个调用_analyze_reachability一致
         
-        return R * c
+        候选×节点的距离与时间/预算过滤按行分块整体计算；分块较多时
+        交给线程池并行（大数组上的NumPy运算会释放GIL）
+        """
+        network = self.network
+        n_nodes = len(network.lat_arr)
+        if not n_nodes:
+            return [
+                self._analyze_reachability(c, state, session, t, b)
+                for c, t, b in zip(candidates, remaining_times.tolist(),
+                                   remaining_budgets.tolist())
+            ]
+        
+        n = len(candidates)
+        lats = np.fromiter((c.lat for c in candidates), dtype=np.float64, count=n)
+        lons = np.fromiter((c.lon for c in candidates), dtype=np.float64, count=n)
+        self_idx = np.fromiter(
+            (network.id_to_idx.get(c.id, -1) for c in candidates), dtype=np.int64, count=n
+        )
+        open_nodes = np.ones(n_nodes, dtype=bool)
+        for poi_id in state.visited_history:
+            i = network.id_to_idx.get(poi_id)
+            if i is not None and i < n_nodes:
+                open_nodes[i] = False
+        
+        node_lats = np.radians(network.lat_arr, dtype=np.float64)
+        node_lons = np.radians(network.lon_arr, dtype=np.float64)
+        cos_nodes = np.cos(node_lats)
+        
+        def reach_rows(rows: slice) -> List[np.ndarray]:
+            rlat = np.radians(lats[rows])[:, None]
+            dlat = node_lats[None, :] - rlat
+            dlon = node_lons[None, :] - np.radians(lons[rows])[:, None]
+            a = np.sin(dlat / 2) ** 2 + np.cos(rlat) * cos_nodes[None, :] * np.sin(dlon / 2) ** 2
+            distances = 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+            
+            fits = (
+                (_travel_time_vec(distances) + network.visit_times[None, :]
+                 <= remaining_times[rows, None])
+                & (network.tickets[None, :] + distances * TRANSPORT_COST_PER_KM
+                   <= remaining_budgets[rows, None])
+                & open_nodes[None, :]
+            )
+            own = self_idx[rows]
+            has_own = np.flatnonzero(own >= 0)
+            fits[has_own, own[has_own]] = False
+            return [np.flatnonzero(row) for row in fits]
+        
+        chunks = [slice(start, min(start + _REACH_CHUNK_ROWS, n))
+                  for start in range(0, n, _REACH_CHUNK_ROWS)]
+        if len(chunks) > 1:
+            if self._exec is None:
+                self._exec = ThreadPoolExecutor(max_workers=_REACH_WORKERS)
+            parts = list(self._exec.map(reach_rows, chunks))
+        else:
+            parts = [reach_rows(chunk) for chunk in chunks]
+        
+        ids = network.node_ids
+        results = []
+        for part in parts:
+            for row in part:
+                reachable = [ids[i] for i in row.tolist()]
+                results.append({
+                    'reachable_count': len(reachable),
+                    'reachable_ids': reachable
+                })
+        return results
+    
+    def close(self):
+        """释放批量可达性线程池"""
+        if self._exec is not None:
+            self._exec.shutdown(wait=True)
+            self._exec = None
+    
+    def _haversine_distance(self, lat1, lon1, lat2, lon2) -> float:
+        """计算两点距离（km），跨调用缓存"""
+        return _haversine_cached(lat1, lon1, lat2, lon2)
     
     def _estimate_travel_time(self, distance_km: float) -> float:
-        """估算旅行时间（小时）"""
-        if distance_km < 1.0:
-            return distance_km / 5  # 步行速度5km/h
-        else:
-            return distance_km / 20 + 0.1  # 打车速度20km/h + 等待时间
+        """估算旅行时间（小时）：1km内步行，否则打车 + 等待时间"""
+        speed, wait = _TRAVEL_MODES[bisect_right(_TRAVEL_THRESHOLDS, distance_km)]
+        return distance_km / speed + wait
 
 
 @dataclass
 class RiskAnalysis:
     """风险分析结果"""
-    impact: ImpactAnalysis
+    impact: Optional[ImpactAnalysis]  # 回程快速预检直接判定违反时为None
     risk_level: str  # 'info', 'warning', 'critical'
     risk_type: Optional[str] = None  # 'budget', 'time', 'return'
     constraint_violations: List[Dict] = field(default_factory=list)
 
 
+def _deadline_hours(deadline) -> float:
+    """回程截止时间转小时数（数字原样返回，datetime取小时，缺省18点）"""
+    if isinstance(deadline, (int, float)):
+        return deadline
+    return deadline.hour if hasattr(deadline, 'hour') else 18.0
+
+
+def _return_violation(finish_time: float,
+                      return_travel_time: float,
+                      deadline: float,
+                      return_constraint: Dict) -> Dict:
+    """构造回程硬约束违反记录"""
+    arrive_time = finish_time + return_travel_time
+    return {
+        'type': 'return',
+        'severity': 'critical',
+        'details': {
+            'finish_time': f"{int(finish_time)}:{int((finish_time % 1) * 60):02d}",
+            'return_travel_time': return_travel_time,
+            'arrive_time': f"{int(arrive_time)}:{int((arrive_time % 1) * 60):02d}",
+            'deadline': f"{int(deadline)}:{int((deadline % 1) * 60):02d}",
+            'late_by': arrive_time - deadline,
+            'consequence': f"错过{return_constraint.get('mode', '回程')}"
+        }
+    }
+
+
+@dataclass(slots=True)
+class PreparedSession:
+    """会话级常量（一次会话内不变，预先转换为纯float，避免逐候选重复转换）"""
+    session: PlanningSession
+    duration: float
+    budget: float
+    return_constraint: Optional[Dict] = None
+    return_location: Optional[Location] = None
+    return_lat: float = math.nan
+    return_lon: float = math.nan
+    deadline_hours: float = math.inf  # 回程截止时间（小时），无回程约束时为inf
+    
+    @classmethod
+    def from_session(cls, session: PlanningSession) -> 'PreparedSession':
+        """从规划会话提取常量"""
+        prep = cls(session=session,
+                   duration=float(session.duration),
+                   budget=float(session.budget))
+        return_constraint = session.hard_constraints.get('return')
+        if return_constraint:
+            prep.return_constraint = return_constraint
+            return_location = return_constraint.get('location')
+            if return_location:
+                prep.return_location = return_location
+                prep.return_lat = float(return_location.lat)
+                prep.return_lon = float(return_location.lon)
+                prep.deadline_hours = float(_deadline_hours(return_constraint.get('time')))
+        return prep
+    
+    def is_current(self, session: PlanningSession) -> bool:
+        """会话对象与回程约束未被替换"""
+        return (self.session is session
+                and self.return_constraint is session.hard_constraints.get('return'))
+
+
 class SpatialIntelligenceCore:
     """
     空间智能核心
@@ -369,6 +1111,21 @@ class SpatialIntelligenceCore:
         self.constraint_monitor = ConstraintMonitor()
         self.foresight_engine = ForesightEngine(self.spatial_network)
         self.llm_client = llm_client  # 可选的LLM客户端
+        
+        # 节点坐标（float32，按id_to_idx顺序，与spatial_network共享）
+        self.lat_arr = self.spatial_network.lat_arr
+        self.lon_arr = self.spatial_network.lon_arr
+        
+        # 会话常量缓存（id(session) → PreparedSession）
+        self._session_cache: Dict[int, PreparedSession] = {}
+        
+        # 回程时间向量缓存（按id_to_idx顺序）
+        self._return_times_key: Optional[Tuple[float, float, int]] = None
+        self._return_times = np.empty(0, dtype=np.float64)
+    
+    def close(self):
+        """释放前瞻引擎持有的线程池"""
+        self.foresight_engine.close()
     
     def initialize(self, pois: List[Location]):
         """
@@ -380,19 +1137,81 @@ class SpatialIntelligenceCore:
         for poi in pois:
             self.spatial_network.add_node(poi)
         
-        # 构建边（简化：计算两两距离）
-        for poi1 in pois:
-            for poi2 in pois:
-                if poi1.id != poi2.id:
-                    distance = self._calculate_distance(poi1, poi2)
-                    time = self._estimate_time(distance)
-                    self.spatial_network.add_edge(
-                        poi1.id, poi2.id, distance, time
-                    )
-        
-        # 识别簇（简化：按类型分组）
+        # 节点属性列与空间索引
+        network = self.spatial_network
+        network.build_index()
+        self.lat_arr, self.lon_arr = network.lat_arr, network.lon_arr
+        self._return_times_key = None
+        
+        # 构建边（一次广播计算两两距离）
+        dist = _haversine_matrix(self.lat_arr, self.lon_arr)
+        times = _travel_time_vec(dist)
+
+        self.spatial_network.set_edges(dist, times)
+        
+        # 识别空间簇
         self._identify_clusters(pois)
     
+    def prepare_session(self,
+                        session: PlanningSession,
+                        describe: bool = True) -> Callable[[Location, State], ImpactAnalysis]:
+        """
+        生成会话专用的影响分析函数
+        
+        会话时长、交通单价、步行/打车速度等在一次会话内不变的量在此取出，
+        作为闭包局部变量捕获，逐候选调用时不再从对象上反复读取；
+        结果与foresight_engine.analyze_choice_impact一致
+        
+        Returns:
+            analyze(candidate, state) -> ImpactAnalysis
+        """
+        duration = float(session.duration)
+        cost_per_km = TRANSPORT_COST_PER_KM
+        walk_limit = _TRAVEL_THRESHOLDS[0]
+        walk_speed, _ = _TRAVEL_MODES[0]
+        taxi_speed, taxi_wait = _TRAVEL_MODES[1]
+        haversine = _haversine_cached
+        reachability = self.foresight_engine._analyze_reachability
+        
+        def analyze(candidate: Location, state: State) -> ImpactAnalysis:
+            here = state.current_location
+            distance = haversine(here.lat, here.lon, candidate.lat, candidate.lon)
+            if distance < walk_limit:
+                travel_time = distance / walk_speed
+            else:
+                travel_time = distance / taxi_speed + taxi_wait
+            
+            visit_time = candidate.average_visit_time
+            total_time = travel_time + visit_time
+            remaining_time = duration - (state.current_time + total_time)
+            
+            ticket_cost = candidate.ticket_price
+            transport_cost = distance * cost_per_km
+            total_cost = ticket_cost + transport_cost
+            new_remaining = state.remaining_budget - total_cost
+            
+            analysis = ImpactAnalysis(
+                spatial_impact={'distance_km': distance},
+                time_impact={
+                    'travel_time': travel_time,
+                    'visit_time': visit_time,
+                    'total_time_cost': total_time,
+                    'remaining_after': remaining_time
+                },
+                budget_impact={
+                    'ticket_cost': ticket_cost,
+                    'transport_cost': transport_cost,
+                    'total_cost': total_cost,
+                    'remaining_after': new_remaining
+                },
+                reachability_impact=reachability(
+                    candidate, state, session, remaining_time, new_remaining
+                )
+            )
+            return analysis.describe() if describe else analysis
+        
+        return analyze
+    
     def get_global_status(self,
                          current_state: State,
                          session: PlanningSession) -> Dict:
@@ -414,26 +1233,65 @@ class SpatialIntelligenceCore:
     def analyze_candidates(self,
                           candidates: List[Location],
                           current_state: State,
-                          session: PlanningSession) -> List[Dict]:
+                          session: PlanningSession,
+                          top_k_clusters: Optional[int] = None) -> List[Dict]:
         """
         分析所有候选的全局影响
         
         不是排序，只是提供信息
-        """
-        analyses = []
         
-        for candidate in candidates:
-            impact = self.foresight_engine.analyze_choice_impact(
-                candidate, current_state, session
+        Args:
+            top_k_clusters: 只分析离当前位置最近的K个簇内的候选（不在任何簇的候选保留），
+                None表示分析全部
+        """
+        if top_k_clusters is not None:
+            candidates = self._filter_by_clusters(
+                candidates, current_state, top_k_clusters
             )
-            
-            analyses.append({
+        
+        impacts = self.foresight_engine.analyze_choice_impact_batch(
+            candidates, current_state, session
+        )
+        
+        return [
+            {
                 'poi': candidate,
                 'impact': impact,
                 'user_message': impact.to_user_message()
-            })
+            }
+            for candidate, impact in zip(candidates, impacts)
+        ]
+    
+    def _filter_by_clusters(self,
+                            candidates: List[Location],
+                            current_state: State,
+                            top_k: int) -> List[Location]:
+        """按簇到当前位置的平均距离保留最近的top_k个簇内的候选"""
+        network = self.spatial_network
+        if not network.clusters or len(network.clusters) <= top_k:
+            return candidates
+        
+        here = current_state.current_location
+        cur = network.id_to_idx.get(here.id)
+        n = len(self.lat_arr)
+        if cur is not None and cur < n:
+            distances = network.dist_matrix[cur, :n].astype(np.float64)
+            distances[cur] = 0.0
+        else:
+            distances = _haversine_batch(here.lat, here.lon, self.lat_arr, self.lon_arr)
         
-        return analyses
+        cluster_dist = {
+            name: float(np.mean(distances[meta['ids']]))
+            for name, meta in network.cluster_meta.items()
+        }
+        nearest = set(sorted(cluster_dist, key=cluster_dist.get)[:top_k])
+        
+        kept = []
+        for c in candidates:
+            name = network.poi_to_cluster.get(c.id)
+            if name is None or name in nearest:
+                kept.append(c)
+        return kept
     
     def _calculate_distance(self, poi1: Location, poi2: Location) -> float:
         """计算距离"""
@@ -445,17 +1303,91 @@ class SpatialIntelligenceCore:
         """估算时间"""
         return self.foresight_engine._estimate_travel_time(distance)
     
-    def _identify_clusters(self, pois: List[Location]):
-        """识别POI簇（简化：按类型）"""
-        clusters = {}
+    def _fast_return_violation(self,
+                               candidate: Location,
+                               state: State,
+                               prep: PreparedSession) -> Optional[Dict]:
+        """
+        回程快速预检：只查time_matrix与回程时间向量
         
-        for poi in pois:
-            poi_type = poi.type.value
-            if poi_type not in clusters:
-                clusters[poi_type] = []
-            clusters[poi_type].append(poi)
+        当前位置与候选都在空间网络中且会赶不上回程时返回违反记录，否则返回None
+        """
+        if prep.return_location is None:
+            return None
+        
+        network = self.spatial_network
+        n = len(self.lat_arr)
+        cur = network.id_to_idx.get(state.current_location.id)
+        cand = network.id_to_idx.get(candidate.id)
+        if cur is None or cand is None or cur >= n or cand >= n:
+            return None
+        
+        travel_time = 0.0 if cur == cand else float(network.time_matrix[cur, cand])
+        finish_time = state.current_time + (travel_time + candidate.average_visit_time)
+        return_travel_time = float(self._return_travel_times(prep.return_location)[cand])
+        
+        if finish_time + return_travel_time + RETURN_BUFFER > prep.deadline_hours:
+            return _return_violation(
+                finish_time, return_travel_time,
+                prep.deadline_hours, prep.return_constraint
+            )
+        return None
+    
+    def _return_travel_time(self, candidate: Location, return_location: Location) -> float:
+        """候选到返程地点的旅行时间：网络内节点查预计算向量，否则现算"""
+        idx = self.spatial_network.id_to_idx.get(candidate.id)
+        if idx is None or idx >= len(self.lat_arr):
+            return self._estimate_time(
+                self._calculate_distance(candidate, return_location)
+            )
+        return float(self._return_travel_times(return_location)[idx])
+    
+    def _return_travel_times(self, return_location: Location) -> np.ndarray:
+        """所有网络节点到返程地点的旅行时间（同一返程地点只算一次）"""
+        key = (return_location.lat, return_location.lon, len(self.lat_arr))
+        if key != self._return_times_key:
+            self._return_times = _travel_time_vec(_haversine_from(
+                return_location.lat, return_location.lon, self.lat_arr, self.lon_arr
+            ))
+            self._return_times_key = key
+        return self._return_times
+    
+    def _identify_clusters(self, pois: List[Location]):
+        """识别POI簇（按空间邻近聚类），并一次性预计算各簇汇总"""
+        network = self.spatial_network
+        n = len(pois)
+        idx = np.fromiter((network.id_to_idx[p.id] for p in pois), dtype=np.int64, count=n)
+        lats = self.lat_arr[idx].astype(np.float64)
+        lons = self.lon_arr[idx].astype(np.float64)
+        labels = _spatial_labels(lats, lons)
         
-        self.spatial_network.clusters = clusters
+        clusters = {}
+        for poi, label in zip(pois, labels.tolist()):
+            clusters.setdefault(f"cluster_{label}", []).append(poi)
+        
+        # 各簇汇总：按标签分段求和，避免逐簇重复扫描成员
+        k = int(labels.max()) + 1 if n else 0
+        counts = np.bincount(labels, minlength=k)
+        lat_mean = np.bincount(labels, weights=lats, minlength=k) / np.maximum(counts, 1)
+        lon_mean = np.bincount(labels, weights=lons, minlength=k) / np.maximum(counts, 1)
+        ticket_mean = np.bincount(
+            labels, weights=network.tickets[idx], minlength=k
+        ) / np.maximum(counts, 1)
+        members_idx = np.split(idx[np.argsort(labels, kind='stable')], np.cumsum(counts)[:-1])
+        
+        network.clusters = clusters
+        network.poi_to_cluster = {
+            poi.id: name for name, members in clusters.items() for poi in members
+        }
+        network.cluster_meta = {
+            f"cluster_{label}": {
+                'centroid': (float(lat_mean[label]), float(lon_mean[label])),
+                'count': int(counts[label]),
+                'ids': members_idx[label],
+                'avg_ticket': float(ticket_mean[label]),
+            }
+            for label in range(k) if counts[label]
+        }
     
     def _generate_summary(self, status: ConstraintStatus) -> str:
         """生成摘要"""
@@ -483,10 +1415,27 @@ class SpatialIntelligenceCore:
         分析选择 + 风险等级评估
         
         这是集成的核心方法！
+        
+        风险评估只用数值，impact不含描述文本；展示时调用impact.to_user_message()
+        
+        网络内的候选先做回程快速预检：确定赶不上回程时直接返回critical，
+        跳过完整影响分析（此时impact为None）
         """
-        # 1. 基础影响分析
+        # 0. 回程快速预检
+        violation = self._fast_return_violation(
+            candidate, current_state, self._get_prep(session)
+        )
+        if violation is not None:
+            return RiskAnalysis(
+                impact=None,
+                risk_level='critical',
+                risk_type='return',
+                constraint_violations=[violation]
+            )
+        
+        # 1. 基础影响分析（只算数值）
         impact = self.foresight_engine.analyze_choice_impact(
-            candidate, current_state, session
+            candidate, current_state, session, describe=False
         )
         
         # 2. 硬约束检查
@@ -506,6 +1455,55 @@ class SpatialIntelligenceCore:
             constraint_violations=violations
         )
     
+    def analyze_with_risk_level_batch(self,
+                                      candidates: List[Location],
+                                      current_state: State,
+                                      session: PlanningSession) -> List[RiskAnalysis]:
+        """
+        批量分析选择 + 风险等级评估
+        
+        数值与风险等级由内核一次算完，结果与逐个调用analyze_with_risk_level一致；
+        同样不生成描述文本
+        """
+        if not candidates:
+            return []
+        
+        prep = self._get_prep(session)
+        return_constraint = prep.return_constraint
+        return_times = None
+        deadline = prep.deadline_hours
+        if prep.return_location is not None:
+            return_times = np.array([
+                self._return_travel_time(c, prep.return_location) for c in candidates
+            ], dtype=np.float64)
+        
+        engine = self.foresight_engine
+        cols = engine._impact_columns(
+            candidates, current_state, session, return_times, deadline
+        )
+        impacts = engine._impacts_from_columns(
+            candidates, cols, current_state, session
+        )
+        
+        results = []
+        finish_times = (current_state.current_time + cols['total_time']).tolist()
+        for i, impact in enumerate(impacts):
+            risk_type = _RISK_TYPES[cols['risk_type'][i]]
+            violations = []
+            if risk_type == 'return':
+                violations.append(_return_violation(
+                    finish_times[i], float(cols['return_time'][i]),
+                    deadline, return_constraint
+                ))
+            results.append(RiskAnalysis(
+                impact=impact,
+                risk_level=_RISK_LEVELS[cols['risk_level'][i]],
+                risk_type=risk_type,
+                constraint_violations=violations
+            ))
+        
+        return results
+    
     def _check_hard_constraints(self,
                                 candidate: Location,
                                 state: State,
@@ -513,51 +1511,38 @@ class SpatialIntelligenceCore:
                                 impact: ImpactAnalysis) -> List[Dict]:
         """检查硬约束"""
         violations = []
+        prep = self._get_prep(session)
         
-        # 检查回程约束
-        if 'return' in session.hard_constraints:
-            return_constraint = session.hard_constraints['return']
-            
+        # 检查回程约束（截止时间已在会话准备时转换为小时数）
+        if prep.return_location is not None:
             # 计算是否会错过回程
             finish_time = state.current_time + impact.time_impact.get('total_time_cost', 0)
             
-            # 返程位置
-            return_location = return_constraint.get('location')
-            if return_location:
-                # 计算返程时间
-                return_travel_time = self._estimate_time(
-                    self._calculate_distance(candidate, return_location)
-                )
-                
-                arrive_time = finish_time + return_travel_time
-                
-                # 检查是否超过截止时间
-                deadline_hour = return_constraint.get('time')  # datetime对象或小时数
-                
-                if isinstance(deadline_hour, (int, float)):
-                    deadline = deadline_hour
-                else:
-                    # 如果是datetime，转换为小时数
-                    deadline = deadline_hour.hour if hasattr(deadline_hour, 'hour') else 18.0
-                
-                buffer = 0.5  # 30分钟缓冲
-                
-                if arrive_time + buffer > deadline:
-                    violations.append({
-                        'type': 'return',
-                        'severity': 'critical',
-                        'details': {
-                            'finish_time': f"{int(finish_time)}:{int((finish_time % 1) * 60):02d}",
-                            'return_travel_time': return_travel_time,
-                            'arrive_time': f"{int(arrive_time)}:{int((arrive_time % 1) * 60):02d}",
-                            'deadline': f"{int(deadline)}:{int((deadline % 1) * 60):02d}",
-                            'late_by': arrive_time - deadline,
-                            'consequence': f"错过{return_constraint.get('mode', '回程')}"
-                        }
-                    })
+            # 计算返程时间
+            return_travel_time = self._return_travel_time(
+                candidate, prep.return_location
+            )
+            
+            arrive_time = finish_time + return_travel_time
+            
+            if arrive_time + RETURN_BUFFER > prep.deadline_hours:
+                violations.append(_return_violation(
+                    finish_time, return_travel_time,
+                    prep.deadline_hours, prep.return_constraint
+                ))
         
         return violations
     
+    def _get_prep(self, session: PlanningSession) -> PreparedSession:
+        """取会话常量（按id(session)缓存，会话或回程约束被替换时重建）"""
+        prep = self._session_cache.get(id(session))
+        if prep is None or not prep.is_current(session):
+            if len(self._session_cache) >= _SESSION_CACHE_SIZE:
+                self._session_cache.pop(next(iter(self._session_cache)))
+            prep = PreparedSession.from_session(session)
+            self._session_cache[id(session)] = prep
+        return prep
+    
     def _determine_risk_level(self,
                              impact: ImpactAnalysis,
                              violations: List[Dict],
@@ -571,17 +1556,15 @@ class SpatialIntelligenceCore:
         
         # 检查预算警告
         remaining = impact.budget_impact.get('remaining_after', 999)
-        if remaining < 50:
-            return ('critical', 'budget')
-        elif remaining < 100:
-            return ('warning', 'budget')
+        level = _BUCKET_RISK[bisect_right(_BUDGET_RISK_THRESHOLDS, remaining)]
+        if level:
+            return (level, 'budget')
         
         # 检查时间警告
         remaining_time = impact.time_impact.get('remaining_after', 999)
-        if remaining_time < 0.5:
-            return ('critical', 'time')
-        elif remaining_time < 1.0:
-            return ('warning', 'time')
+        level = _BUCKET_RISK[bisect_right(_TIME_RISK_THRESHOLDS, remaining_time)]
+        if level:
+            return (level, 'time')
         
         # 正常
         return ('info', None)
@@ -3,13 +3,23 @@
 作为局部影响因子引入算法，精准反映城市运行规律
 """
 
-from typing import Dict, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
 from enum import Enum
+from bisect import bisect_left, bisect_right
 import logging
+import sys
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+_ZONE_CACHE_SIZE = 4096  # 区域类型缓存上限（超出后整体清空）
+
 
 class ZoneType(Enum):
     """城市功能区类型"""
@@ -29,35 +39,148 @@ class TrafficFlow(Enum):
     NEUTRAL = "中性"  # 非高峰或无明显方向
 
 
-@dataclass
+def format_reasons(reason_parts: Tuple) -> Tuple[str, ...]:
+    """
+    格式化惰性理由
+    
+    理由在计算路径上只保存为字符串或(模板, 区域名)对，
+    仅在需要展示时才调用本函数拼接文本
+    """
+    return tuple(
+        part if isinstance(part, str) else part[0].format(zone=part[1])
+        for part in reason_parts
+    )
+
+
+@dataclass(frozen=True, slots=True)
 class ZoneFactor:
     """区域因子"""
     zone_type: ZoneType
     score_modifier: float  # 评分调整系数
     cost_multiplier: float  # 通行成本倍数
-    reasons: list
-    warnings: list = None
+    reason_parts: Tuple  # 惰性理由，见format_reasons
+    warnings: Tuple[str, ...] = ()
+    
+    @property
+    def reasons(self) -> Tuple[str, ...]:
+        """展示用理由文本"""
+        return format_reasons(self.reason_parts)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FlowFactor:
     """潮汐因子"""
     flow_type: TrafficFlow
     cost_multiplier: float  # 通行成本倍数
     mood_modifier: float  # 心情值调整
-    reasons: list
+    reasons: Tuple[str, ...]
+
+
+# 区域因子规则：(区域类型, 时段闭区间, 评分系数, 成本倍数, 理由模板, 警告)
+# 同一区域类型按顺序首个命中生效，时段为None表示全天兜底
+_ZONE_RULES = (
+    # 工业区
+    (ZoneType.INDUSTRIAL, ((18.0, 24.0), (0.0, 7.0)), 0.4, 1.5,
+     "{zone}为工业区，夜间交通不便", ("工业区夜间打车困难，建议避开",)),
+    (ZoneType.INDUSTRIAL, None, 0.7, 1.5,
+     "{zone}为工业区，大货车多", ("工业区路况复杂",)),
+    # CBD（拥堵熔断）
+    (ZoneType.CBD, ((17.0, 19.0),), 0.3, 2.5,
+     "{zone}为CBD，晚高峰严重拥堵", ("晚高峰拥堵熔断，强烈建议避开",)),
+    (ZoneType.CBD, ((7.5, 9.5),), 0.4, 2.0,
+     "{zone}为CBD，早高峰拥堵", ("早高峰拥堵，建议避开",)),
+    (ZoneType.CBD, ((10.0, 16.0),), 1.0, 1.0,
+     "{zone}为CBD，工作时段交通便利", ()),
+    (ZoneType.CBD, None, 0.9, 1.1, "{zone}为CBD", ()),
+    # 商业区
+    (ZoneType.COMMERCIAL, ((18.0, 22.0),), 1.2, 1.0,
+     "{zone}为商业区，夜间热闹氛围好", ()),
+    (ZoneType.COMMERCIAL, None, 1.0, 1.0, "{zone}为商业区", ()),
+)
+_NEUTRAL_ZONE = (1.0, 1.0, None, ())
+
+# 潮汐因子规则：(时段闭区间, 起点类型, 终点类型, 潮汐方向, 成本倍数, 心情调整, 理由)
+_FLOW_RULES = (
+    # 早高峰 (07:30 - 09:30)
+    (((7.5, 9.5),), ZoneType.RESIDENTIAL, ZoneType.CBD,
+     TrafficFlow.WITH_FLOW, 2.0, -0.3, "早高峰顺流前往CBD，严重拥堵"),
+    (((7.5, 9.5),), ZoneType.CBD, ZoneType.RESIDENTIAL,
+     TrafficFlow.AGAINST_FLOW, 0.8, 0.2, "早高峰逆流出CBD，道路畅通"),
+    # 晚高峰 (17:00 - 19:30)
+    (((17.0, 19.5),), ZoneType.CBD, ZoneType.RESIDENTIAL,
+     TrafficFlow.WITH_FLOW, 2.0, -0.3, "晚高峰顺流出CBD，严重拥堵"),
+    (((17.0, 19.5),), ZoneType.RESIDENTIAL, ZoneType.CBD,
+     TrafficFlow.AGAINST_FLOW, 0.8, 0.2, "晚高峰逆流进CBD，道路畅通（看夜景好时机）"),
+)
+_NEUTRAL_FLOW = FlowFactor(
+    flow_type=TrafficFlow.NEUTRAL,
+    cost_multiplier=1.0,
+    mood_modifier=0.0,
+    reasons=()
+)
 
+# 所有规则时段端点（升序），即小时分桶边界
+_HOUR_EDGES = tuple(sorted(
+    {h for rule in _ZONE_RULES if rule[1] for span in rule[1] for h in span} |
+    {h for rule in _FLOW_RULES for span in rule[0] for h in span}
+))
 
-@dataclass
+
+def _hour_bucket(hour: float) -> int:
+    """
+    小时分桶：落在端点上为奇数桶，落在相邻端点之间为偶数桶
+    
+    规则时段均为闭区间，端点需单独成桶才能与原区间判断完全一致
+    """
+    return bisect_left(_HOUR_EDGES, hour) + bisect_right(_HOUR_EDGES, hour)
+
+
+def _bucket_hours() -> List[float]:
+    """每个分桶的代表小时（按桶编号顺序）"""
+    edges = _HOUR_EDGES
+    hours = [edges[0] - 1.0]
+    for k, edge in enumerate(edges):
+        hours.append(edge)
+        hours.append((edge + edges[k + 1]) / 2 if k + 1 < len(edges) else edge + 1.0)
+    return hours
+
+
+def _in_spans(spans: Optional[Tuple[Tuple[float, float], ...]], hour: float) -> bool:
+    """小时是否落在任一闭区间内（None表示全天）"""
+    return spans is None or any(lo <= hour <= hi for lo, hi in spans)
+
+
+@dataclass(frozen=True, slots=True)
 class ActivityFactor:
     """活力因子（基于LBS热力图）"""
     activity_level: str  # 'ghost', 'low', 'medium', 'high', 'overload'
     score_modifier: float
     crowd_warning: bool
-    reasons: list
+    reasons: Tuple[str, ...]
 
 
-@dataclass
+# 活跃设备数分档：bisect_right(阈值, 设备数)得到档位下标
+_ACTIVITY_THRESHOLDS = (10, 50, 200, 500)
+_ACTIVITY_FACTORS = (
+    # 鬼城预警
+    ActivityFactor('ghost', 0.1, False, ("LBS数据显示区域活跃度异常低，可能闭馆或装修",)),
+    # 低活跃
+    ActivityFactor('low', 0.7, False, ("区域人气偏低",)),
+    # 适中
+    ActivityFactor('medium', 1.0, False, ()),
+    # 高活跃
+    ActivityFactor('high', 1.1, False, ("检测到区域人气旺盛",)),
+    # 过载（人挤人）
+    ActivityFactor('overload', 0.6, True, ("LBS显示人流密集，可能人挤人",)),
+)
+_DEFAULT_ACTIVITY = _ACTIVITY_FACTORS[2]  # 无LBS数据时按适中处理
+
+# 边颜色分档：修正系数 <0.6 红，[0.6, 1.0) 黄，>=1.0 绿
+_EDGE_COLOR_THRESHOLDS = (0.6, 1.0)
+_EDGE_COLORS = ('red', 'yellow', 'green')
+
+
+@dataclass(slots=True)
 class DampingResult:
     """时空阻尼结果"""
     zone_factor: float  # L_zone
@@ -65,8 +188,16 @@ class DampingResult:
     activity_factor: float  # L_activity
     final_modifier: float  # 最终修正系数
     edge_color: str  # 边颜色（red/yellow/green）
-    reasons: list
-    warnings: list
+    reason_parts: Tuple  # 惰性理由，见format_reasons
+    warnings: Tuple[str, ...]
+    
+    @property
+    def reasons(self) -> Tuple[str, ...]:
+        """展示用理由文本（访问时才格式化）"""
+        return format_reasons(self.reason_parts)
+    
+    def __str__(self) -> str:
+        return f"{self.edge_color}({self.final_modifier:.2f}): " + "；".join(self.reasons)
 
 
 class SpatioTemporalDamping:
@@ -81,18 +212,65 @@ class SpatioTemporalDamping:
     
     def __init__(self):
         """初始化"""
+        # 区域名/关键词统一驻留（sys.intern），同名字符串在各处共享同一对象，
+        # 比较与缓存查找可直接走指针相等
+        
         # CBD区域定义（示例，实际应从高德AOI数据获取）
         self.cbd_areas = {
-            '苏州': ['工业园区', '金鸡湖', '圆融广场'],
-            '上海': ['陆家嘴', '人民广场', '南京西路'],
-            '北京': ['国贸', '金融街', '中关村']
+            sys.intern(city): [sys.intern(area) for area in areas]
+            for city, areas in {
+                '苏州': ['工业园区', '金鸡湖', '圆融广场'],
+                '上海': ['陆家嘴', '人民广场', '南京西路'],
+                '北京': ['国贸', '金融街', '中关村']
+            }.items()
         }
         
         # 工业区关键词
-        self.industrial_keywords = ['工业园', '开发区', '物流园', '厂区']
+        self.industrial_keywords = [
+            sys.intern(k) for k in ['工业园', '开发区', '物流园', '厂区']
+        ]
         
         # 商业区关键词
-        self.commercial_keywords = ['商场', '步行街', '商业街', '购物中心']
+        self.commercial_keywords = [
+            sys.intern(k) for k in ['商场', '步行街', '商业街', '购物中心']
+        ]
+        
+        # 扁平化的(子串, 区域类型)索引，顺序即匹配优先级：工业区 > 商业区 > CBD
+        self._zone_keywords: Tuple[Tuple[str, ZoneType], ...] = (
+            tuple((k, ZoneType.INDUSTRIAL) for k in self.industrial_keywords) +
+            tuple((k, ZoneType.COMMERCIAL) for k in self.commercial_keywords) +
+            tuple((area, ZoneType.CBD)
+                  for areas in self.cbd_areas.values() for area in areas)
+        )
+        self._zone_cache: Dict[str, ZoneType] = {}
+        
+        # 可选：Aho-Corasick自动机，一次扫描命中全部关键词（值为(优先级, 区域类型)）
+        self._zone_automaton = None
+        if AHOCORASICK_AVAILABLE:
+            automaton = ahocorasick.Automaton()
+            for priority, (keyword, zone_type) in enumerate(self._zone_keywords):
+                if not automaton.exists(keyword):
+                    automaton.add_word(keyword, (priority, zone_type))
+            automaton.make_automaton()
+            self._zone_automaton = automaton
+        
+        # 按(区域类型, 小时桶) / (起点类型, 终点类型, 小时桶)预先展开的规则结果
+        self._zone_table: Dict[Tuple[ZoneType, int], tuple] = {}
+        self._flow_table: Dict[Tuple[ZoneType, ZoneType, int], FlowFactor] = {}
+        for bucket, hour in enumerate(_bucket_hours()):
+            for zone_type, spans, score, cost, template, warnings in _ZONE_RULES:
+                key = (zone_type, bucket)
+                if key not in self._zone_table and _in_spans(spans, hour):
+                    self._zone_table[key] = (score, cost, template, warnings)
+            for spans, from_type, to_type, flow, cost, mood, reason in _FLOW_RULES:
+                key = (from_type, to_type, bucket)
+                if key not in self._flow_table and _in_spans(spans, hour):
+                    self._flow_table[key] = FlowFactor(
+                        flow_type=flow,
+                        cost_multiplier=cost,
+                        mood_modifier=mood,
+                        reasons=(reason,)
+                    )
     
     def calculate_damping(self,
                          from_zone: str,
@@ -135,16 +313,15 @@ class SpatioTemporalDamping:
         edge_color = self._determine_edge_color(final_modifier)
         
         # 6. 汇总原因和警告
-        reasons = []
-        reasons.extend(zone_factor_result.reasons)
-        reasons.extend(flow_factor_result.reasons)
-        reasons.extend(activity_factor_result.reasons)
+        reason_parts = (
+            *zone_factor_result.reason_parts,
+            *flow_factor_result.reasons,
+            *activity_factor_result.reasons
+        )
         
-        warnings = []
-        if zone_factor_result.warnings:
-            warnings.extend(zone_factor_result.warnings)
+        warnings = zone_factor_result.warnings
         if activity_factor_result.crowd_warning:
-            warnings.append("目标区域人流密集，请注意")
+            warnings = (*warnings, "目标区域人流密集，请注意")
         
         return DampingResult(
             zone_factor=zone_factor_result.score_modifier,
@@ -152,225 +329,65 @@ class SpatioTemporalDamping:
             activity_factor=activity_factor_result.score_modifier,
             final_modifier=final_modifier,
             edge_color=edge_color,
-            reasons=reasons,
+            reason_parts=reason_parts,
             warnings=warnings
         )
     
     def _calculate_zone_factor(self, zone: str, hour: float) -> ZoneFactor:
-        """计算区域因子"""
+        """计算区域因子（查表，规则见_ZONE_RULES）"""
         zone_type = self._identify_zone_type(zone)
-        
-        # 工业区逻辑
-        if zone_type == ZoneType.INDUSTRIAL:
-            if 18.0 <= hour <= 24.0 or 0.0 <= hour <= 7.0:
-                return ZoneFactor(
-                    zone_type=zone_type,
-                    score_modifier=0.4,
-                    cost_multiplier=1.5,
-                    reasons=[f"{zone}为工业区，夜间交通不便"],
-                    warnings=["工业区夜间打车困难，建议避开"]
-                )
-            else:
-                return ZoneFactor(
-                    zone_type=zone_type,
-                    score_modifier=0.7,
-                    cost_multiplier=1.5,
-                    reasons=[f"{zone}为工业区，大货车多"],
-                    warnings=["工业区路况复杂"]
-                )
-        
-        # CBD逻辑（拥堵熔断）
-        elif zone_type == ZoneType.CBD:
-            if 17.0 <= hour <= 19.0:
-                return ZoneFactor(
-                    zone_type=zone_type,
-                    score_modifier=0.3,
-                    cost_multiplier=2.5,
-                    reasons=[f"{zone}为CBD，晚高峰严重拥堵"],
-                    warnings=["晚高峰拥堵熔断，强烈建议避开"]
-                )
-            elif 7.5 <= hour <= 9.5:
-                return ZoneFactor(
-                    zone_type=zone_type,
-                    score_modifier=0.4,
-                    cost_multiplier=2.0,
-                    reasons=[f"{zone}为CBD，早高峰拥堵"],
-                    warnings=["早高峰拥堵，建议避开"]
-                )
-            elif 10.0 <= hour <= 16.0:
-                return ZoneFactor(
-                    zone_type=zone_type,
-                    score_modifier=1.0,
-                    cost_multiplier=1.0,
-                    reasons=[f"{zone}为CBD，工作时段交通便利"]
-                )
-            else:
-                return ZoneFactor(
-                    zone_type=zone_type,
-                    score_modifier=0.9,
-                    cost_multiplier=1.1,
-                    reasons=[f"{zone}为CBD"]
-                )
-        
-        # 商业区逻辑
-        elif zone_type == ZoneType.COMMERCIAL:
-            if 18.0 <= hour <= 22.0:
-                return ZoneFactor(
-                    zone_type=zone_type,
-                    score_modifier=1.2,
-                    cost_multiplier=1.0,
-                    reasons=[f"{zone}为商业区，夜间热闹氛围好"]
-                )
-            else:
-                return ZoneFactor(
-                    zone_type=zone_type,
-                    score_modifier=1.0,
-                    cost_multiplier=1.0,
-                    reasons=[f"{zone}为商业区"]
-                )
-        
-        # 默认
-        else:
-            return ZoneFactor(
-                zone_type=zone_type,
-                score_modifier=1.0,
-                cost_multiplier=1.0,
-                reasons=[]
-            )
+        score, cost, template, warnings = self._zone_table.get(
+            (zone_type, _hour_bucket(hour)), _NEUTRAL_ZONE
+        )
+        return ZoneFactor(
+            zone_type=zone_type,
+            score_modifier=score,
+            cost_multiplier=cost,
+            reason_parts=((template, zone),) if template else (),
+            warnings=warnings
+        )
     
     def _calculate_flow_factor(self, from_zone: str, to_zone: str, hour: float) -> FlowFactor:
-        """计算潮汐因子"""
+        """计算潮汐因子（查表，规则见_FLOW_RULES）"""
         from_type = self._identify_zone_type(from_zone)
         to_type = self._identify_zone_type(to_zone)
-        
-        # 早高峰 (07:30 - 09:30)
-        if 7.5 <= hour <= 9.5:
-            if from_type == ZoneType.RESIDENTIAL and to_type == ZoneType.CBD:
-                return FlowFactor(
-                    flow_type=TrafficFlow.WITH_FLOW,
-                    cost_multiplier=2.0,
-                    mood_modifier=-0.3,
-                    reasons=["早高峰顺流前往CBD，严重拥堵"]
-                )
-            elif from_type == ZoneType.CBD and to_type == ZoneType.RESIDENTIAL:
-                return FlowFactor(
-                    flow_type=TrafficFlow.AGAINST_FLOW,
-                    cost_multiplier=0.8,
-                    mood_modifier=0.2,
-                    reasons=["早高峰逆流出CBD，道路畅通"]
-                )
-        
-        # 晚高峰 (17:00 - 19:30)
-        elif 17.0 <= hour <= 19.5:
-            if from_type == ZoneType.CBD and to_type == ZoneType.RESIDENTIAL:
-                return FlowFactor(
-                    flow_type=TrafficFlow.WITH_FLOW,
-                    cost_multiplier=2.0,
-                    mood_modifier=-0.3,
-                    reasons=["晚高峰顺流出CBD，严重拥堵"]
-                )
-            elif from_type == ZoneType.RESIDENTIAL and to_type == ZoneType.CBD:
-                return FlowFactor(
-                    flow_type=TrafficFlow.AGAINST_FLOW,
-                    cost_multiplier=0.8,
-                    mood_modifier=0.2,
-                    reasons=["晚高峰逆流进CBD，道路畅通（看夜景好时机）"]
-                )
-        
-        # 非高峰时段
-        return FlowFactor(
-            flow_type=TrafficFlow.NEUTRAL,
-            cost_multiplier=1.0,
-            mood_modifier=0.0,
-            reasons=[]
+        return self._flow_table.get(
+            (from_type, to_type, _hour_bucket(hour)), _NEUTRAL_FLOW
         )
     
     def _calculate_activity_factor(self, zone: str, activity_data: Optional[Dict]) -> ActivityFactor:
-        """计算活力因子（基于LBS热力图）"""
+        """计算活力因子（基于LBS热力图，查表见_ACTIVITY_FACTORS）"""
         if not activity_data:
-            return ActivityFactor(
-                activity_level='medium',
-                score_modifier=1.0,
-                crowd_warning=False,
-                reasons=[]
-            )
-        
+            return _DEFAULT_ACTIVITY
         active_devices = activity_data.get('active_devices', 100)
-        
-        # 鬼城预警
-        if active_devices < 10:
-            return ActivityFactor(
-                activity_level='ghost',
-                score_modifier=0.1,
-                crowd_warning=False,
-                reasons=["LBS数据显示区域活跃度异常低，可能闭馆或装修"]
-            )
-        
-        # 低活跃
-        elif active_devices < 50:
-            return ActivityFactor(
-                activity_level='low',
-                score_modifier=0.7,
-                crowd_warning=False,
-                reasons=["区域人气偏低"]
-            )
-        
-        # 适中
-        elif active_devices < 200:
-            return ActivityFactor(
-                activity_level='medium',
-                score_modifier=1.0,
-                crowd_warning=False,
-                reasons=[]
-            )
-        
-        # 高活跃
-        elif active_devices < 500:
-            return ActivityFactor(
-                activity_level='high',
-                score_modifier=1.1,
-                crowd_warning=False,
-                reasons=["检测到区域人气旺盛"]
-            )
-        
-        # 过载（人挤人）
-        else:
-            return ActivityFactor(
-                activity_level='overload',
-                score_modifier=0.6,
-                crowd_warning=True,
-                reasons=["LBS显示人流密集，可能人挤人"]
-            )
+        return _ACTIVITY_FACTORS[bisect_right(_ACTIVITY_THRESHOLDS, active_devices)]
     
     def _identify_zone_type(self, zone: str) -> ZoneType:
-        """识别区域类型"""
-        # 工业区
-        for keyword in self.industrial_keywords:
-            if keyword in zone:
-                return ZoneType.INDUSTRIAL
+        """识别区域类型（按区域名缓存，同一区域只扫描一次关键词索引）"""
+        cached = self._zone_cache.get(zone)
+        if cached is not None:
+            return cached
         
-        # 商业区
-        for keyword in self.commercial_keywords:
-            if keyword in zone:
-                return ZoneType.COMMERCIAL
-        
-        # CBD
-        for city, areas in self.cbd_areas.items():
-            for area in areas:
-                if area in zone:
-                    return ZoneType.CBD
+        zone_type = ZoneType.UNKNOWN
+        if self._zone_automaton is not None:
+            # 自动机按出现位置报告命中，取优先级最高（序号最小）的关键词
+            hits = [hit for _, hit in self._zone_automaton.iter(zone)]
+            if hits:
+                zone_type = min(hits, key=lambda hit: hit[0])[1]
+        else:
+            for keyword, keyword_type in self._zone_keywords:
+                if keyword in zone:
+                    zone_type = keyword_type
+                    break
         
-        # 默认
-        return ZoneType.UNKNOWN
+        if len(self._zone_cache) >= _ZONE_CACHE_SIZE:
+            self._zone_cache.clear()
+        self._zone_cache[sys.intern(zone)] = zone_type
+        return zone_type
     
     def _determine_edge_color(self, modifier: float) -> str:
         """根据修正系数确定边颜色"""
-        if modifier >= 1.0:
-            return "green"
-        elif modifier >= 0.6:
-            return "yellow"
-        else:
-            return "red"
+        return _EDGE_COLORS[bisect_right(_EDGE_COLOR_THRESHOLDS, modifier)]
     
     def generate_opportunity_card(self, zone: str, activity_spike: float) -> Optional[Dict]:
         """
@@ -13,20 +13,44 @@ Author: GAODE Team
 Date: 2024-12
 """
 
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Tuple, Iterator, Union
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timedelta
 from enum import Enum
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 import copy
 import uuid
 
+from src.utils.jit import njit, NUMBA_AVAILABLE
 from .models import Location, State, UserProfile
 from .progressive_planner import ProgressivePlanner
 from .neural_net_service import NeuralNetService
 from .influence_field import InfluenceField, InfluenceFactor
 
 
+@njit(cache=True, fastmath=True)
+def _mean_strength_kernel(z_values):
+    """选中节点场强均值（JIT版）"""
+    total = 0.0
+    for i in range(z_values.shape[0]):
+        total += z_values[i]
+    return total / z_values.shape[0]
+
+
+def _mean_strength_numpy(z_values: np.ndarray) -> float:
+    """选中节点场强均值（NumPy降级版）"""
+    return z_values.mean()
+
+
+if NUMBA_AVAILABLE:
+    _mean_strength = _mean_strength_kernel
+    # 导入时预热一次，避免首次提交快照承担JIT编译开销
+    _mean_strength(np.zeros(1))
+else:
+    _mean_strength = _mean_strength_numpy
+
+
 class NodeStatus(Enum):
     """节点状态"""
     PENDING = "pending"          # 待选择
@@ -37,7 +61,54 @@ class NodeStatus(Enum):
     ADJUSTED = "adjusted"        # 已调整（第四维度）
 
 
-@dataclass
+@dataclass(slots=True)
+class FactorColumns:
+    """
+    影响因子的列式存储（SoA）
+    
+    数值列为连续数组，排序/筛选在NumPy中完成，只在输出时按下标取回字符串列
+    """
+    names: Tuple[str, ...]
+    values: np.ndarray
+    weights: np.ndarray
+    weighted: np.ndarray  # values * weights
+    sources: Tuple[str, ...]
+    explanations: Tuple[str, ...]
+    
+    @classmethod
+    def from_factors(cls, factors: List[InfluenceFactor]) -> 'FactorColumns':
+        """由影响因子列表构建"""
+        values = np.array([f.value for f in factors], dtype=np.float64)
+        weights = np.array([f.weight for f in factors], dtype=np.float64)
+        return cls(
+            names=tuple(f.name for f in factors),
+            values=values,
+            weights=weights,
+            weighted=values * weights,
+            sources=tuple(f.source for f in factors),
+            explanations=tuple(f.explanation for f in factors)
+        )
+    
+    def ranked(self) -> List[Dict]:
+        """按加权贡献降序展开（贡献相同时保持原顺序）"""
+        order = np.argsort(-self.weighted, kind='stable').tolist()
+        values = self.values.tolist()
+        weights = self.weights.tolist()
+        weighted = self.weighted.tolist()
+        return [
+            {
+                'name': self.names[i],
+                'value': values[i],
+                'weight': weights[i],
+                'weighted_value': weighted[i],
+                'source': self.sources[i],
+                'explanation': self.explanations[i]
+            }
+            for i in order
+        ]
+
+
+@dataclass(slots=True)
 class DecisionPoint:
     """
     三维决策点
@@ -55,8 +126,8 @@ class DecisionPoint:
     time: datetime
     duration: float  # 小时
     
-    # Z轴详细信息
-    factors: List[InfluenceFactor] = field(default_factory=list)
+    # Z轴详细信息（无因子时为None）
+    factors: Optional[List[InfluenceFactor]] = None
     
     # 节点状态
     status: NodeStatus = NodeStatus.PENDING
@@ -66,11 +137,49 @@ class DecisionPoint:
     original_time: Optional[datetime] = None
     adjustment_reason: str = ""
     
-    # 预留：第四维度事件
-    dimensional_4_events: List[Dict] = field(default_factory=list)
+    # 预留：第四维度事件（无事件时为None）
+    dimensional_4_events: Optional[List[Dict]] = None
+    
+    # 序列化缓存：(版本号, 结果)，字段被修改后须调用invalidate()
+    _version: int = field(default=0, init=False, repr=False, compare=False)
+    _cached_dict: Optional[Tuple[int, Dict]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _factor_columns: Optional[FactorColumns] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    
+    @property
+    def factor_columns(self) -> FactorColumns:
+        """影响因子的列式视图（首次访问时构建）"""
+        if self._factor_columns is None:
+            self._factor_columns = FactorColumns.from_factors(self.factors or ())
+        return self._factor_columns
+    
+    def invalidate(self):
+        """标记决策点已修改，使to_dict缓存失效"""
+        self._version += 1
     
     def to_dict(self) -> Dict:
-        """序列化"""
+        """
+        序列化
+        
+        结果按版本缓存，每次返回缓存的副本（逐层复制字典/列表，
+        调用方修改返回值不影响缓存）
+        """
+        cached = self._cached_dict
+        if cached is None or cached[0] != self._version:
+            cached = (self._version, self._serialize())
+            self._cached_dict = cached
+        result = cached[1]
+        return {
+            **result,
+            'option': dict(result['option']),
+            'factors': [dict(f) for f in result['factors']]
+        }
+    
+    def _serialize(self) -> Dict:
+        """构建序列化结果（供to_dict缓存）"""
         return {
             'x': self.x,
             'y': self.y,
@@ -92,12 +201,12 @@ class DecisionPoint:
                     'weight': f.weight,
                     'explanation': f.explanation
                 }
-                for f in self.factors
+                for f in self.factors or ()
             ]
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class TimelineNode:
     """
     时间线节点（Y轴上的一个点）
@@ -129,7 +238,10 @@ class TimelineNode:
             self.selected_x = x_index
             # 更新状态
             for i, point in enumerate(self.decision_points):
-                point.status = NodeStatus.SELECTED if i == x_index else NodeStatus.ALTERNATIVE
+                status = NodeStatus.SELECTED if i == x_index else NodeStatus.ALTERNATIVE
+                if point.status is not status:
+                    point.status = status
+                    point.invalidate()
             return True
         return False
     
@@ -138,6 +250,56 @@ class TimelineNode:
         return self.decision_points
 
 
+class CoWTimeline:
+    """
+    写时复制（Copy-on-Write）时间线
+    
+    未改动的节点直接与基线（静态快照）共享，只有被修改的节点才复制一份
+    存入overrides；读取时优先返回overrides中的副本
+    """
+    
+    def __init__(self, base: List[TimelineNode]):
+        self.base = base
+        self.overrides: Dict[int, TimelineNode] = {}
+    
+    def __len__(self) -> int:
+        return len(self.base)
+    
+    def __iter__(self) -> Iterator[TimelineNode]:
+        overrides = self.overrides
+        for y, node in enumerate(self.base):
+            yield overrides.get(y, node)
+    
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[y] for y in range(*index.indices(len(self.base)))]
+        y = self._normalize(index)
+        return self.overrides.get(y, self.base[y])
+    
+    def mutable(self, index: int) -> TimelineNode:
+        """获取可修改的节点（首次修改时复制）"""
+        y = self._normalize(index)
+        node = self.overrides.get(y)
+        if node is None:
+            # 修改只涉及节点与决策点上的标量字段，浅拷贝决策点即可，
+            # option/factors等仍与基线共享
+            base = self.base[y]
+            node = replace(
+                base,
+                decision_points=[copy.copy(p) for p in base.decision_points]
+            )
+            self.overrides[y] = node
+        return node
+    
+    def _normalize(self, index: int) -> int:
+        """支持负索引（与list一致）"""
+        if index < 0:
+            index += len(self.base)
+        if not 0 <= index < len(self.base):
+            raise IndexError("timeline index out of range")
+        return index
+
+
 @dataclass
 class StaticSnapshot:
     """
@@ -197,11 +359,13 @@ class ThreeDimensionalPlan:
                  progressive_planner: ProgressivePlanner,
                  neural_service: NeuralNetService,
                  spatial_intelligence=None,
-                 enable_4d: bool = True):
+                 enable_4d: bool = True,
+                 layer_workers: int = 1):
         """
         Args:
             spatial_intelligence: 大模型（上帝视角），用于W轴因果推理
             enable_4d: 是否启用四维模式（W轴）
+            layer_workers: 影响力场批量评估的线程数（见InfluenceField）
         """
         self.planner = progressive_planner
         self.neural = neural_service
@@ -212,21 +376,29 @@ class ThreeDimensionalPlan:
             progressive_planner,
             neural_service,
             spatial_intelligence=spatial_intelligence,
-            enable_4d=enable_4d
+            enable_4d=enable_4d,
+            layer_workers=layer_workers
         )
         
         # Y轴：时间线
         self.timeline: List[TimelineNode] = []
         
+        # 主时间线各节点选中方案的场强（与timeline按Y对齐，用于置信度）
+        self._z_buffer: np.ndarray = np.zeros(0)
+        
         # 静态快照历史
         self.snapshots: List[StaticSnapshot] = []
         
         # 动态工作区
-        self.working_timeline: Optional[List[TimelineNode]] = None
+        self.working_timeline: Optional[CoWTimeline] = None
         
         # 当前快照
         self.current_snapshot: Optional[StaticSnapshot] = None
         
+        # 版本向量：各修改操作递增工作区对应Y的版本，与快照版本不同即存在差异
+        self._snapshot_versions: np.ndarray = np.zeros(0, dtype=np.int64)
+        self._working_versions: np.ndarray = np.zeros(0, dtype=np.int64)
+        
         # 预留：第四维度处理器
         self.dimensional_4_handler = None  # TODO: 未来扩展
     
@@ -254,34 +426,58 @@ class ThreeDimensionalPlan:
         print(f"   X轴: 每个时间点{x_alternatives}个备选")
         
         self.timeline = []
+        z_values = []
         current_state = initial_state
         current_time = datetime.now()
         
-        for y in range(y_steps):
-            # 获取X轴候选
-            try:
-                candidates = self.planner.get_next_options(
-                    session_id=session_id,
-                    state=current_state,
-                    limit=x_alternatives
+        # 预取下一步候选的后台线程（get_next_options可能涉及IO）
+        prefetch = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for y in range(y_steps):
+                # 获取X轴候选（优先使用上一步预取的结果）
+                pending, prefetch = prefetch, None
+                try:
+                    if pending is not None:
+                        candidates = pending.result()
+                    else:
+                        candidates = self.planner.get_next_options(
+                            session_id=session_id,
+                            state=current_state,
+                            limit=x_alternatives
+                        )
+                except Exception as e:
+                    print(f"⚠️ Y={y} 获取候选失败: {e}")
+                    break
+                
+                if not candidates:
+                    print(f"⚠️ Y={y} 无候选方案")
+                    break
+                
+                # Y轴推进的方案（默认选中第一个候选）在场强计算前已确定，
+                # 提前推进状态，让下一步候选的获取与本步场强计算重叠
+                selected_poi = candidates[0].poi
+                try:
+                    next_state = self.planner.apply_action(
+                        current_state,
+                        selected_poi
+                    )
+                except Exception:
+                    next_state = None
+                if next_state is not None and y + 1 < y_steps:
+                    prefetch = executor.submit(
+                        self.planner.get_next_options,
+                        session_id=session_id,
+                        state=next_state,
+                        limit=x_alternatives
+                    )
+                
+                # 创建Y轴节点
+                timeline_node = TimelineNode(
+                    y_index=y,
+                    time=current_time,
+                    duration=2.0  # 默认2小时
                 )
-            except Exception as e:
-                print(f"⚠️ Y={y} 获取候选失败: {e}")
-                break
-            
-            if not candidates:
-                print(f"⚠️ Y={y} 无候选方案")
-                break
-            
-            # 创建Y轴节点
-            timeline_node = TimelineNode(
-                y_index=y,
-                time=current_time,
-                duration=2.0  # 默认2小时
-            )
-            
-            # 为每个候选计算场强（Z轴 + W轴）
-            for x, candidate in enumerate(candidates):
+                
                 # 获取当前POI（用于W轴语义-因果分析）
                 current_poi = current_state.current_location if hasattr(current_state, 'current_location') else None
                 
@@ -292,9 +488,9 @@ class ThreeDimensionalPlan:
                     'is_weekend': current_time.weekday() >= 5
                 }
                 
-                # 计算影响力场（四维：Z轴 + W轴）
-                field_strength, factors, w_details = self.influence_field.compute_field(
-                    option=candidate.poi,
+                # 一次性计算全部候选的影响力场（四维：Z轴 + W轴）
+                strengths, factors_list, w_details_list = self.influence_field.compute_field_batch(
+                    options=[candidate.poi for candidate in candidates],
                     time_point=current_time,
                     state=current_state,
                     user_profile=user_profile,
@@ -302,48 +498,49 @@ class ThreeDimensionalPlan:
                     context=context
                 )
                 
-                # 创建决策点
-                decision_point = DecisionPoint(
-                    x=x,
-                    y=y,
-                    z=field_strength,  # 四维场强（如果W轴启用）
-                    option=candidate.poi,
-                    time=current_time,
-                    duration=getattr(candidate.poi, 'average_visit_time', 2.0) or 2.0,
-                    factors=factors,
-                    status=NodeStatus.SELECTED if x == 0 else NodeStatus.ALTERNATIVE
-                )
+                for x, candidate in enumerate(candidates):
+                    # 创建决策点
+                    decision_point = DecisionPoint(
+                        x=x,
+                        y=y,
+                        z=float(strengths[x]),  # 四维场强（如果W轴启用）
+                        option=candidate.poi,
+                        time=current_time,
+                        duration=candidate.poi.average_visit_time,
+                        factors=factors_list[x] or None,
+                        status=NodeStatus.SELECTED if x == 0 else NodeStatus.ALTERNATIVE
+                    )
                 
-                # 保存W轴详情（如果有）
-                if w_details:
-                    decision_point.dimensional_4_events.append({
-                        'type': 'w_axis_analysis',
-                        'details': w_details
-                    })
+                    # 保存W轴详情（如果有）
+                    w_details = w_details_list[x]
+                    if w_details:
+                        decision_point.dimensional_4_events = [{
+                            'type': 'w_axis_analysis',
+                            'details': w_details
+                        }]
                 
-                timeline_node.decision_points.append(decision_point)
-            
-            # 设置默认选中第一个（场强最高）
-            timeline_node.selected_x = 0
-            
-            self.timeline.append(timeline_node)
-            
-            # Y轴推进：使用选中的方案更新状态
-            selected_poi = timeline_node.selected_point.option
-            try:
-                current_state = self.planner.apply_action(
-                    current_state,
-                    selected_poi
-                )
-            except:
-                # 简化状态更新
-                current_state.visited.append(selected_poi)
-                current_state.current_location = selected_poi
-            
-            # 时间推进
-            current_time += timedelta(hours=timeline_node.duration + 0.5)
-            
-            print(f"✅ Y={y} 生成完成: {len(timeline_node.decision_points)}个备选")
+                    timeline_node.decision_points.append(decision_point)
+                
+                # 设置默认选中第一个（场强最高）
+                timeline_node.selected_x = 0
+                
+                self.timeline.append(timeline_node)
+                z_values.append(timeline_node.selected_point.z)
+                
+                # Y轴推进：使用选中的方案更新状态
+                if next_state is not None:
+                    current_state = next_state
+                else:
+                    # 简化状态更新（原地修改，须在本步场强计算之后）
+                    current_state.visited.append(selected_poi)
+                    current_state.current_location = selected_poi
+                
+                # 时间推进
+                current_time += timedelta(hours=timeline_node.duration + 0.5)
+                
+                print(f"✅ Y={y} 生成完成: {len(timeline_node.decision_points)}个备选")
+        
+        self._z_buffer = np.array(z_values, dtype=np.float64)
         
         print(f"🎉 三维空间生成完成！共{len(self.timeline)}个时间节点")
         
@@ -359,8 +556,8 @@ class ThreeDimensionalPlan:
         if not self.timeline:
             raise ValueError("时间线为空，无法提交快照")
         
-        # 深拷贝（避免后续修改影响快照）
-        snapshot_nodes = copy.deepcopy(self.timeline)
+        # 提交后节点视为不可变，快照直接引用（后续修改经工作区写时复制）
+        snapshot_nodes = list(self.timeline)
         
         # 创建快照
         snapshot = StaticSnapshot(
@@ -376,8 +573,10 @@ class ThreeDimensionalPlan:
         self.snapshots.append(snapshot)
         self.current_snapshot = snapshot
         
-        # 初始化动态工作区（fork from snapshot）
-        self.working_timeline = copy.deepcopy(self.timeline)
+        # 初始化动态工作区（fork from snapshot，写时复制）
+        self.working_timeline = CoWTimeline(snapshot_nodes)
+        self._snapshot_versions = np.zeros(len(snapshot_nodes), dtype=np.int64)
+        self._working_versions = self._snapshot_versions.copy()
         
         print(f"✅ 静态快照已提交")
         print(f"   ID: {snapshot.snapshot_id[:8]}...")
@@ -405,8 +604,15 @@ class ThreeDimensionalPlan:
             return False
         
         node = timeline[y_index]
+        if timeline is self.working_timeline and 0 <= x_index < len(node.decision_points):
+            node = timeline.mutable(y_index)
         success = node.switch_to(x_index)
         
+        if success and timeline is self.timeline:
+            self._z_buffer[y_index] = node.selected_point.z
+        elif success:
+            self._mark_dirty(y_index % len(timeline))
+        
         if success:
             print(f"✅ 已切换: Y={y_index}, X={x_index}")
             print(f"   选择: {node.selected_point.option.name}")
@@ -430,18 +636,25 @@ class ThreeDimensionalPlan:
         print(f"⚙️ 动态调整: Y>={y_start}, 延迟{delay_minutes}分钟")
         
         adjusted_count = 0
-        for node in self.working_timeline[y_start:]:
-            if node.selected_point:
+        working = self.working_timeline
+        delay = timedelta(minutes=delay_minutes)
+        reason = reason or "用户延误"
+        for y in range(*slice(y_start, None).indices(len(working))):
+            if working[y].selected_point:
+                node = working.mutable(y)
+                point = node.selected_point
                 # 保存原始时间
-                if not node.selected_point.original_time:
-                    node.selected_point.original_time = node.selected_point.time
+                if not point.original_time:
+                    point.original_time = point.time
                 
                 # 调整时间
-                node.time += timedelta(minutes=delay_minutes)
-                node.selected_point.time = node.time
-                node.selected_point.is_adjusted = True
-                node.selected_point.adjustment_reason = reason or "用户延误"
-                node.selected_point.status = NodeStatus.ADJUSTED
+                node.time += delay
+                point.time = node.time
+                point.is_adjusted = True
+                point.adjustment_reason = reason
+                point.status = NodeStatus.ADJUSTED
+                point.invalidate()
+                self._working_versions[y] += 1
                 
                 adjusted_count += 1
         
@@ -460,7 +673,9 @@ class ThreeDimensionalPlan:
         
         diffs = []
         
-        for y_idx in range(min(len(self.current_snapshot.nodes), len(self.working_timeline))):
+        # 只检查版本与快照不同的Y索引，其余节点与快照一致
+        changed = np.flatnonzero(self._working_versions != self._snapshot_versions)
+        for y_idx in changed.tolist():
             static_node = self.current_snapshot.nodes[y_idx]
             working_node = self.working_timeline[y_idx]
             
@@ -497,6 +712,17 @@ class ThreeDimensionalPlan:
         
         return diffs
     
+    def _mark_dirty(self, y: int):
+        """切换备选后，按该节点与快照是否仍有差异更新版本（无差异时回落到快照版本）"""
+        static_point = self.current_snapshot.nodes[y].selected_point
+        working_point = self.working_timeline[y].selected_point
+        if static_point and working_point and (
+                static_point.option.id != working_point.option.id
+                or working_point.is_adjusted):
+            self._working_versions[y] += 1
+        else:
+            self._working_versions[y] = self._snapshot_versions[y]
+    
     def get_explanation(self, y_index: int, x_index: int) -> Dict:
         """
         获取某个决策点的深度解释（Z轴信息）
@@ -515,13 +741,6 @@ class ThreeDimensionalPlan:
         
         point = node.decision_points[x_index]
         
-        # 按贡献度排序因子
-        sorted_factors = sorted(
-            point.factors,
-            key=lambda f: f.weighted_value,
-            reverse=True
-        )
-        
         return {
             'option': {
                 'name': point.option.name,
@@ -532,17 +751,7 @@ class ThreeDimensionalPlan:
             'duration': point.duration,
             'field_strength': point.z,
             'status': point.status.value,
-            'factors': [
-                {
-                    'name': f.name,
-                    'value': f.value,
-                    'weight': f.weight,
-                    'weighted_value': f.weighted_value,
-                    'source': f.source,
-                    'explanation': f.explanation
-                }
-                for f in sorted_factors
-            ],
+            'factors': point.factor_columns.ranked(),  # 按贡献度排序
             'is_adjusted': point.is_adjusted,
             'adjustment_reason': point.adjustment_reason if point.is_adjusted else None
         }
@@ -575,17 +784,11 @@ class ThreeDimensionalPlan:
         }
     
     def _calculate_confidence(self) -> float:
-        """计算方案置信度"""
+        """计算方案置信度（基于所有选中节点的平均场强）"""
         if not self.timeline:
             return 0.0
         
-        # 基于所有选中节点的平均场强
-        field_strengths = []
-        for node in self.timeline:
-            if node.selected_point:
-                field_strengths.append(node.selected_point.z)
-        
-        if not field_strengths:
+        if not self._z_buffer.size:
             return 0.5
         
-        return sum(field_strengths) / len(field_strengths)
+        return float(_mean_strength(self._z_buffer))
@@ -3,15 +3,249 @@
 实现四项基本原则的验证逻辑
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import json
+import math
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from itertools import islice
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from src.utils.jit import njit, prange, NUMBA_AVAILABLE
+from src.utils.cache import LRUCache
 from .models import (
     Location, State, PlanningSession, NodeVerification,
-    DataSource
+    DataSource, MultiSourceResult, CleaningResult, SpatialResult, TemporalResult
 )
 
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_POI_CACHE_SIZE = 2048  # 内存中最多缓存的POI数
+_POI_CACHE_TTL = 3600  # 采集结果有效期（秒）
+# 持久化缓存中以ISO格式存储、读取时还原为datetime的字段
+_CACHE_DATETIME_KEYS = ('timestamp', 'last_update')
+EARTH_RADIUS_KM = 6371  # 地球半径（km）
+
+
+def _cache_json_default(value):
+    """持久化缓存的JSON编码：datetime转ISO字符串，NumPy标量转Python标量"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _cache_object_hook(obj: Dict) -> Dict:
+    """持久化缓存的JSON解码：还原时间字段"""
+    for key in _CACHE_DATETIME_KEYS:
+        value = obj.get(key)
+        if isinstance(value, str):
+            try:
+                obj[key] = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+    return obj
+
+
+def _dump_cached(data) -> str:
+    """采集结果序列化为JSON（不使用pickle，缓存文件被篡改也无法执行代码）"""
+    return json.dumps(data, ensure_ascii=False, default=_cache_json_default)
+
+
+def _load_cached(text):
+    """反序列化采集结果；顶层数组（评论与总数）还原为元组，无法解析时返回None"""
+    try:
+        data = json.loads(text, object_hook=_cache_object_hook)
+    except (TypeError, ValueError):
+        return None
+    return tuple(data) if isinstance(data, list) else data
+DETOUR_FACTOR = 1.3  # 实际路径 ≈ 直线距离 × 1.3（简化）
+# 小角度近似阈值：a < 1e-4（约127km以内）时 asin(√a) ≈ √a，
+# 相对误差 ≤ a/6，50km处约0.13m、127km处约2m，远小于GPS误差
+_SMALL_ANGLE_A = 1e-4
+
+# 评论关键词：中文评论没有空格分词，按标点切句后取字二元组做TF-IDF
+_KEYWORD_TOP_K = 3
+_KEYWORD_SPLIT = re.compile(r'[\W\d_]+')
+_PLACEHOLDER_KEY_POSITIVE = ('服务好', '环境好', '值得')
+_PLACEHOLDER_KEY_NEGATIVE = ('人多', '排队', '贵')
+
+
+def _keyword_preprocess(text: str) -> str:
+    """TF-IDF预处理：标点、数字替换为空格（字二元组不跨句）"""
+    return _KEYWORD_SPLIT.sub(' ', text.lower())
+
+
+_TFIDF_PARAMS = dict(
+    analyzer='char_wb', ngram_range=(2, 2), max_features=5000,
+    preprocessor=_keyword_preprocess
+)
+
+
+def _top_keywords(texts: List[str], k: int = _KEYWORD_TOP_K) -> List[str]:
+    """
+    按TF-IDF总分取一批评论的前k个关键词
+    
+    拟合会改写词表，verify可能在多个线程中并发执行，
+    因此每批使用新的向量化器（配置共享_TFIDF_PARAMS）
+    """
+    if not texts:
+        return []
+    
+    vectorizer = TfidfVectorizer(**_TFIDF_PARAMS)
+    try:
+        X = vectorizer.fit_transform(texts)
+    except ValueError:  # 全部为标点等，词表为空
+        return []
+    
+    names = vectorizer.get_feature_names_out()
+    scores = np.asarray(X.sum(axis=0)).ravel()
+    # char_wb在句首尾补空格，含空格的二元组不是完整词
+    scores[np.char.find(names.astype(str), ' ') >= 0] = -1.0
+    k = min(k, int(np.count_nonzero(scores >= 0)))
+    if k == 0:
+        return []
+    
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [str(names[i]) for i in top]
+
+
+# 空间评分 = W_DETOUR·D + W_CONNECTIVITY·C + W_GNN·G
+W_DETOUR, W_CONNECTIVITY, W_GNN = 0.4, 0.3, 0.3
+# 时间评分 = W_OPEN·O + W_CROWD·C + W_REMAINING·R
+W_OPEN, W_CROWD, W_REMAINING = 0.3, 0.4, 0.3
+
+# 最佳访问时间（TODO: 基于历史数据），默认9-11点
+_DEFAULT_OPTIMAL_TIME = (9.0, 11.0)
+# 营业时间外不预测拥挤度，取中性占位值
+_CLOSED_CROWD_LEVEL = 0.5
+
+# 各原则验证失败时的默认结果（不含列表的结果不可变，各节点共享同一实例）
+_DEFAULT_SPATIAL = SpatialResult(
+    score=0.7,
+    distance=5.0,
+    actual_distance=6.5,
+    detour_rate=0.3,
+    connectivity=1.0,
+    gnn_score=0.8
+)
+_DEFAULT_TEMPORAL = TemporalResult(
+    score=0.7,
+    is_open=True,
+    crowd_level=0.5,
+    time_sufficient=True,
+    remaining_time=10.0,
+    required_time=2.0,
+    optimal_time=_DEFAULT_OPTIMAL_TIME
+)
+
+
+# 不开启fastmath：重合点的距离需严格为0（绕路率据此取0）
+@njit(cache=True)
+def _haversine_nb(rlat1, rlon1, cos1, rlat2, rlon2, cos2):
+    """
+    两点球面距离（km，Haversine公式）；未安装numba时即纯Python实现
+    
+    坐标以弧度传入，cos1/cos2为对应纬度的余弦（由Location缓存）
+    """
+    dlat = rlat2 - rlat1
+    dlon = rlon2 - rlon1
+    
+    a = (math.sin(dlat / 2) ** 2 +
+         cos1 * cos2 * math.sin(dlon / 2) ** 2)
+    if a < _SMALL_ANGLE_A:
+        return EARTH_RADIUS_KM * (2 * math.sqrt(a))
+    return EARTH_RADIUS_KM * (2 * math.asin(math.sqrt(min(a, 1.0))))
+
+
+@njit(cache=True)
+def _spatial_score_nb(rlat1, rlon1, cos1, rlat2, rlon2, cos2, connectivity, gnn_score):
+    """
+    原则3的数值部分（球面距离、绕路率、综合评分）融合为一个内核
+    
+    Returns:
+        (score, direct_dist, actual_dist, detour_rate)
+    """
+    direct_dist = _haversine_nb(rlat1, rlon1, cos1, rlat2, rlon2, cos2)
+    actual_dist = direct_dist * DETOUR_FACTOR
+    
+    detour_rate = (actual_dist / direct_dist - 1) if direct_dist > 0 else 0.0
+    detour_rate = max(0.0, detour_rate)
+    D = 1 - min(detour_rate, 1.0)
+    
+    score = W_DETOUR * D + W_CONNECTIVITY * connectivity + W_GNN * gnn_score
+    return min(1.0, max(0.0, score)), direct_dist, actual_dist, detour_rate
+
+
+@njit(cache=True)
+def _temporal_score_nb(open_flag, crowd_level, remaining, required):
+    """原则4的数值部分：营业、拥挤度与时间充足性的综合评分"""
+    R = min(remaining / required, 1.0) if required > 0 else 0.0
+    score = W_OPEN * open_flag + W_CROWD * (1 - crowd_level) + W_REMAINING * R
+    return min(1.0, max(0.0, score))
+
+
+@njit(parallel=True, cache=True)
+def _haversine_batch_kernel(lat0, lon0, lats, lons):
+    """从一点到多点的球面距离内核（Numba并行），与_haversine_batch_numpy一致"""
+    n = lats.shape[0]
+    out = np.empty(n)
+    rlat0 = math.radians(lat0)
+    rlon0 = math.radians(lon0)
+    cos0 = math.cos(rlat0)
+    for i in prange(n):
+        rlat = math.radians(lats[i])
+        dlat = rlat - rlat0
+        dlon = math.radians(lons[i]) - rlon0
+        a = math.sin(dlat / 2) ** 2 + cos0 * math.cos(rlat) * math.sin(dlon / 2) ** 2
+        if a < _SMALL_ANGLE_A:
+            out[i] = EARTH_RADIUS_KM * (2 * math.sqrt(a))
+        else:
+            out[i] = EARTH_RADIUS_KM * (2 * math.asin(math.sqrt(min(a, 1.0))))
+    return out
+
+
+def _haversine_batch_numpy(lat0: float, lon0: float,
+                           lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """从一点到多点的球面距离（km，NumPy降级版），与_haversine_nb逐点一致"""
+    rlat0, rlon0 = np.radians(lat0), np.radians(lon0)
+    cos0 = np.cos(rlat0)
+    rlats = np.radians(lats)
+    dlat = rlats - rlat0
+    dlon = np.radians(lons) - rlon0
+    
+    a = np.sin(dlat / 2) ** 2 + cos0 * np.cos(rlats) * np.sin(dlon / 2) ** 2
+    c = 2 * np.sqrt(a)
+    far = a >= _SMALL_ANGLE_A
+    if far.any():
+        c[far] = 2 * np.arcsin(np.sqrt(np.minimum(a[far], 1.0)))
+    return EARTH_RADIUS_KM * c
+
+
+if NUMBA_AVAILABLE:
+    _haversine_batch = _haversine_batch_kernel
+    # 导入时预热一次，避免首个规划请求承担JIT编译开销
+    _haversine_nb(0.0, 0.0, 1.0, 0.0, 0.0, 1.0)
+    _spatial_score_nb(0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 1.0, 0.8)
+    _temporal_score_nb(1.0, 0.4, 1.0, 1.0)
+    _haversine_batch(0.0, 0.0, np.zeros(1), np.zeros(1))
+else:
+    _haversine_batch = _haversine_batch_numpy
+
 
 class VerificationEngine:
     """
@@ -26,7 +260,10 @@ class VerificationEngine:
     def __init__(self,
                  multi_source_collector,
                  neural_net_service,
-                 gaode_api_client):
+                 gaode_api_client,
+                 cache_path: Optional[str] = None,
+                 cache_ttl: float = _POI_CACHE_TTL,
+                 workers: int = 4):
         """
         初始化验证引擎
         
@@ -34,17 +271,41 @@ class VerificationEngine:
             multi_source_collector: 多源数据采集器
             neural_net_service: 神经网络服务
             gaode_api_client: 高德API客户端
+            cache_path: 采集结果的SQLite持久化缓存路径（None则只缓存在内存）
+            cache_ttl: 采集结果有效期（秒），过期后重新采集
+            workers: 并发执行各原则验证的线程数（<=1时顺序执行）
         """
         self.collector = multi_source_collector
         self.nn_service = neural_net_service
         self.gaode_api = gaode_api_client
         
+        # 采集结果缓存（按node.id）：值为(采集时间戳, 数据)
+        self.cache_ttl = cache_ttl
+        self._ms_cache = LRUCache(maxsize=_POI_CACHE_SIZE)
+        self._rev_cache = LRUCache(maxsize=_POI_CACHE_SIZE)
+        self._db = None
+        self._db_lock = threading.Lock()
+        if cache_path:
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS poi_cache ("
+                "id TEXT PRIMARY KEY, "
+                "sources TEXT, sources_ts INTEGER, "
+                "reviews TEXT, reviews_ts INTEGER)"
+            )
+            self._db.commit()
+        
+        # 各原则验证以I/O等待为主（采集器、高德API、模型服务），并发执行
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        
         # 配置
         self.config = {
             'consistency_threshold': 0.8,
             'fake_threshold': 0.3,
             'min_reviews': 10,
             'crowd_threshold': 0.7,
+            'review_sample_size': 500,  # 评论超过该数量时均匀抽样后再做模型推理
+            'max_reviews': 2000,  # 单个POI最多拉取的评论条数（超出部分不再读取）
         }
     
     def verify(self,
@@ -64,52 +325,134 @@ class VerificationEngine:
         Returns:
             验证结果
         """
-        # 原则1: 多源数据交叉验证
-        multi_source_result = self._multi_source_verification(node)
+        now = datetime.now()  # 本次验证中各数据源共用的更新时间
+        
+        if self._pool is None:
+            # 原则1: 多源数据交叉验证
+            multi_source_result = self._multi_source_verification(node, now)
+            
+            # 原则2: 大数据清洗
+            cleaned_result = self._data_cleaning(node, multi_source_result)
+            
+            # 原则3: 空间合理性验证
+            spatial_result = self._spatial_verification(node, state)
+            
+            # 原则4: 时间合理性验证
+            temporal_result = self._temporal_verification(node, state, session)
+        else:
+            # 原则1、3、4互不依赖，并发执行；原则2依赖原则1的结果，在当前线程执行
+            multi_source_future = self._pool.submit(self._multi_source_verification, node, now)
+            spatial_future = self._pool.submit(self._spatial_verification, node, state)
+            temporal_future = self._pool.submit(self._temporal_verification, node, state, session)
+            
+            multi_source_result = multi_source_future.result()
+            cleaned_result = self._data_cleaning(node, multi_source_result)
+            spatial_result = spatial_future.result()
+            temporal_result = temporal_future.result()
+        
+        return self._build_verification(
+            multi_source_result, cleaned_result, spatial_result, temporal_result
+        )
+    
+    def verify_batch(self,
+                    nodes: List[Location],
+                    state: State,
+                    session: PlanningSession) -> List[NodeVerification]:
+        """
+        批量验证流程
         
-        # 原则2: 大数据清洗
-        cleaned_result = self._data_cleaning(node, multi_source_result)
+        与逐个调用verify结果一致；原则3的距离与评分对全部节点
+        一次向量化计算，其余原则逐节点执行（启用线程池时各节点的
+        原则1+2与原则4并发）
+        
+        Args:
+            nodes: 待验证的节点列表
+            state: 当前状态
+            session: 规划会话
+            
+        Returns:
+            与nodes一一对应的验证结果
+        """
+        now = datetime.now()  # 整批验证共用的数据源更新时间
         
-        # 原则3: 空间合理性验证
-        spatial_result = self._spatial_verification(node, state)
+        if self._pool is None:
+            review_results = (
+                self._review_verification(node, now) for node in nodes
+            )
+            temporal_results = (
+                self._temporal_verification(node, state, session) for node in nodes
+            )
+        else:
+            # 原则1、2（按节点串联）与原则4提交线程池，空间验证在当前线程向量化计算的同时进行
+            review_futures = [
+                self._pool.submit(self._review_verification, node, now)
+                for node in nodes
+            ]
+            temporal_futures = [
+                self._pool.submit(self._temporal_verification, node, state, session)
+                for node in nodes
+            ]
+            review_results = (future.result() for future in review_futures)
+            temporal_results = (future.result() for future in temporal_futures)
         
-        # 原则4: 时间合理性验证
-        temporal_result = self._temporal_verification(node, state, session)
+        spatial_results = self._spatial_verification_batch(nodes, state)
         
-        # 构建验证数据
+        return [
+            self._build_verification(
+                multi_source_result, cleaned_result, spatial_result, temporal_result
+            )
+            for (multi_source_result, cleaned_result), spatial_result, temporal_result
+            in zip(review_results, spatial_results, temporal_results)
+        ]
+    
+    def _review_verification(self,
+                            node: Location,
+                            now: datetime) -> Tuple[MultiSourceResult, CleaningResult]:
+        """原则1与原则2：原则2依赖原则1的结果，同一节点内顺序执行"""
+        multi_source_result = self._multi_source_verification(node, now)
+        return multi_source_result, self._data_cleaning(node, multi_source_result)
+    
+    def _build_verification(self,
+                           multi_source_result: MultiSourceResult,
+                           cleaned_result: CleaningResult,
+                           spatial_result: SpatialResult,
+                           temporal_result: TemporalResult) -> NodeVerification:
+        """由四项原则的结果构建验证数据"""
         verification = NodeVerification(
             # 原则1
-            data_sources=multi_source_result['sources'],
-            consistency_score=multi_source_result['consistency'],
-            weighted_rating=multi_source_result['weighted_rating'],
-            rating_variance=multi_source_result['variance'],
+            data_sources=multi_source_result.sources,
+            consistency_score=multi_source_result.consistency,
+            weighted_rating=multi_source_result.weighted_rating,
+            rating_variance=multi_source_result.variance,
             
             # 原则2
-            total_reviews=cleaned_result['total_reviews'],
-            valid_reviews=cleaned_result['valid_reviews'],
-            fake_rate=cleaned_result['fake_rate'],
-            positive_rate=cleaned_result['positive_rate'],
-            negative_rate=cleaned_result['negative_rate'],
-            key_positive_words=cleaned_result['key_positive'],
-            key_negative_words=cleaned_result['key_negative'],
+            total_reviews=cleaned_result.total_reviews,
+            valid_reviews=cleaned_result.valid_reviews,
+            fake_rate=cleaned_result.fake_rate,
+            positive_rate=cleaned_result.positive_rate,
+            negative_rate=cleaned_result.negative_rate,
+            key_positive_words=cleaned_result.key_positive,
+            key_negative_words=cleaned_result.key_negative,
             
             # 原则3
-            spatial_score=spatial_result['score'],
-            distance_from_current=spatial_result['distance'],
-            detour_rate=spatial_result['detour_rate'],
-            connectivity_score=spatial_result['connectivity'],
+            spatial_score=spatial_result.score,
+            distance_from_current=spatial_result.distance,
+            detour_rate=spatial_result.detour_rate,
+            connectivity_score=spatial_result.connectivity,
             
             # 原则4
-            temporal_score=temporal_result['score'],
-            is_open=temporal_result['is_open'],
-            predicted_crowd_level=temporal_result['crowd_level'],
-            optimal_visit_time=temporal_result['optimal_time'],
-            time_sufficient=temporal_result['time_sufficient']
+            temporal_score=temporal_result.score,
+            is_open=temporal_result.is_open,
+            predicted_crowd_level=temporal_result.crowd_level,
+            optimal_visit_time=temporal_result.optimal_time,
+            time_sufficient=temporal_result.time_sufficient
         )
         
         return verification
     
-    def _multi_source_verification(self, node: Location) -> Dict:
+    def _multi_source_verification(self,
+                                   node: Location,
+                                   now: Optional[datetime] = None) -> MultiSourceResult:
         """
         原则1: 多源数据交叉验证
         
@@ -124,74 +467,88 @@ class VerificationEngine:
         
         Args:
             node: POI节点
+            now: 数据源的更新时间（由verify统一取一次，None时取当前时间）
             
         Returns:
-            验证结果字典
+            多源验证结果
         """
         try:
             # 1. 收集多源数据
-            sources_data = self.collector.collect_multi_source(node)
+            sources_data = self._get_sources(node)
             
-            # 构建数据源列表
-            sources = []
-            ratings = []
+            # 收集数据源的同时单遍累积统计量（Welford均值/方差、Σ(w·r·c)、Σw），
+            # 数据源通常只有几个，不再为两次归约构建数组；DataSource对象在返回时才构建
+            names, entries, _w, _c = [], [], [], []
+            n = 0
+            mu = m2 = 0.0
+            sum_rwc = total_weight = 0.0
             
             for source_name, data in sources_data.items():
                 if data and 'rating' in data:
-                    ds = DataSource(
-                        name=source_name,
-                        rating=data['rating'],
-                        review_count=data.get('review_count', 0),
-                        last_update=datetime.now(),
-                        weight=data.get('weight', 0.33),
-                        credibility=data.get('credibility', 1.0)
-                    )
-                    sources.append(ds)
-                    ratings.append(data['rating'])
-            
-            if not ratings:
+                    rating = data['rating']
+                    weight = data.get('weight', 0.33)
+                    credibility = data.get('credibility', 1.0)
+                    names.append(source_name)
+                    entries.append(data)
+                    _w.append(weight)
+                    _c.append(credibility)
+                    
+                    n += 1
+                    delta = rating - mu
+                    mu += delta / n
+                    m2 += (rating - mu) * delta
+                    sum_rwc += rating * weight * credibility
+                    total_weight += weight
+            
+            if n == 0:
                 # 没有数据源，返回默认值
                 return self._default_multi_source_result()
             
             # 2. 计算一致性
-            ratings_array = np.array(ratings)
-            mu = np.mean(ratings_array)
-            sigma = np.std(ratings_array)
+            variance = m2 / n
+            sigma = math.sqrt(variance)
             
             # Consistency = 1 - σ/μ
             consistency = 1 - (sigma / mu if mu > 0 else 1.0)
-            consistency = max(0.0, min(1.0, consistency))  # 限制在[0, 1]
+            consistency = min(1.0, max(0.0, consistency))  # 限制在[0, 1]
             
             # 3. 加权融合
-            weighted_rating = sum(
-                ds.rating * ds.weight * ds.credibility 
-                for ds in sources
+            weighted_rating = sum_rwc / total_weight if total_weight > 0 else sum_rwc
+            
+            now = now or datetime.now()
+            sources = [
+                DataSource(
+                    name=name,
+                    rating=data['rating'],
+                    review_count=data.get('review_count', 0),
+                    last_update=now,
+                    weight=weight,
+                    credibility=credibility
+                )
+                for name, data, weight, credibility in zip(names, entries, _w, _c)
+            ]
+            
+            return MultiSourceResult(
+                sources=sources,
+                consistency=consistency,
+                weighted_rating=weighted_rating,
+                mu=mu,
+                sigma=sigma,
+                variance=variance
             )
-            total_weight = sum(ds.weight for ds in sources)
-            if total_weight > 0:
-                weighted_rating /= total_weight
-            
-            return {
-                'sources': sources,
-                'consistency': consistency,
-                'weighted_rating': weighted_rating,
-                'mu': mu,
-                'sigma': sigma,
-                'variance': sigma ** 2
-            }
-            
-        except Exception as e:
-            print(f"Multi-source verification error: {e}")
+            
+        except Exception:
+            logger.warning("Multi-source verification failed for %s", node.id, exc_info=True)
             return self._default_multi_source_result()
     
     def _data_cleaning(self,
                       node: Location,
-                      multi_source_result: Dict) -> Dict:
+                      multi_source_result: MultiSourceResult) -> CleaningResult:
         """
         原则2: 大数据清洗
         
         算法:
-        1. 收集所有评论
+        1. 收集评论（最多max_reviews条，超过review_sample_size条时均匀抽样）
         2. 使用神经网络检测虚假评论
         3. 过滤虚假评论
         4. 情感分析提取正负面
@@ -201,78 +558,113 @@ class VerificationEngine:
             multi_source_result: 多源验证结果
             
         Returns:
-            清洗结果字典
+            清洗结果
         """
         try:
             # 1. 收集评论
-            all_reviews = self.collector.collect_reviews(node)
+            all_reviews, total_reviews = self._get_reviews(node) or ((), 0)
             
-            if not all_reviews or len(all_reviews) < self.config['min_reviews']:
+            if len(all_reviews) < self.config['min_reviews']:
                 return self._default_cleaning_result()
             
-            # 2. 检测虚假评论（神经网络）
+            # 评论过多时均匀抽样，虚假率与情感比例按样本估计
+            sample_size = self.config['review_sample_size']
+            if len(all_reviews) > sample_size:
+                sample = random.sample(all_reviews, sample_size)
+            else:
+                sample = all_reviews
+            
+            # 2. 检测虚假评论（神经网络，整批一次推理）
+            texts = [review.get('text', '') for review in sample]
             if self.nn_service:
-                fake_scores = []
-                for review in all_reviews:
-                    try:
-                        score = self.nn_service.detect_fake(review['text'])
-                        fake_scores.append(score)
-                    except:
-                        fake_scores.append(0.0)  # 默认认为真实
+                fake_scores = self._infer_batch(
+                    texts, 'detect_fake_batch', 'detect_fake', 0.0  # 默认认为真实
+                )
             else:
-                fake_scores = [0.0] * len(all_reviews)
+                fake_scores = np.zeros(len(sample))
             
             # 3. 过滤虚假评论
-            threshold = self.config['fake_threshold']
-            valid_reviews = [
-                review for review, score in zip(all_reviews, fake_scores)
-                if score <= threshold
-            ]
+            valid_mask = fake_scores <= self.config['fake_threshold']
+            valid_texts = [text for text, valid in zip(texts, valid_mask) if valid]
             
-            fake_rate = 1 - len(valid_reviews) / len(all_reviews)
+            fake_rate = 1 - len(valid_texts) / len(sample)
+            if sample is all_reviews and total_reviews == len(all_reviews):
+                valid_count = len(valid_texts)
+            else:
+                valid_count = int((1 - fake_rate) * total_reviews)
             
             # 4. 情感分析
-            if self.nn_service and valid_reviews:
-                sentiments = []
-                for review in valid_reviews:
-                    try:
-                        sentiment = self.nn_service.sentiment_analysis(
-                            review['text']
-                        )
-                        sentiments.append(sentiment)
-                    except:
-                        sentiments.append(0.5)  # 默认中性
-                
-                positive_count = sum(1 for s in sentiments if s > 0.6)
-                negative_count = sum(1 for s in sentiments if s < 0.4)
+            if self.nn_service and valid_texts:
+                sentiments = self._infer_batch(
+                    valid_texts, 'sentiment_analysis_batch', 'sentiment_analysis', 0.5  # 默认中性
+                )
                 
-                positive_rate = positive_count / len(sentiments)
-                negative_rate = negative_count / len(sentiments)
+                # 阈值比较在float64上进行：转float32会把恰为0.6的分数抬到阈值之上
+                positive_mask = sentiments > 0.6
+                negative_mask = sentiments < 0.4
+                positive_rate = float(positive_mask.mean())
+                negative_rate = float(negative_mask.mean())
             else:
+                positive_mask = negative_mask = None
                 positive_rate = 0.7  # 默认值
                 negative_rate = 0.1
             
-            # 5. 提取关键词（TODO: 使用NLP）
-            key_positive = ['服务好', '环境好', '值得']
-            key_negative = ['人多', '排队', '贵']
-            
-            return {
-                'total_reviews': len(all_reviews),
-                'valid_reviews': len(valid_reviews),
-                'fake_rate': fake_rate,
-                'positive_rate': positive_rate,
-                'negative_rate': negative_rate,
-                'key_positive': key_positive,
-                'key_negative': key_negative
-            }
-            
-        except Exception as e:
-            print(f"Data cleaning error: {e}")
+            # 5. 提取关键词（正/负面评论分别做TF-IDF；无情感结果或未安装sklearn时用占位词）
+            if SKLEARN_AVAILABLE and positive_mask is not None:
+                key_positive = _top_keywords(
+                    [text for text, hit in zip(valid_texts, positive_mask) if hit]
+                )
+                key_negative = _top_keywords(
+                    [text for text, hit in zip(valid_texts, negative_mask) if hit]
+                )
+            else:
+                key_positive = list(_PLACEHOLDER_KEY_POSITIVE)
+                key_negative = list(_PLACEHOLDER_KEY_NEGATIVE)
+            
+            return CleaningResult(
+                total_reviews=total_reviews,
+                valid_reviews=valid_count,
+                fake_rate=fake_rate,
+                positive_rate=positive_rate,
+                negative_rate=negative_rate,
+                key_positive=key_positive,
+                key_negative=key_negative
+            )
+            
+        except Exception:
+            logger.warning("Data cleaning failed for %s", node.id, exc_info=True)
             return self._default_cleaning_result()
     
+    def _infer_batch(self,
+                    texts: List[str],
+                    batch_method: str,
+                    scalar_method: str,
+                    default: float) -> np.ndarray:
+        """
+        对一批文本做一次模型推理
+        
+        优先调用服务的批量接口；服务只有逐条接口或批量推理失败时
+        逐条调用，单条失败取default
+        """
+        batch_fn = getattr(self.nn_service, batch_method, None)
+        if batch_fn is not None:
+            try:
+                return np.asarray(batch_fn(texts), dtype=np.float64)
+            except Exception:
+                pass
+        
+        scores = np.full(len(texts), default)
+        scalar_fn = getattr(self.nn_service, scalar_method)
+        for i, text in enumerate(texts):
+            try:
+                scores[i] = scalar_fn(text)
+            except:
+                pass
+        return scores
+    
     def _spatial_verification(self,
                              node: Location,
-                             state: State) -> Dict:
+                             state: State) -> SpatialResult:
         """
         原则3: 空间合理性验证
         
@@ -299,24 +691,10 @@ class VerificationEngine:
         current = state.current_location
         
         try:
-            # 1. 计算直线距离
-            direct_dist = self._haversine(current, node)
-            
-            # 2. 获取实际路径（调用高德API）
-            # TODO: 实际调用高德API
-            actual_dist = direct_dist * 1.3  # 简化：直线距离 * 1.3
-            
-            # 3. 计算绕路率
-            detour_rate = (actual_dist / direct_dist - 1) if direct_dist > 0 else 0
-            detour_rate = max(0.0, detour_rate)
-            
-            # 4. 绕路分数（绕路越少分数越高）
-            D = 1 - min(detour_rate, 1.0)
-            
-            # 5. 连通性评分（简化：假设都连通）
+            # 连通性评分（简化：假设都连通）
             connectivity = 1.0
             
-            # 6. GNN空间关系评分（可选）
+            # GNN空间关系评分（可选）
             if self.nn_service:
                 try:
                     gnn_score = self.nn_service.gnn_spatial(current, node)
@@ -325,34 +703,102 @@ class VerificationEngine:
             else:
                 gnn_score = 0.8
             
+            # 直线距离、实际路径（简化：直线距离 * 1.3，TODO: 调用高德API）、
+            # 绕路率与综合评分由一个内核完成
+            _, _, rlat1, rlon1, cos1 = current.coord_trig()
+            _, _, rlat2, rlon2, cos2 = node.coord_trig()
+            score, direct_dist, actual_dist, detour_rate = _spatial_score_nb(
+                rlat1, rlon1, cos1, rlat2, rlon2, cos2, connectivity, float(gnn_score)
+            )
+            
+            return SpatialResult(
+                score=score,
+                distance=direct_dist,
+                actual_distance=actual_dist,
+                detour_rate=detour_rate,
+                connectivity=connectivity,
+                gnn_score=gnn_score
+            )
+            
+        except Exception:
+            logger.warning("Spatial verification failed for %s", node.id, exc_info=True)
+            return self._default_spatial_result()
+    
+    def _spatial_verification_batch(self,
+                                   nodes: List[Location],
+                                   state: State) -> List[SpatialResult]:
+        """
+        原则3的批量版本
+        
+        直线距离、绕路率与综合评分按数组逐元素计算，
+        模型与_spatial_verification相同；GNN评分仍逐节点调用
+        
+        Args:
+            nodes: POI节点列表
+            state: 当前状态
+            
+        Returns:
+            与nodes一一对应的空间验证结果
+        """
+        current = state.current_location
+        n = len(nodes)
+        
+        try:
+            # 1. 计算直线距离
+            lats = np.fromiter((node.lat for node in nodes), dtype=np.float64, count=n)
+            lons = np.fromiter((node.lon for node in nodes), dtype=np.float64, count=n)
+            direct_dist = _haversine_batch(current.lat, current.lon, lats, lons)
+            
+            # 2-4. 实际路径、绕路率与绕路分数
+            actual_dist = direct_dist * DETOUR_FACTOR
+            positive = direct_dist > 0
+            detour_rate = np.zeros(n)
+            np.divide(actual_dist, direct_dist, out=detour_rate, where=positive)
+            detour_rate = np.where(positive, np.maximum(detour_rate - 1, 0.0), 0.0)
+            D = 1 - np.minimum(detour_rate, 1.0)
+            
+            # 5. 连通性评分（简化：假设都连通）
+            connectivity = 1.0
+            
+            # 6. GNN空间关系评分（可选）
+            gnn_scores = np.full(n, 0.8)
+            if self.nn_service:
+                for i, node in enumerate(nodes):
+                    try:
+                        gnn_scores[i] = self.nn_service.gnn_spatial(current, node)
+                    except:
+                        pass
+            
             # 7. 综合评分
-            score = 0.4 * D + 0.3 * connectivity + 0.3 * gnn_score
-            score = max(0.0, min(1.0, score))
-            
-            return {
-                'score': score,
-                'distance': direct_dist,
-                'actual_distance': actual_dist,
-                'detour_rate': detour_rate,
-                'connectivity': connectivity,
-                'gnn_score': gnn_score
-            }
-            
-        except Exception as e:
-            print(f"Spatial verification error: {e}")
-            return {
-                'score': 0.7,
-                'distance': 5.0,
-                'actual_distance': 6.5,
-                'detour_rate': 0.3,
-                'connectivity': 1.0,
-                'gnn_score': 0.8
-            }
+            # 在同一数组上累加并原地截断到[0, 1]，不再分配中间数组
+            scores = np.multiply(D, W_DETOUR)
+            scores += W_CONNECTIVITY * connectivity
+            scores += W_GNN * gnn_scores
+            np.clip(scores, 0.0, 1.0, out=scores)
+            
+            return [
+                SpatialResult(
+                    score=score,
+                    distance=dist,
+                    actual_distance=actual,
+                    detour_rate=detour,
+                    connectivity=connectivity,
+                    gnn_score=gnn
+                )
+                for score, dist, actual, detour, gnn in zip(
+                    scores.tolist(), direct_dist.tolist(), actual_dist.tolist(),
+                    detour_rate.tolist(), gnn_scores.tolist()
+                )
+            ]
+            
+        except Exception:
+            logger.warning("Batch spatial verification failed", exc_info=True)
+            return [self._default_spatial_result()] * n
     
     def _temporal_verification(self,
                               node: Location,
                               state: State,
-                              session: PlanningSession) -> Dict:
+                              session: PlanningSession) -> TemporalResult:
         """
         原则4: 时间合理性验证
         
@@ -364,7 +810,7 @@ class VerificationEngine:
             R = remaining_time / required_time # 时间充足
         
         算法:
-        1. 检查营业时间
+        1. 检查营业时间（未营业时直接记0分，不调用LSTM）
         2. LSTM预测拥挤度
         3. 计算时间充足性
         
@@ -380,7 +826,20 @@ class VerificationEngine:
             # 1. 检查营业时间
             arrival_time = state.current_time
             is_open = node.is_open(arrival_time)
-            O = 1.0 if is_open else 0.0
+            
+            remaining = session.duration - state.current_time
+            required = node.average_visit_time + 1.0  # 加上交通时间
+            
+            if not is_open:
+                return TemporalResult(
+                    score=0.0,
+                    is_open=False,
+                    crowd_level=_CLOSED_CROWD_LEVEL,
+                    time_sufficient=remaining >= required,
+                    remaining_time=remaining,
+                    required_time=required,
+                    optimal_time=_DEFAULT_OPTIMAL_TIME
+                )
             
             # 2. 预测拥挤度（LSTM）
             if self.nn_service:
@@ -393,81 +852,156 @@ class VerificationEngine:
             else:
                 crowd_level = 0.4
             
-            C = 1 - crowd_level
-            
             # 3. 时间充足性
-            remaining = session.duration - state.current_time
-            required = node.average_visit_time + 1.0  # 加上交通时间
-            
             time_sufficient = remaining >= required
-            R = min(remaining / required, 1.0) if required > 0 else 0.0
             
             # 4. 综合评分
-            score = 0.3 * O + 0.4 * C + 0.3 * R
-            score = max(0.0, min(1.0, score))
-            
-            # 5. 最佳访问时间（TODO: 基于历史数据）
-            optimal_time = (9.0, 11.0)  # 默认9-11点
-            
-            return {
-                'score': score,
-                'is_open': is_open,
-                'crowd_level': crowd_level,
-                'time_sufficient': time_sufficient,
-                'remaining_time': remaining,
-                'required_time': required,
-                'optimal_time': optimal_time
-            }
-            
-        except Exception as e:
-            print(f"Temporal verification error: {e}")
-            return {
-                'score': 0.7,
-                'is_open': True,
-                'crowd_level': 0.5,
-                'time_sufficient': True,
-                'remaining_time': 10.0,
-                'required_time': 2.0,
-                'optimal_time': (9.0, 11.0)
-            }
+            score = _temporal_score_nb(
+                1.0, float(crowd_level), float(remaining), float(required)
+            )
+            
+            return TemporalResult(
+                score=score,
+                is_open=is_open,
+                crowd_level=crowd_level,
+                time_sufficient=time_sufficient,
+                remaining_time=remaining,
+                required_time=required,
+                optimal_time=_DEFAULT_OPTIMAL_TIME
+            )
+            
+        except Exception:
+            logger.warning("Temporal verification failed for %s", node.id, exc_info=True)
+            return _DEFAULT_TEMPORAL
     
-    def _haversine(self, loc1: Location, loc2: Location) -> float:
-        """计算球面距离（Haversine公式）"""
-        import math
+    def _get_sources(self, node: Location) -> Dict:
+        """多源数据（先查缓存，未命中或过期时调用采集器）"""
+        return self._cached_collect(
+            node, self._ms_cache, 'sources', self.collector.collect_multi_source
+        )
+    
+    def _get_reviews(self, node: Location) -> Tuple[List[Dict], int]:
+        """评论数据及评论总数（先查缓存，未命中或过期时调用采集器）"""
+        return self._cached_collect(
+            node, self._rev_cache, 'reviews', self._fetch_reviews
+        )
+    
+    def _fetch_reviews(self, node: Location) -> Tuple[List[Dict], int]:
+        """
+        从采集器拉取至多max_reviews条评论
         
-        R = 6371  # 地球半径（km）
+        采集器提供iter_reviews时逐条读取、达到上限即停止；
+        评论总数优先取采集器的review_count元数据，没有时按已拉取条数计
+        """
+        iter_reviews = getattr(self.collector, 'iter_reviews', None)
+        source = iter_reviews(node) if iter_reviews else self.collector.collect_reviews(node)
+        reviews = list(islice(source, self.config['max_reviews']))
+        if not reviews:
+            return ()
         
-        lat1, lon1 = math.radians(loc1.lat), math.radians(loc1.lon)
-        lat2, lon2 = math.radians(loc2.lat), math.radians(loc2.lon)
+        total = len(reviews)
+        review_count = getattr(self.collector, 'review_count', None)
+        if review_count is not None:
+            try:
+                total = max(int(review_count(node)), total)
+            except Exception:
+                logger.debug("review_count unavailable for %s", node.id, exc_info=True)
+        return reviews, total
+    
+    def _cached_collect(self, node: Location, cache: LRUCache, column: str, collect):
+        """
+        按node.id缓存采集结果
         
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+        依次查内存LRU、SQLite持久化缓存（JSON格式，无法解析的记录视为未命中），
+        均未命中（或已过期）时调用collect，非空结果写回两级缓存；
+        采集器抛出的异常原样上抛
+        """
+        now = time.time()
+        entry = cache.get(node.id)
+        if entry is not None and now - entry[0] < self.cache_ttl:
+            return entry[1]
         
-        a = (math.sin(dlat / 2) ** 2 + 
-             math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2)
-        c = 2 * math.asin(math.sqrt(a))
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    f"SELECT {column}, {column}_ts FROM poi_cache WHERE id = ?",
+                    (node.id,)
+                ).fetchone()
+            if row and row[0] is not None and now - row[1] < self.cache_ttl:
+                data = _load_cached(row[0])
+                if data:
+                    cache.put(node.id, (row[1], data))
+                    return data
         
-        return R * c
+        data = collect(node)
+        if data:
+            cache.put(node.id, (now, data))
+            if self._db is not None:
+                try:
+                    text = _dump_cached(data)
+                except (TypeError, ValueError):
+                    # 含无法JSON序列化的值时只缓存在内存
+                    logger.debug("collected %s for %s not JSON serializable",
+                                 column, node.id, exc_info=True)
+                else:
+                    with self._db_lock:
+                        self._db.execute(
+                            f"INSERT INTO poi_cache (id, {column}, {column}_ts) VALUES (?, ?, ?) "
+                            f"ON CONFLICT(id) DO UPDATE SET "
+                            f"{column} = excluded.{column}, {column}_ts = excluded.{column}_ts",
+                            (node.id, text, int(now))
+                        )
+                        self._db.commit()
+        return data
     
-    def _default_multi_source_result(self) -> Dict:
-        """默认多源验证结果"""
-        return {
-            'sources': [],
-            'consistency': 0.7,
-            'weighted_rating': 4.0,
-            'mu': 4.0,
-            'sigma': 0.3,
-            'variance': 0.09
-        }
+    def close(self):
+        """释放线程池与持久化缓存连接"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
     
-    def _default_cleaning_result(self) -> Dict:
-        """默认数据清洗结果"""
-        return {
-            'total_reviews': 0,
-            'valid_reviews': 0,
-            'fake_rate': 0.0,
-            'positive_rate': 0.7,
-            'negative_rate': 0.1,
-            'key_positive': [],
-            'key_negative': []
-        }
+    def clear_cache(self):
+        """清空采集结果缓存（内存与持久化）"""
+        self._ms_cache.clear()
+        self._rev_cache.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM poi_cache")
+                self._db.commit()
+    
+    def _haversine(self, loc1: Location, loc2: Location) -> float:
+        """计算球面距离（Haversine公式）"""
+        _, _, rlat1, rlon1, cos1 = loc1.coord_trig()
+        _, _, rlat2, rlon2, cos2 = loc2.coord_trig()
+        return _haversine_nb(rlat1, rlon1, cos1, rlat2, rlon2, cos2)
+    
+    def _default_multi_source_result(self) -> MultiSourceResult:
+        """默认多源验证结果（数据源列表每次新建）"""
+        return MultiSourceResult(
+            sources=[],
+            consistency=0.7,
+            weighted_rating=4.0,
+            mu=4.0,
+            sigma=0.3,
+            variance=0.09
+        )
+    
+    def _default_spatial_result(self) -> SpatialResult:
+        """默认空间验证结果（各节点共享）"""
+        return _DEFAULT_SPATIAL
+    
+    def _default_cleaning_result(self) -> CleaningResult:
+        """默认数据清洗结果（关键词列表每次新建）"""
+        return CleaningResult(
+            total_reviews=0,
+            valid_reviews=0,
+            fake_rate=0.0,
+            positive_rate=0.7,
+            negative_rate=0.1,
+            key_positive=[],
+            key_negative=[]
+        )
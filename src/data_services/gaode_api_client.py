@@ -4,11 +4,106 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Optional, Tuple
 import hashlib
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
+import numpy as np
+
+from ..utils.cache import LRUCache
+from ..utils.jit import njit, NUMBA_AVAILABLE
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+# 429响应按Retry-After等待的上限（请求超时的倍数），超过则不再重试
+_RETRY_AFTER_TIMEOUT_FACTOR = 3
+
+_SEMICOLON, _COMMA, _MINUS, _DOT = 59, 44, 45, 46
+_MAX_DIGITS = 15  # 尾数不超过2^53时 尾数/10^k 与float()同样是正确舍入
+
+
+@njit(cache=True)
+def _decode_polyline_nb(buf):
+    """
+    逐字节解析 "lon,lat;lon,lat;..."（ASCII），返回((N, 2)坐标数组, 是否可解析)
+    
+    空点与坐标个数不为2的点跳过（与逐点解析一致）；遇到不支持的写法
+    （指数、'+'号、非数字、超过15位有效数字）返回False，由调用方回退
+    """
+    n = buf.shape[0]
+    out = np.empty((n // 4 + 1, 2))
+    count = 0
+    lon = 0.0
+    lat = 0.0
+    i = 0
+    while i <= n:
+        if i == n or buf[i] == _SEMICOLON:
+            i += 1
+            continue
+        
+        n_values = 0
+        while True:
+            negative = False
+            if i < n and buf[i] == _MINUS:
+                negative = True
+                i += 1
+            mantissa = 0
+            digits = 0
+            decimals = 0
+            seen_dot = False
+            while i < n:
+                c = int(buf[i])  # 转为整数，纯Python回退时避免uint8运算溢出
+                if 48 <= c <= 57:
+                    mantissa = mantissa * 10 + (c - 48)
+                    digits += 1
+                    if seen_dot:
+                        decimals += 1
+                elif c == _DOT and not seen_dot:
+                    seen_dot = True
+                else:
+                    break
+                i += 1
+            if digits == 0 or digits > _MAX_DIGITS:
+                return out[:0], False
+            
+            value = mantissa / 10.0 ** decimals
+            if negative:
+                value = -value
+            if n_values == 0:
+                lon = value
+            elif n_values == 1:
+                lat = value
+            n_values += 1
+            
+            if i < n and buf[i] == _COMMA:
+                i += 1
+            else:
+                break
+        
+        if i < n and buf[i] != _SEMICOLON:
+            return out[:0], False
+        if n_values == 2:
+            out[count, 0] = lon
+            out[count, 1] = lat
+            count += 1
+        i += 1
+    return out[:count], True
+
+
+if NUMBA_AVAILABLE:
+    # 导入时预热一次，避免首次路径规划承担JIT编译开销
+    _decode_polyline_nb(np.frombuffer(b"118.1,24.4", dtype=np.uint8))
+
 
 @dataclass
 class RouteResult:
@@ -56,8 +151,46 @@ class GaodeAPIClient:
         self.config = {
             'timeout': 10,  # 超时时间（秒）
             'max_retries': 3,  # 最大重试次数
-            'rate_limit': 0.1  # 限流间隔（秒）
+            'rate_limit': 0.1,  # 平均请求间隔（秒），即令牌补充速率为1/rate_limit；<=0不限流
+            'burst': 5,  # 令牌桶容量（允许的突发请求数）
+            'max_workers': 8,  # batch_call并发请求数
+            'cache_size': 1024,  # 各查询结果缓存的最大条目数
+            'geocode_ttl': 86400,  # 地理编码/逆地理编码结果缓存时间（秒）
+            'weather_ttl': 1800  # 天气结果缓存时间（秒）
         }
+        
+        # 查询结果缓存：key → (写入时间, 结果)，只缓存成功结果
+        self._geocode_cache = LRUCache(maxsize=self.config['cache_size'])
+        self._regeocode_cache = LRUCache(maxsize=self.config['cache_size'])
+        self._weather_cache = LRUCache(maxsize=self.config['cache_size'])
+        
+        # 令牌桶限流状态，在并发请求间共享
+        self._rate_lock = threading.Lock()
+        self._tokens = float(self.config['burst'])
+        self._last_refill = time.monotonic()
+        # batch_call使用的线程池（首次调用时创建）
+        self._pool: Optional[ThreadPoolExecutor] = None
+        
+        # 复用连接（keep-alive），避免每次请求重新建立TCP+TLS连接；
+        # 重试由_make_request负责，适配器自身不重试
+        self._session = requests.Session()
+        self._session.mount(
+            "https://",
+            HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=0)
+        )
+    
+    def close(self):
+        """释放连接池与线程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
     
     def get_route_walking(self,
                          origin: Tuple[float, float],
@@ -78,8 +211,8 @@ class GaodeAPIClient:
         
         params = {
             'key': self.api_key,
-            'origin': f"{origin[0]},{origin[1]}",
-            'destination': f"{destination[0]},{destination[1]}"
+            'origin': self._fmt_point(origin),
+            'destination': self._fmt_point(destination)
         }
         
         try:
@@ -133,8 +266,8 @@ class GaodeAPIClient:
         
         params = {
             'key': self.api_key,
-            'origin': f"{origin[0]},{origin[1]}",
-            'destination': f"{destination[0]},{destination[1]}",
+            'origin': self._fmt_point(origin),
+            'destination': self._fmt_point(destination),
             'strategy': strategy,
             'extensions': 'all'  # 返回详细信息
         }
@@ -194,8 +327,8 @@ class GaodeAPIClient:
         
         params = {
             'key': self.api_key,
-            'origin': f"{origin[0]},{origin[1]}",
-            'destination': f"{destination[0]},{destination[1]}",
+            'origin': self._fmt_point(origin),
+            'destination': self._fmt_point(destination),
             'city': city,
             'strategy': strategy
         }
@@ -329,7 +462,7 @@ class GaodeAPIClient:
         
         params = {
             'key': self.api_key,
-            'location': f"{location[0]},{location[1]}",
+            'location': self._fmt_point(location),
             'keywords': keywords,
             'radius': radius,
             'extensions': 'all'
@@ -363,6 +496,14 @@ class GaodeAPIClient:
         Returns:
             坐标 (lon, lat)
         """
+        key = (address.strip().lower(), (city or '').strip().lower())
+        return self._cached(
+            self._geocode_cache, key, self.config['geocode_ttl'],
+            lambda: self._fetch_geocode(address, city)
+        )
+    
+    def _fetch_geocode(self, address: str, city: Optional[str]) -> Optional[Tuple[float, float]]:
+        """地理编码请求（不经缓存）"""
         url = f"{self.base_url}/geocode/geo"
         
         params = {
@@ -401,11 +542,20 @@ class GaodeAPIClient:
         Returns:
             地址信息
         """
+        # 坐标取5位小数（约1米）作为缓存键，提高命中率
+        key = (round(location[0], 5), round(location[1], 5))
+        return self._cached(
+            self._regeocode_cache, key, self.config['geocode_ttl'],
+            lambda: self._fetch_regeocode(location)
+        )
+    
+    def _fetch_regeocode(self, location: Tuple[float, float]) -> Optional[Dict]:
+        """逆地理编码请求（不经缓存）"""
         url = f"{self.base_url}/geocode/regeo"
         
         params = {
             'key': self.api_key,
-            'location': f"{location[0]},{location[1]}",
+            'location': self._fmt_point(location),
             'extensions': 'all'
         }
         
@@ -440,6 +590,13 @@ class GaodeAPIClient:
         Returns:
             天气信息
         """
+        return self._cached(
+            self._weather_cache, city.strip(), self.config['weather_ttl'],
+            lambda: self._fetch_weather(city)
+        )
+    
+    def _fetch_weather(self, city: str) -> Optional[Dict]:
+        """天气查询请求（不经缓存）"""
         url = f"{self.base_url}/weather/weatherInfo"
         
         params = {
@@ -490,12 +647,12 @@ class GaodeAPIClient:
         """
         url = f"{self.base_url}/distance"
         
-        origins_str = '|'.join([f"{o[0]},{o[1]}" for o in origins])
+        origins_str = '|'.join(map(self._fmt_point, origins))
         
         params = {
             'key': self.api_key,
             'origins': origins_str,
-            'destination': f"{destination[0]},{destination[1]}",
+            'destination': self._fmt_point(destination),
             'type': type_
         }
         
@@ -512,51 +669,129 @@ class GaodeAPIClient:
             print(f"Error in get_distance: {e}")
             return None
     
+    def _cached(self, cache: LRUCache, key, ttl: float, fetch):
+        """先查缓存，未命中或过期时调用fetch；None（请求失败）不缓存"""
+        now = time.time()
+        entry = cache.get(key)
+        if entry is not None and now - entry[0] < ttl:
+            return entry[1]
+        
+        result = fetch()
+        if result is not None:
+            cache.put(key, (now, result))
+        return result
+    
+    def clear_cache(self):
+        """清空查询结果缓存"""
+        self._geocode_cache.clear()
+        self._regeocode_cache.clear()
+        self._weather_cache.clear()
+    
+    def batch_call(self, method: str, calls: List[Tuple]) -> List:
+        """
+        并发调用同一接口
+        
+        各请求在线程池中并发等待响应，总耗时约为最慢的一次而非逐个相加；
+        请求发出仍受限流控制
+        
+        Args:
+            method: 接口方法名，如 'geocode'、'get_route_walking'
+            calls: 每次调用的位置参数元组
+            
+        Returns:
+            与calls一一对应的结果（失败为None，与单次调用一致）
+        """
+        func = getattr(self, method)
+        if len(calls) <= 1 or self.config['max_workers'] <= 1:
+            return [func(*args) for args in calls]
+        
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.config['max_workers'])
+        futures = [self._pool.submit(func, *args) for args in calls]
+        return [future.result() for future in futures]
+    
     def _make_request(self, url: str, params: Dict) -> Dict:
         """
         发起HTTP请求
         
         包含:
-        - 限流控制
-        - 重试逻辑
+        - 限流控制（每次尝试取一个令牌）
+        - 重试逻辑（429按Retry-After等待，其余错误指数退避，均加随机抖动；
+          Retry-After超过超时时间的_RETRY_AFTER_TIMEOUT_FACTOR倍时直接失败）
         - 签名（如果有私钥）
         """
-        # 限流
-        self._rate_limit()
-        
         # 签名（如果需要）
         if self.private_key:
             params = self._sign_params(params)
         
         # 发起请求
-        for retry in range(self.config['max_retries']):
+        max_retries = self.config['max_retries']
+        max_wait = self.config['timeout'] * _RETRY_AFTER_TIMEOUT_FACTOR
+        for retry in range(max_retries):
+            last_attempt = retry == max_retries - 1
+            self._rate_limit()
             try:
-                response = requests.get(
+                response = self._session.get(
                     url,
                     params=params,
                     timeout=self.config['timeout']
                 )
+                if response.status_code == 429 and not last_attempt:
+                    wait = self._retry_after(response)
+                    if wait <= max_wait:
+                        time.sleep(wait + random.uniform(0, 0.5))
+                        continue
+                    # 要求等待过久：不再重试，按429失败
+                    last_attempt = True
                 response.raise_for_status()
                 
                 self.request_count += 1
+                if ORJSON_AVAILABLE:
+                    # 直接解析响应字节，省去先解码为str的一步
+                    return orjson.loads(response.content)
                 return response.json()
                 
-            except requests.RequestException as e:
-                if retry == self.config['max_retries'] - 1:
+            except requests.RequestException:
+                if last_attempt:
                     raise
-                time.sleep(1 * (retry + 1))  # 指数退避
+                time.sleep((2 ** retry) * 0.5 + random.random() * 0.25)  # 指数退避
         
         return {}
     
+    @staticmethod
+    def _retry_after(response) -> float:
+        """429响应的等待秒数（Retry-After缺失或非秒数格式时取1秒）"""
+        try:
+            return max(float(response.headers.get('Retry-After', 1)), 0.0)
+        except (TypeError, ValueError):
+            return 1.0
+    
     def _rate_limit(self):
-        """限流控制"""
-        current_time = time.time()
-        elapsed = current_time - self.last_request_time
-        
-        if elapsed < self.config['rate_limit']:
-            time.sleep(self.config['rate_limit'] - elapsed)
+        """
+        令牌桶限流
         
-        self.last_request_time = time.time()
+        令牌按1/rate_limit每秒补充、最多攒burst个，允许短时突发；
+        令牌不足时等待到下一个令牌补足（持锁等待，后续请求依次排队）
+        """
+        with self._rate_lock:
+            interval = self.config['rate_limit']
+            if interval > 0:
+                qps = 1.0 / interval
+                now = time.monotonic()
+                self._tokens = min(
+                    float(self.config['burst']),
+                    self._tokens + (now - self._last_refill) * qps
+                )
+                self._last_refill = now
+                
+                if self._tokens < 1:
+                    wait = (1 - self._tokens) / qps
+                    time.sleep(wait)
+                    self._tokens = 1.0
+                    self._last_refill = now + wait
+                self._tokens -= 1
+            
+            self.last_request_time = time.time()
     
     def _sign_params(self, params: Dict) -> Dict:
         """参数签名（如果需要）"""
@@ -573,19 +808,40 @@ class GaodeAPIClient:
         params['sig'] = signature
         return params
     
+    @staticmethod
+    def _fmt_point(point: Tuple[float, float]) -> str:
+        """坐标 (lon, lat) → 请求参数格式 lon,lat"""
+        return f"{point[0]},{point[1]}"
+    
     def _parse_route_coordinates(self, path: Dict) -> List[Tuple[float, float]]:
-        """解析路径坐标"""
-        coords = []
+        """
+        解析路径坐标（polyline格式 "lon,lat;lon,lat;..."，格式不符的点跳过）
         
-        steps = path.get('steps', [])
-        for step in steps:
-            polyline = step.get('polyline', '')
-            if polyline:
-                points = polyline.split(';')
-                for point in points:
-                    lon_lat = point.split(',')
-                    if len(lon_lat) == 2:
-                        coords.append((float(lon_lat[0]), float(lon_lat[1])))
+        安装numba时各步骤的polyline拼接后由JIT内核一次解析；
+        内核不支持的写法逐点解析
+        """
+        polylines = [step.get('polyline') for step in path.get('steps', ())]
+        polylines = [polyline for polyline in polylines if polyline]
+        if not polylines:
+            return []
+        
+        if NUMBA_AVAILABLE:
+            text = ';'.join(polylines)
+            if text.isascii():
+                coords, ok = _decode_polyline_nb(
+                    np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+                )
+                if ok:
+                    lons, lats = coords.T.tolist()
+                    return list(zip(lons, lats))
+        
+        coords = []
+        append = coords.append
+        for polyline in polylines:
+            for point in polyline.split(';'):
+                lon, sep, lat = point.partition(',')
+                if sep and ',' not in lat:
+                    append((float(lon), float(lat)))
         
         return coords
     
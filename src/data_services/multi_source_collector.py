@@ -3,12 +3,91 @@
 从多个数据源收集POI信息和评论
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 from datetime import datetime
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import random
+import threading
+import time
+
+import numpy as np
 
 from ..core.models import Location
 
+# 模拟评论模板
+_GAODE_POSITIVE_TEMPLATES = (
+    "服务很好，环境不错",
+    "值得推荐，体验很棒",
+    "性价比高，下次还会来",
+    "景色优美，令人难忘",
+    "非常满意，超出预期"
+)
+_GAODE_NEGATIVE_TEMPLATES = (
+    "人太多了，排队很久",
+    "价格有点贵",
+    "环境一般，有待改善",
+    "服务态度需要提升"
+)
+_CTRIP_TEMPLATES = (
+    "位置便利，交通方便",
+    "设施齐全，服务周到",
+    "环境优雅，值得一去",
+    "整体满意，推荐给大家"
+)
+_FAKE_TEMPLATES = (
+    "超级好超级好超级好",  # 重复词汇
+    "老板人很好老板人很好",  # 重复句式
+    "五星好评五星好评五星好评"  # 明显刷单
+)
+_NORMAL_TEMPLATES = (
+    "总体还不错，值得一去",
+    "体验良好，环境舒适",
+    "服务到位，很满意"
+)
+
+
+class _AIMDLimiter:
+    """
+    单个数据源的自适应并发上限（AIMD）
+    
+    请求成功且耗时不超过target_latency时上限加increase（加性增），
+    请求失败时上限乘decrease（乘性减），上限在[min_limit, max_limit]内；
+    同时进行的请求数达到上限取整值时acquire阻塞
+    """
+    
+    def __init__(self,
+                 initial: float = 4.0,
+                 min_limit: float = 1.0,
+                 max_limit: float = 8.0,
+                 increase: float = 0.5,
+                 decrease: float = 0.5,
+                 target_latency: float = 0.5):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._cond = threading.Condition()
+    
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+    
+    def release(self, ok: bool, latency: float):
+        """归还名额并按本次结果调整上限"""
+        with self._cond:
+            self.in_flight -= 1
+            if not ok:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+            elif latency <= self.target_latency:
+                self.limit = min(self.max_limit, self.limit + self.increase)
+            self._cond.notify_all()
+
 
 class MultiSourceCollector:
     """
@@ -25,14 +104,23 @@ class MultiSourceCollector:
         这里为了Demo，部分数据源使用模拟数据
     """
     
-    def __init__(self, gaode_client):
+    def __init__(self, gaode_client, workers: int = 4, timeout: float = 10.0):
         """
         初始化采集器
         
         Args:
             gaode_client: 高德API客户端
+            workers: 并发采集各数据源的线程数（<=1时顺序采集）
+            timeout: 单个数据源的等待超时（秒）
         """
         self.gaode = gaode_client
+        self.timeout = timeout
+        
+        # 模拟数据的随机数生成器（整批抽样）
+        self._rng = np.random.default_rng()
+        
+        # 各数据源互不依赖，并发采集（总耗时约为最慢的数据源）
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
         
         # 数据源权重配置
         self.source_weights = {
@@ -51,6 +139,9 @@ class MultiSourceCollector:
             'dianping': 0.90,
             'xiaohongshu': 0.85
         }
+        
+        # 数据源并发上限按延迟与失败自适应调整（跨节点共享）
+        self._limiters = {name: _AIMDLimiter() for name in self.source_weights}
     
     def collect_multi_source(self, node: Location) -> Dict[str, Dict]:
         """
@@ -60,58 +151,39 @@ class MultiSourceCollector:
             node: POI节点
             
         Returns:
-            数据源字典 {source_name: data}
+            数据源字典 {source_name: data}（按数据源优先级排列）
         """
-        results = {}
-        
-        # 1. 高德地图（优先级最高）
-        try:
-            gaode_data = self._collect_from_gaode(node)
-            if gaode_data:
-                results['gaode'] = {
-                    **gaode_data,
-                    'weight': self.source_weights['gaode'],
-                    'credibility': self.source_credibility['gaode']
-                }
-        except Exception as e:
-            print(f"⚠️ 高德数据采集失败: {e}")
-        
-        # 2. 携程（模拟）
-        try:
-            ctrip_data = self._collect_from_ctrip_mock(node)
-            if ctrip_data:
-                results['ctrip'] = {
-                    **ctrip_data,
-                    'weight': self.source_weights['ctrip'],
-                    'credibility': self.source_credibility['ctrip']
-                }
-        except Exception as e:
-            print(f"⚠️ 携程数据采集失败: {e}")
+        # 1. 高德地图（优先级最高） 2. 携程（模拟） 3. 马蜂窝（模拟） 4. 大众点评（模拟，仅餐厅）
+        collectors = [
+            ('gaode', '高德', self._collect_from_gaode),
+            ('ctrip', '携程', self._collect_from_ctrip_mock),
+            ('mafengwo', '马蜂窝', self._collect_from_mafengwo_mock),
+        ]
+        if node.type.value == 'restaurant':
+            collectors.append(('dianping', '大众点评', self._collect_from_dianping_mock))
         
-        # 3. 马蜂窝（模拟）
-        try:
-            mafengwo_data = self._collect_from_mafengwo_mock(node)
-            if mafengwo_data:
-                results['mafengwo'] = {
-                    **mafengwo_data,
-                    'weight': self.source_weights['mafengwo'],
-                    'credibility': self.source_credibility['mafengwo']
-                }
-        except Exception as e:
-            print(f"⚠️ 马蜂窝数据采集失败: {e}")
+        if self._pool is not None:
+            pending = [
+                (name, label, self._pool.submit(self._collect_limited, name, collect, node))
+                for name, label, collect in collectors
+            ]
+            fetch = lambda future: future.result(timeout=self.timeout)
+        else:
+            pending = [(name, label, (name, collect)) for name, label, collect in collectors]
+            fetch = lambda task: self._collect_limited(*task, node)
         
-        # 4. 大众点评（模拟，仅餐厅）
-        if node.type.value == 'restaurant':
+        results = {}
+        for name, label, task in pending:
             try:
-                dianping_data = self._collect_from_dianping_mock(node)
-                if dianping_data:
-                    results['dianping'] = {
-                        **dianping_data,
-                        'weight': self.source_weights['dianping'],
-                        'credibility': self.source_credibility['dianping']
+                data = fetch(task)
+                if data:
+                    results[name] = {
+                        **data,
+                        'weight': self.source_weights[name],
+                        'credibility': self.source_credibility[name]
                     }
             except Exception as e:
-                print(f"⚠️ 大众点评数据采集失败: {e}")
+                print(f"⚠️ {label}数据采集失败: {e}")
         
         # 确保至少有一个数据源
         if not results:
@@ -127,6 +199,25 @@ class MultiSourceCollector:
         
         return results
     
+    def _collect_limited(self, name: str, collect, node: Location) -> Optional[Dict]:
+        """在数据源的并发上限内采集；只有采集抛出异常才视为失败（无数据属正常结果）"""
+        limiter = self._limiters[name]
+        limiter.acquire()
+        start = time.monotonic()
+        ok = False
+        try:
+            data = collect(node)
+            ok = True
+            return data
+        finally:
+            limiter.release(ok, time.monotonic() - start)
+    
+    def close(self):
+        """释放采集线程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+    
     def collect_reviews(self, node: Location, limit: int = 100) -> List[Dict]:
         """
         收集评论
@@ -138,14 +229,37 @@ class MultiSourceCollector:
         Returns:
             评论列表
         """
-        reviews = []
+        return list(islice(self.iter_reviews(node, limit), limit))
+    
+    def iter_reviews(self, node: Location, limit: int = 100) -> Iterator[Dict]:
+        """
+        逐个产出评论（各数据源按需拉取，调用方停止迭代后不再请求后续数据源）
         
-        # 从各个数据源收集评论
-        reviews.extend(self._collect_gaode_reviews_mock(node, limit // 3))
-        reviews.extend(self._collect_ctrip_reviews_mock(node, limit // 3))
-        reviews.extend(self._collect_other_reviews_mock(node, limit // 3))
+        Args:
+            node: POI节点
+            limit: 各数据源合计的拉取上限
+            
+        Yields:
+            评论字典
+        """
+        per_source = limit // 3
+        yield from self._collect_gaode_reviews_mock(node, per_source)
+        yield from self._collect_ctrip_reviews_mock(node, per_source)
+        yield from self._collect_other_reviews_mock(node, per_source)
+    
+    def review_count(self, node: Location, limit: int = 100) -> int:
+        """
+        评论总数（元数据接口，不拉取评论正文）
         
-        return reviews[:limit]
+        Args:
+            node: POI节点
+            limit: 与iter_reviews一致的拉取上限
+            
+        Returns:
+            评论总数
+        """
+        # 模拟数据源：总数即iter_reviews会产出的条数
+        return (limit // 3) * 3
     
     def _collect_from_gaode(self, node: Location) -> Optional[Dict]:
         """
@@ -211,98 +325,52 @@ class MultiSourceCollector:
         }
     
     def _collect_gaode_reviews_mock(self, node: Location, limit: int) -> List[Dict]:
-        """收集高德评论（模拟）"""
-        reviews = []
-        
-        positive_templates = [
-            "服务很好，环境不错",
-            "值得推荐，体验很棒",
-            "性价比高，下次还会来",
-            "景色优美，令人难忘",
-            "非常满意，超出预期"
-        ]
-        
-        negative_templates = [
-            "人太多了，排队很久",
-            "价格有点贵",
-            "环境一般，有待改善",
-            "服务态度需要提升"
-        ]
-        
-        for i in range(limit):
-            is_positive = random.random() > 0.15  # 85%正面
-            
-            if is_positive:
-                text = random.choice(positive_templates)
-                rating = random.uniform(4.0, 5.0)
-            else:
-                text = random.choice(negative_templates)
-                rating = random.uniform(2.0, 3.5)
-            
-            reviews.append({
-                'text': text,
-                'rating': rating,
-                'source': 'gaode',
-                'timestamp': datetime.now(),
-                'user_id': f"user_{random.randint(1000, 9999)}"
-            })
-        
-        return reviews
+        """收集高德评论（模拟，85%正面）"""
+        rng = self._rng
+        is_positive = rng.random(limit) > 0.15
+        texts = np.where(
+            is_positive,
+            rng.choice(_GAODE_POSITIVE_TEMPLATES, limit),
+            rng.choice(_GAODE_NEGATIVE_TEMPLATES, limit)
+        )
+        ratings = np.where(
+            is_positive, rng.uniform(4.0, 5.0, limit), rng.uniform(2.0, 3.5, limit)
+        )
+        return self._build_mock_reviews('gaode', texts, ratings)
     
     def _collect_ctrip_reviews_mock(self, node: Location, limit: int) -> List[Dict]:
         """收集携程评论（模拟）"""
-        reviews = []
-        
-        templates = [
-            "位置便利，交通方便",
-            "设施齐全，服务周到",
-            "环境优雅，值得一去",
-            "整体满意，推荐给大家"
-        ]
-        
-        for i in range(limit):
-            reviews.append({
-                'text': random.choice(templates),
-                'rating': random.uniform(4.0, 5.0),
-                'source': 'ctrip',
-                'timestamp': datetime.now(),
-                'user_id': f"user_{random.randint(1000, 9999)}"
-            })
-        
-        return reviews
+        rng = self._rng
+        return self._build_mock_reviews(
+            'ctrip', rng.choice(_CTRIP_TEMPLATES, limit), rng.uniform(4.0, 5.0, limit)
+        )
     
     def _collect_other_reviews_mock(self, node: Location, limit: int) -> List[Dict]:
-        """收集其他来源评论（模拟）"""
-        reviews = []
-        
-        # 模拟一些虚假评论（用于测试检测算法）
-        fake_templates = [
-            "超级好超级好超级好",  # 重复词汇
-            "老板人很好老板人很好",  # 重复句式
-            "五星好评五星好评五星好评"  # 明显刷单
-        ]
-        
-        normal_templates = [
-            "总体还不错，值得一去",
-            "体验良好，环境舒适",
-            "服务到位，很满意"
-        ]
-        
-        for i in range(limit):
-            # 10%概率是虚假评论
-            is_fake = random.random() < 0.1
-            
-            if is_fake:
-                text = random.choice(fake_templates)
-            else:
-                text = random.choice(normal_templates)
-            
-            reviews.append({
+        """收集其他来源评论（模拟，含10%虚假评论用于测试检测算法）"""
+        rng = self._rng
+        texts = np.where(
+            rng.random(limit) < 0.1,
+            rng.choice(_FAKE_TEMPLATES, limit),
+            rng.choice(_NORMAL_TEMPLATES, limit)
+        )
+        return self._build_mock_reviews('other', texts, rng.uniform(4.0, 5.0, limit))
+    
+    def _build_mock_reviews(self,
+                           source: str,
+                           texts: np.ndarray,
+                           ratings: np.ndarray) -> List[Dict]:
+        """由整批抽样的文本与评分组装评论（同一批共用时间戳）"""
+        timestamp = datetime.now()
+        user_ids = self._rng.integers(1000, 10000, len(texts))
+        return [
+            {
                 'text': text,
-                'rating': random.uniform(4.0, 5.0),
-                'source': 'other',
-                'timestamp': datetime.now(),
-                'user_id': f"user_{random.randint(1000, 9999)}"
-            })
-        
-        return reviews
+                'rating': rating,
+                'source': source,
+                'timestamp': timestamp,
+                'user_id': f"user_{user_id}"
+            }
+            for text, rating, user_id in zip(
+                texts.tolist(), ratings.tolist(), user_ids.tolist()
+            )
+        ]
@@ -244,9 +244,117 @@ class TestDataCollectionFaultTolerance:
     
     def test_all_sources_fail_fallback(self):
         """测试所有数据源失败时的降级"""
-        # 这个测试需要模拟所有数据源失败的情况
-        # 实际实现中应使用mock
-        pass
+        from src.data_services.multi_source_collector import MultiSourceCollector
+        
+        def fail(node):
+            raise RuntimeError("source down")
+        
+        collector = MultiSourceCollector(GaodeAPIClient("test_key"))
+        collector._collect_from_gaode = fail
+        collector._collect_from_ctrip_mock = fail
+        collector._collect_from_mafengwo_mock = fail
+        
+        loc = Location(
+            id="test", name="测试POI", lat=31.30, lon=120.52,
+            type=POIType.ATTRACTION
+        )
+        
+        assert list(collector.collect_multi_source(loc)) == ['default']
+        collector.close()
+    
+    def test_failed_sources_halve_limit(self):
+        """测试采集失败的数据源并发上限减半，未调用的数据源保持初始值"""
+        from src.data_services.multi_source_collector import MultiSourceCollector
+        
+        def fail(node):
+            raise RuntimeError("source down")
+        
+        collector = MultiSourceCollector(GaodeAPIClient("test_key"))
+        collector._collect_from_gaode = fail
+        collector._collect_from_ctrip_mock = fail
+        loc = Location(
+            id="test", name="测试POI", lat=31.30, lon=120.52,
+            type=POIType.ATTRACTION
+        )
+        
+        collector.collect_multi_source(loc)
+        
+        assert collector._limiters['gaode'].limit == 2.0
+        assert collector._limiters['ctrip'].limit == 2.0
+        assert collector._limiters['dianping'].limit == 4.0
+        assert all(l.in_flight == 0 for l in collector._limiters.values())
+        collector.close()
+    
+    def test_aimd_limiter_bounds(self):
+        """测试并发上限加性增、乘性减且不越界"""
+        from src.data_services.multi_source_collector import _AIMDLimiter
+        
+        limiter = _AIMDLimiter()
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release(ok=True, latency=0.1)
+        assert limiter.limit == 8.0
+        
+        limiter.acquire()
+        limiter.release(ok=True, latency=2.0)  # 慢请求不增加
+        assert limiter.limit == 8.0
+        
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(ok=False, latency=0.1)
+        assert limiter.limit == 1.0
+    
+    def test_empty_source_keeps_limit(self):
+        """测试数据源正常返回无数据时不按失败收缩并发上限"""
+        from src.data_services.multi_source_collector import MultiSourceCollector
+        
+        collector = MultiSourceCollector(GaodeAPIClient("test_key"), workers=1)
+        collector._collect_from_gaode = lambda node: None
+        loc = Location(
+            id="test", name="测试POI", lat=31.30, lon=120.52,
+            type=POIType.ATTRACTION
+        )
+        
+        results = collector.collect_multi_source(loc)
+        
+        assert 'gaode' not in results
+        assert collector._limiters['gaode'].limit >= 4.0
+    
+    def test_mock_reviews_generated_in_bulk(self):
+        """测试批量生成的模拟评论字段与类型"""
+        from src.data_services.multi_source_collector import MultiSourceCollector
+        
+        collector = MultiSourceCollector(GaodeAPIClient("test_key"), workers=1)
+        loc = Location(
+            id="test", name="测试POI", lat=31.30, lon=120.52,
+            type=POIType.ATTRACTION
+        )
+        
+        reviews = collector.collect_reviews(loc, limit=300)
+        
+        assert len(reviews) == 300
+        assert [r['source'] for r in reviews[::100]] == ['gaode', 'ctrip', 'other']
+        assert all(type(r['text']) is str and type(r['rating']) is float for r in reviews)
+        assert all(1000 <= int(r['user_id'][5:]) <= 9999 for r in reviews)
+        assert all(4.0 <= r['rating'] <= 5.0 for r in reviews if r['source'] != 'gaode')
+    
+    def test_concurrent_collection_keeps_source_order(self):
+        """测试并发采集与顺序采集返回相同的数据源（顺序不变）"""
+        from src.data_services.multi_source_collector import MultiSourceCollector
+        
+        client = GaodeAPIClient("test_key")
+        loc = Location(
+            id="test", name="测试餐厅", lat=31.30, lon=120.52,
+            type=POIType.RESTAURANT
+        )
+        
+        pooled = MultiSourceCollector(client)
+        sequential = MultiSourceCollector(client, workers=1)
+        
+        expected = ['gaode', 'ctrip', 'mafengwo', 'dianping']
+        assert list(pooled.collect_multi_source(loc)) == expected
+        assert list(sequential.collect_multi_source(loc)) == expected
+        pooled.close()
 
 
 class TestSystemIntegration:
@@ -291,6 +399,31 @@ class TestSystemIntegration:
         assert loc.name == "测试地点"
         assert loc.city == "苏州"
         assert loc.rating == 4.5
+    
+    def test_location_visit_time_normalized(self):
+        """测试游玩时长为空时在构造处补默认值（0为有效值，保留）"""
+        legacy = Location(id="a", name="旧数据", lat=31.30, lon=120.52,
+                          type=POIType.ATTRACTION, average_visit_time=None)
+        start = Location(id="s", name="起点", lat=31.30, lon=120.52,
+                         type=POIType.STATION, average_visit_time=0.0)
+        
+        assert legacy.average_visit_time == 2.0
+        assert start.average_visit_time == 0.0
+    
+    def test_location_coord_trig_follows_coordinates(self):
+        """测试坐标三角量缓存：坐标修改后重新计算"""
+        import math
+        loc = Location(id="a", name="测试地点", lat=31.30, lon=120.52,
+                       type=POIType.ATTRACTION)
+        
+        assert loc.lat_rad == math.radians(31.30)
+        assert loc.cos_lat == math.cos(math.radians(31.30))
+        
+        loc.lat, loc.lon = 24.44, 118.10
+        assert loc.lat_rad == math.radians(24.44)
+        assert loc.lon_rad == math.radians(118.10)
+        assert loc == Location(id="a", name="测试地点", lat=24.44, lon=118.10,
+                               type=POIType.ATTRACTION)
 
 
 class TestErrorHandling:
@@ -0,0 +1,172 @@
+"""
+高德API客户端单元测试
+验证请求发送、结果解析等功能（不访问网络）
+"""
+
+import json
+import time
+
+import pytest
+from unittest.mock import Mock
+
+import numpy as np
+import requests
+
+from src.data_services.gaode_api_client import GaodeAPIClient, _decode_polyline_nb
+
+
+def _response(payload, status_code=200):
+    """构造HTTP响应Mock（json()与原始字节content一致）"""
+    return Mock(
+        status_code=status_code,
+        content=json.dumps(payload).encode(),
+        json=Mock(return_value=payload)
+    )
+
+
+class TestGaodeAPIClient:
+    """高德API客户端测试类"""
+
+    @pytest.fixture
+    def client(self):
+        """创建客户端实例（会话替换为Mock，关闭限流）"""
+        client = GaodeAPIClient("test_key")
+        client.config['rate_limit'] = 0.0
+        client._session = Mock()
+        client._session.get.return_value = _response({
+            'status': '1',
+            'geocodes': [{'location': '118.10,24.44'}]
+        })
+        return client
+
+    def test_requests_reuse_session(self, client):
+        """所有请求复用同一会话"""
+        assert client.geocode("南普陀寺") == (118.10, 24.44)
+        assert client.geocode("南普陀寺", city="厦门") == (118.10, 24.44)
+
+        assert client._session.get.call_count == 2
+        assert client.request_count == 2
+        _, kwargs = client._session.get.call_args
+        assert kwargs['params']['city'] == "厦门"
+        assert kwargs['timeout'] == client.config['timeout']
+
+    def test_context_manager_closes_session(self, client):
+        """退出with块时关闭会话"""
+        with client as entered:
+            assert entered is client
+
+        client._session.close.assert_called_once()
+
+    def test_batch_call_preserves_order(self, client):
+        """并发调用的结果与calls顺序一致，失败项为None"""
+        def fake_get(url, params, timeout):
+            if params['address'] == "不存在":
+                return _response({'status': '0'})
+            lon = 118.0 + len(params['address']) / 100
+            return _response({'status': '1', 'geocodes': [{'location': f"{lon},24.44"}]})
+        client._session.get.side_effect = fake_get
+
+        results = client.batch_call('geocode', [("鼓浪屿",), ("不存在",), ("厦门大学",)])
+
+        assert results == [(118.03, 24.44), None, (118.04, 24.44)]
+        client.close()
+        assert client._pool is None
+
+    def test_geocode_cached_until_ttl(self, client):
+        """相同地址（忽略大小写与首尾空白）命中缓存，过期后重新请求"""
+        assert client.geocode("Xiamen ") == (118.10, 24.44)
+        assert client.geocode("xiamen") == (118.10, 24.44)
+        assert client._session.get.call_count == 1
+
+        client.config['geocode_ttl'] = 0
+        client.geocode("xiamen")
+        assert client._session.get.call_count == 2
+
+    def test_failed_lookup_not_cached(self, client):
+        """请求失败返回None且不写入缓存"""
+        client._session.get.return_value = _response({'status': '0'})
+
+        assert client.get_weather("厦门") is None
+        assert client.get_weather("厦门") is None
+        assert client._session.get.call_count == 2
+
+    def test_token_bucket_allows_burst(self, client, monkeypatch):
+        """令牌桶允许burst个请求不等待，之后按补充速率等待"""
+        sleeps = []
+        monkeypatch.setattr(time, 'sleep', sleeps.append)
+        client.config['rate_limit'] = 10.0  # 每10秒一个令牌，测试期间几乎不补充
+        client.config['burst'] = 3
+        client._tokens = 3.0
+
+        for _ in range(4):
+            client._rate_limit()
+
+        assert len(sleeps) == 1
+        assert 9.0 < sleeps[0] <= 10.0
+
+    def test_retry_after_on_429(self, client, monkeypatch):
+        """429响应按Retry-After等待后重试"""
+        sleeps = []
+        monkeypatch.setattr(time, 'sleep', sleeps.append)
+        throttled = _response({}, status_code=429)
+        throttled.headers = {'Retry-After': '2'}
+        client._session.get.side_effect = [throttled, client._session.get.return_value]
+
+        assert client.geocode("鼓浪屿") == (118.10, 24.44)
+        assert client._session.get.call_count == 2
+        assert 2.0 <= sleeps[0] <= 2.5
+
+    def test_retry_after_capped(self, client, monkeypatch):
+        """Retry-After超过超时时间的若干倍时不等待，直接按失败处理"""
+        sleeps = []
+        monkeypatch.setattr(time, 'sleep', sleeps.append)
+        throttled = _response({}, status_code=429)
+        throttled.headers = {'Retry-After': '3600'}
+        throttled.raise_for_status.side_effect = requests.HTTPError("429 Too Many Requests")
+        client._session.get.side_effect = [throttled, client._session.get.return_value]
+
+        assert client.geocode("鼓浪屿") is None
+        assert client._session.get.call_count == 1
+        assert sleeps == []
+
+    def test_parse_route_coordinates(self, client):
+        """按polyline解析坐标，跳过空步骤与格式不符的点"""
+        path = {'steps': [
+            {'polyline': "118.1,24.4;118.2,24.5"},
+            {'polyline': ""},
+            {},
+            {'polyline': "118.3,24.6;bad;1,2,3"},
+        ]}
+
+        assert client._parse_route_coordinates(path) == [
+            (118.1, 24.4), (118.2, 24.5), (118.3, 24.6)
+        ]
+
+    @pytest.mark.parametrize("polyline", [
+        "118.081234,24.447765;118.08,24.4478",
+        "-73.985428,40.748817;;0,-0.5",
+        "118.1,24.4;1.5,2,3;118.2",
+    ])
+    def test_decode_polyline_matches_float(self, polyline):
+        """JIT解析及其纯Python回退与逐点float()完全一致（跳过空点与坐标个数不为2的点）"""
+        expected = [
+            (float(lon), float(lat))
+            for lon, sep, lat in (point.partition(',') for point in polyline.split(';'))
+            if sep and ',' not in lat
+        ]
+        buf = np.frombuffer(polyline.encode(), dtype=np.uint8)
+
+        for decode in (_decode_polyline_nb, getattr(_decode_polyline_nb, 'py_func', None)):
+            if decode is None:
+                continue
+            coords, ok = decode(buf)
+
+            assert ok
+            assert [tuple(c) for c in coords.tolist()] == expected
+
+    @pytest.mark.parametrize("polyline", ["bad", "1e5,2", "118.1,24.4;x"])
+    def test_decode_polyline_rejects_unsupported(self, polyline):
+        """不支持的写法返回False，由逐点解析处理"""
+        _, ok = _decode_polyline_nb(np.frombuffer(polyline.encode(), dtype=np.uint8))
+
+        assert not ok
@@ -0,0 +1,190 @@
+"""
+影响力场单元测试
+验证场强缓存、批量计算与W轴语义缓存的协同
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from src.core.influence_field import InfluenceField
+from src.core.models import Location, POIType, State, UserProfile
+from src.core.neural_net_service import NeuralNetService
+
+
+@pytest.fixture
+def pois():
+    """同一区域内的候选POI"""
+    return [
+        Location(id=f"p{i}", name=f"POI{i}", lat=24.45 + i * 0.01, lon=118.08,
+                 type=poi_type, rating=4.0 + 0.1 * i)
+        for i, poi_type in enumerate(POIType)
+    ]
+
+
+@pytest.fixture
+def state(pois):
+    """从首个POI出发的状态（与规划器传入的models.State一致）"""
+    return State(current_location=pois[0], current_time=9.0)
+
+
+def _make_field():
+    """规划器不提供验证引擎（数学层取默认可信度）"""
+    return InfluenceField(planner=SimpleNamespace(), neural_service=NeuralNetService())
+
+
+@pytest.fixture
+def field():
+    """影响力场实例"""
+    return _make_field()
+
+
+def _fail_for(layer, poi_ids):
+    """让某层对指定POI评估失败，其余POI照常评估"""
+    evaluate = layer.evaluate
+
+    def patched(option, *args):
+        if option.id in poi_ids:
+            raise RuntimeError(f"{option.id}评估失败")
+        return evaluate(option, *args)
+    return patched
+
+
+class TestInfluenceField:
+    """影响力场测试类"""
+
+    def test_field_cache_hits_with_plain_state(self, field, pois, state):
+        """未附加visited的State各层均评估成功，重复计算命中场强缓存"""
+        time_point = datetime(2024, 12, 2, 10, 0)
+
+        phi, factors, _ = field.compute_field(pois[1], time_point, state, UserProfile())
+        strengths, _, _ = field.compute_field_batch(
+            pois[1:], time_point, state, UserProfile()
+        )
+
+        assert {f.source for f in factors} >= {"neural", "contextual"}
+        assert len(field._field_cache) == len(pois) - 1
+        assert strengths[0] == phi
+        assert field.compute_field(pois[1], time_point, state, UserProfile())[0] == phi
+
+    def test_w_axis_semantic_cache_hits(self, field, pois, state):
+        """场强缓存失效后重新计算，W轴语义得分命中POI对缓存"""
+        time_point = datetime(2024, 12, 2, 10, 0)
+        options = pois[1:]
+
+        first, _, _ = field.compute_field_batch(
+            options, time_point, state, UserProfile(), current_poi=pois[0]
+        )
+        field.clear_field_cache()
+        second, _, _ = field.compute_field_batch(
+            options, time_point, state, UserProfile(), current_poi=pois[0]
+        )
+
+        info = field.w_axis.semantic_analyzer._cached_semantic.cache_info()
+        assert info.misses == len(options)
+        assert info.hits == len(options)
+        assert second.tolist() == first.tolist()
+
+    def test_layer_failure_not_cached(self, field, pois, state, monkeypatch):
+        """有层评估失败时结果不写入缓存，恢复后重新计算"""
+        time_point = datetime(2024, 12, 2, 10, 0)
+        contextual = field.layers['contextual']
+
+        def broken(*args):
+            raise RuntimeError("情境服务不可用")
+
+        monkeypatch.setattr(contextual, 'evaluate', broken)
+        _, factors, _ = field.compute_field(pois[1], time_point, state, UserProfile())
+        assert not any(f.source == "contextual" for f in factors)
+        assert len(field._field_cache) == 0
+
+        monkeypatch.undo()
+        phi, factors, _ = field.compute_field(pois[1], time_point, state, UserProfile())
+        assert any(f.source == "contextual" for f in factors)
+        assert len(field._field_cache) == 1
+        assert field.compute_field(pois[1], time_point, state, UserProfile())[0] == phi
+
+    def test_unhashable_profile_and_context_skip_cache(self, field, pois, state):
+        """画像或上下文含列表时照常计算，只是不走缓存"""
+        time_point = datetime(2024, 12, 2, 10, 0)
+        profile = UserProfile()
+        profile.must_visit = ["鼓浪屿"]
+        context = {'weather': 'sunny', 'companions': ["家人"]}
+
+        phi, _, _ = field.compute_field(pois[1], time_point, state, profile, context=context)
+        strengths, _, _ = field.compute_field_batch(
+            pois[1:3], time_point, state, UserProfile(), context=context
+        )
+
+        assert strengths[0] == pytest.approx(phi)
+        assert len(field._field_cache) == 0
+
+    def _assert_batch_matches_scalar(self, batch, options, time_point, state, current_poi):
+        """批量结果与新实例逐个compute_field的结果一致"""
+        reference = _make_field()
+        strengths, factors_list, w_details_list = batch
+        for i, option in enumerate(options):
+            phi, factors, w_details = reference.compute_field(
+                option, time_point, state, UserProfile(), current_poi=current_poi
+            )
+            assert strengths[i] == pytest.approx(phi)
+            assert [(f.name, f.value, f.weight) for f in factors_list[i]] == [
+                (f.name, f.value, f.weight) for f in factors
+            ]
+            assert w_details_list[i] == w_details
+        return reference
+
+    @pytest.mark.parametrize("layer_workers", [1, 3])
+    def test_batch_matches_compute_field(self, field, pois, state, layer_workers):
+        """批量场强、因子与W轴详情与逐个计算一致"""
+        field.layer_workers = layer_workers
+        time_point = datetime(2024, 12, 7, 12, 0)
+        options = pois[1:]
+
+        batch = field.compute_field_batch(
+            options, time_point, state, UserProfile(), current_poi=pois[0]
+        )
+
+        self._assert_batch_matches_scalar(batch, options, time_point, state, pois[0])
+        assert all(details is not None for details in batch[2])
+
+    def test_batch_pads_partial_layer_failure(self, field, pois, state, monkeypatch):
+        """某层只对部分候选失败时，因子个数不同处按权重0补齐，结果仍与逐个计算一致"""
+        time_point = datetime(2024, 12, 2, 10, 0)
+        options = pois[1:]
+        failing = {options[0].id, options[2].id}
+        monkeypatch.setattr(field.layers['contextual'], 'evaluate',
+                            _fail_for(field.layers['contextual'], failing))
+        reference = _make_field()
+        monkeypatch.setattr(reference.layers['contextual'], 'evaluate',
+                            _fail_for(reference.layers['contextual'], failing))
+
+        strengths, factors_list, _ = field.compute_field_batch(
+            options, time_point, state, UserProfile()
+        )
+
+        assert len(factors_list[0]) < len(factors_list[1])
+        for i, option in enumerate(options):
+            phi, factors, _ = reference.compute_field(option, time_point, state, UserProfile())
+            assert strengths[i] == pytest.approx(phi)
+            assert [f.name for f in factors_list[i]] == [f.name for f in factors]
+        # 失败的候选不进缓存
+        assert len(field._field_cache) == len(options) - len(failing)
+
+    def test_batch_mixed_cache_hits(self, field, pois, state):
+        """部分候选已缓存时只计算未命中的候选，合并结果与逐个计算一致"""
+        time_point = datetime(2024, 12, 2, 10, 0)
+        options = pois[1:]
+        for option in options[::2]:
+            field.compute_field(option, time_point, state, UserProfile(), current_poi=pois[0])
+        cached = len(field._field_cache)
+
+        batch = field.compute_field_batch(
+            options, time_point, state, UserProfile(), current_poi=pois[0]
+        )
+
+        assert 0 < cached < len(options)
+        assert len(field._field_cache) == len(options)
+        self._assert_batch_matches_scalar(batch, options, time_point, state, pois[0])
+
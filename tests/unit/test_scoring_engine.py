@@ -0,0 +1,156 @@
+"""
+评分引擎单元测试
+验证标量评分与批量评分的一致性
+"""
+
+import numpy as np
+import pytest
+
+from src.core.models import (
+    Location, POIType, State, UserProfile, NodeVerification, Edge, TransportMode
+)
+from src.core.scoring_engine import (
+    ScoringEngine, _score_batch, _score_batch_numpy
+)
+
+
+class TestScoringEngine:
+    """评分引擎测试类"""
+
+    @pytest.fixture
+    def engine(self):
+        """创建ScoringEngine实例"""
+        return ScoringEngine()
+
+    @pytest.fixture
+    def nodes(self):
+        """候选节点"""
+        return [
+            Location(id="a", name="南普陀寺", lat=24.44, lon=118.10,
+                     type=POIType.ATTRACTION, average_visit_time=2.5),
+            Location(id="b", name="沙茶面", lat=24.45, lon=118.08,
+                     type=POIType.RESTAURANT, average_visit_time=1.0),
+            Location(id="c", name="电玩城", lat=24.47, lon=118.11,
+                     type=POIType.ENTERTAINMENT, average_visit_time=1.5),
+        ]
+
+    @pytest.fixture
+    def profile(self):
+        """用户画像"""
+        return UserProfile(
+            purpose={'leisure': 0.7, 'culture': 0.5},
+            intensity={'low': 0.7, 'medium': 0.3},
+            pace={'slow': 0.8, 'medium': 0.2}
+        )
+
+    @pytest.fixture
+    def state(self, nodes):
+        """当前状态（已访问节点a）"""
+        return State(
+            current_location=nodes[0],
+            current_time=1.0,
+            visited_history={"a"}
+        )
+
+    @pytest.fixture
+    def verification(self):
+        """验证数据"""
+        return NodeVerification(
+            consistency_score=0.8,
+            weighted_rating=4.5,
+            positive_rate=0.8,
+            spatial_score=0.7,
+            temporal_score=0.9,
+            predicted_crowd_level=0.3
+        )
+
+    def _edges(self, nodes):
+        """a、b有可达边，c无可达边"""
+        return [
+            [Edge(id="e1", from_loc=nodes[0], to_loc=nodes[0],
+                  mode=TransportMode.WALK, distance=0.0, time=0.0, cost=0.0)],
+            [Edge(id="e2", from_loc=nodes[0], to_loc=nodes[1],
+                  mode=TransportMode.TAXI, distance=3.0, time=0.2, cost=20.0),
+             Edge(id="e3", from_loc=nodes[0], to_loc=nodes[1],
+                  mode=TransportMode.WALK, distance=2.0, time=0.5, cost=0.0)],
+            [],
+        ]
+
+    def test_batch_matches_scalar(self, engine, nodes, profile, state, verification):
+        """批量评分与逐个评分一致"""
+        edges_list = self._edges(nodes)
+        verifications = [verification] * len(nodes)
+
+        batch = engine.compute_scores_batch(
+            nodes, edges_list, verifications, profile, state
+        )
+        scalar = [
+            engine.compute_score(n, e, v, profile, state)
+            for n, e, v in zip(nodes, edges_list, verifications)
+        ]
+
+        assert batch.dtype == np.float32
+        np.testing.assert_allclose(batch, scalar, atol=1e-5)
+
+    def test_batch_empty(self, engine, profile, state):
+        """空候选返回空数组"""
+        scores = engine.compute_scores_batch([], [], [], profile, state)
+        assert scores.shape == (0,)
+        assert scores.dtype == np.float32
+
+    def test_filter_candidates_rejects_visited_and_untrusted(
+            self, engine, nodes, state, verification):
+        """已访问或可信度过低的节点被剪枝"""
+        untrusted = NodeVerification(fake_rate=1.0)
+        verifications = [verification, untrusted, verification]
+
+        mask = engine.filter_candidates(nodes, verifications, state)
+
+        assert mask.tolist() == [False, False, True]
+        assert [engine.is_viable(n, v, state)
+                for n, v in zip(nodes, verifications)] == mask.tolist()
+
+    def test_fast_reject_scores_zero(self, engine, nodes, profile, state, verification):
+        """fast_reject时被淘汰的节点得分为0，其余与普通评分一致"""
+        edges_list = self._edges(nodes)
+        verifications = [verification] * len(nodes)
+
+        batch = engine.compute_scores_batch(
+            nodes, edges_list, verifications, profile, state, fast_reject=True
+        )
+
+        assert batch[0] == 0.0
+        assert engine.compute_score(
+            nodes[0], edges_list[0], verification, profile, state, fast_reject=True
+        ) == 0.0
+        np.testing.assert_allclose(
+            batch[1:],
+            [engine.compute_score(n, e, verification, profile, state)
+             for n, e in zip(nodes[1:], edges_list[1:])],
+            atol=1e-5
+        )
+
+    def test_match_score_cached_per_plan(self, engine, nodes, profile):
+        """同一(画像, 节点)只计算一次匹配度，clear_plan_cache后重新计算"""
+        first = engine.compute_match_score(nodes[0], profile)
+        profile.purpose['culture'] = 1.0  # 规划期间不应生效
+
+        assert engine.compute_match_score(nodes[0], profile) == first
+
+        engine.clear_plan_cache()
+        assert engine.compute_match_score(nodes[0], profile) > first
+
+    def test_batch_kernel_matches_numpy_fallback(self, engine):
+        """JIT内核（若可用）与NumPy降级实现结果一致"""
+        rng = np.random.default_rng(0)
+        n = 257
+        columns = [rng.random(n, dtype=np.float32) for _ in range(5)]
+        columns[2] *= 5  # rating ∈ [0, 5]
+        edge_time = rng.random(n, dtype=np.float32) * 3
+        has_edges = rng.random(n) > 0.2
+        visited = rng.random(n) > 0.7
+
+        args = (*columns, edge_time, has_edges, visited, engine._weight_vec)
+        np.testing.assert_allclose(
+            _score_batch(*args), _score_batch_numpy(*args), atol=1e-5
+        )
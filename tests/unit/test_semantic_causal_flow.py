@@ -0,0 +1,381 @@
+"""
+语义-因果流（W轴）单元测试
+验证批量语义流评分与逐个评分的一致性
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from src.core.models import Location, POIType, State
+from src.core.semantic_causal_flow import (
+    SemanticFlowAnalyzer, SemanticSoA, CausalFlowAnalyzer, SemanticCausalFlow, UserStateVector,
+    _bucket_state, _unbucket_state,
+    _tensions_batch, _tensions_numpy
+)
+
+
+class _FakeLLM:
+    """记录每次批量调用的prompt，首个prompt返回None（模拟失败）"""
+
+    def __init__(self):
+        self.calls = []
+
+    def batch_reason(self, prompts, **kwargs):
+        self.calls.append(prompts)
+        return [None] + [0.8] * (len(prompts) - 1)
+
+
+class TestSemanticFlowAnalyzer:
+    """语义流分析器测试类"""
+
+    @pytest.fixture
+    def analyzer(self):
+        """创建SemanticFlowAnalyzer实例"""
+        return SemanticFlowAnalyzer()
+
+    @pytest.fixture
+    def pois(self):
+        """覆盖各POI类型的候选"""
+        return [
+            Location(id=f"p{i}", name=f"POI{i}", lat=24.45, lon=118.08,
+                     type=poi_type, average_visit_time=1.0 + 0.5 * i)
+            for i, poi_type in enumerate(POIType)
+        ]
+
+    @pytest.mark.parametrize("energy", [0.2, 0.5, 0.9])
+    def test_batch_matches_scalar(self, analyzer, pois, energy):
+        """批量得分与逐个得分一致"""
+        user_state = UserStateVector(
+            physical_energy=energy, mental_energy=0.3, mood=0.3,
+            satiety=0.2, time_pressure=0.5
+        )
+        current = pois[0]
+
+        batch = analyzer.batch_compute_semantic_score(current, pois, user_state, [])
+        scalar = [
+            analyzer.compute_semantic_score(current, poi, user_state, [])[0]
+            for poi in pois
+        ]
+
+        assert batch.dtype == np.float32
+        np.testing.assert_allclose(batch, scalar, atol=1e-6)
+
+    def test_batch_empty(self, analyzer, pois):
+        """空候选返回空数组"""
+        user_state = UserStateVector(0.5, 0.5, 0.5, 0.5, 0.5)
+        scores = analyzer.batch_compute_semantic_score(pois[0], [], user_state, [])
+        assert scores.shape == (0,)
+
+    def test_intensity_threshold_explanation(self, analyzer, pois):
+        """体力中等时高强度候选得-0.3，不触发"强度过高"解释"""
+        user_state = UserStateVector(0.5, 0.8, 0.8, 0.5, 0.3)
+        entertainment = next(p for p in pois if p.type == POIType.ENTERTAINMENT)
+
+        _, explanation = analyzer.compute_semantic_score(
+            pois[0], entertainment, user_state, []
+        )
+
+        assert "强度过高" not in explanation
+
+    def test_content_blends_table_and_cosine(self, analyzer, pois):
+        """内容连贯性 = 0.7·相似度表 + 0.3·嵌入余弦（再叠加室内外交替加分）"""
+        restaurant = next(p for p in pois if p.type == POIType.RESTAURANT)
+        hotel = next(p for p in pois if p.type == POIType.HOTEL)
+        current = analyzer._lookup_semantics([restaurant])
+        nexts = analyzer._lookup_semantics([hotel])
+
+        content = analyzer._compute_content_coherence(current, nexts)
+
+        a, b = current.embeddings[0], nexts.embeddings[0]
+        cosine = a @ b / (np.linalg.norm(a) * np.linalg.norm(b))
+        # 余弦由int8量化嵌入计算，允许量化误差
+        np.testing.assert_allclose(content, [0.7 * 0.7 + 0.3 * cosine + 0.2], atol=3e-3)
+
+    def test_consecutive_high_intensity_penalized(self, analyzer, pois):
+        """连续高强度在查表得分基础上再扣0.3"""
+        user_state = UserStateVector(0.9, 0.8, 0.8, 0.5, 0.3)
+        entertainment = next(p for p in pois if p.type == POIType.ENTERTAINMENT)
+        current = analyzer._lookup_semantics([entertainment])
+
+        score = analyzer._compute_intensity_complementarity(current, current, user_state)
+
+        np.testing.assert_allclose(score, [0.8 - 0.3])
+
+    def test_precomputed_semantics_match_extracted(self, analyzer, pois):
+        """预计算的嵌入矩阵与逐个提取的语义向量一致，且评分结果不变"""
+        user_state = UserStateVector(0.5, 0.5, 0.5, 0.5, 0.5)
+        before = analyzer.batch_compute_semantic_score(pois[0], pois, user_state, [])
+
+        soa = analyzer.precompute_poi_semantics(pois)
+
+        assert soa.embeddings.shape == (len(pois), 8)
+        assert soa.embeddings.dtype == np.float32
+        np.testing.assert_array_equal(
+            soa.embeddings,
+            np.stack([analyzer._extract_semantic(p).to_embedding() for p in pois])
+        )
+        np.testing.assert_array_equal(
+            analyzer.batch_compute_semantic_score(pois[0], pois, user_state, []),
+            before
+        )
+
+    def test_cached_semantic_reuses_bucket(self, analyzer, pois):
+        """目录内POI对按状态分桶缓存，微小扰动命中缓存，重新预计算后失效"""
+        analyzer.precompute_poi_semantics(pois)
+        state_a = UserStateVector(0.50, 0.6, 0.6, 0.5, 0.3)
+        state_b = UserStateVector(0.501, 0.61, 0.65, 0.52, 0.9)
+
+        score_a, _ = analyzer.compute_semantic_score(pois[0], pois[1], state_a, [])
+        score_b, _ = analyzer.compute_semantic_score(pois[0], pois[1], state_b, [])
+        exact = analyzer.batch_compute_semantic_score(pois[0], [pois[1]], state_a, [])[0]
+
+        assert score_a == score_b
+        assert abs(score_a - exact) < 1e-3
+        assert analyzer._cached_semantic.cache_info().hits == 1
+
+        analyzer.precompute_poi_semantics(pois)
+        assert analyzer._cached_semantic.cache_info().currsize == 0
+
+    def test_semantics_registered_on_demand(self, analyzer, pois):
+        """未预计算的POI评分时按需登记到目录，同ID属性变化后覆盖该行"""
+        user_state = UserStateVector(0.5, 0.6, 0.6, 0.5, 0.3)
+
+        analyzer.compute_semantic_score(pois[0], pois[1], user_state, [])
+        analyzer.batch_compute_semantic_score(pois[0], pois[1:4], user_state, [])
+
+        assert list(analyzer.poi_semantics.index) == ["p0", "p1", "p2", "p3"]
+        assert analyzer.poi_semantics.embeddings.shape == (4, 8)
+
+        changed = Location(id="p1", name="改名", lat=24.45, lon=118.08,
+                           type=pois[3].type, average_visit_time=pois[3].average_visit_time)
+        score, _ = analyzer.compute_semantic_score(pois[0], changed, user_state, [])
+
+        assert analyzer._cached_semantic.cache_info().currsize == 1
+        assert score == analyzer.compute_semantic_score(pois[0], pois[3], user_state, [])[0]
+        np.testing.assert_array_equal(
+            analyzer.poi_semantics.embeddings[1], analyzer.poi_semantics.embeddings[3]
+        )
+
+    def test_on_demand_registration_grows_buffer(self, analyzer):
+        """逐对登记只在容量不足时倍增扩容，目录各列与整体预计算一致"""
+        user_state = UserStateVector(0.5, 0.6, 0.6, 0.5, 0.3)
+        types = list(POIType)
+        many = [
+            Location(id=f"q{i}", name=f"POI{i}", lat=24.45, lon=118.08,
+                     type=types[i % len(types)], average_visit_time=1.0 + i % 4)
+            for i in range(300)
+        ]
+        capacities = set()
+        for current, nxt in zip(many, many[1:]):
+            analyzer.compute_semantic_score(current, nxt, user_state, [])
+            capacities.add(len(analyzer._semantic_buffer.type_id))
+
+        assert sorted(capacities) == [64, 128, 256, 512]
+        expected = SemanticSoA.from_pois(many)
+        assert analyzer.poi_semantics.index == expected.index
+        np.testing.assert_array_equal(analyzer.poi_semantics.embeddings, expected.embeddings)
+        np.testing.assert_array_equal(
+            analyzer.poi_semantics.unit_embeddings_q, expected.unit_embeddings_q
+        )
+
+    def test_bucket_preserves_rule_thresholds(self):
+        """分桶还原的状态与原状态落在相同的阈值分支"""
+        for value in (0.0, 0.3, 0.4, 0.4001, 0.7, 0.7001, 1.0):
+            state = UserStateVector(value, value, value, value, 0.0)
+            restored = _unbucket_state(_bucket_state(state))
+
+            assert (restored.physical_energy > 0.4) == (value > 0.4)
+            assert (restored.physical_energy > 0.7) == (value > 0.7)
+            assert (restored.mental_energy < 0.4) == (value < 0.4)
+            assert (restored.satiety < 0.3) == (value < 0.3)
+            assert (restored.satiety > 0.7) == (value > 0.7)
+            assert (restored.mood < 0.4) == (value < 0.4)
+
+
+class TestCausalFlowAnalyzer:
+    """因果流分析器测试类"""
+
+    @pytest.fixture
+    def analyzer(self):
+        """纯规则模式的CausalFlowAnalyzer"""
+        return CausalFlowAnalyzer()
+
+    @pytest.fixture
+    def tasks(self):
+        """覆盖不同区域、时段、类型组合的任务"""
+        current = Location(id="c", name="南普陀寺", lat=24.44, lon=118.10,
+                           type=POIType.ATTRACTION)
+        candidates = [
+            Location(id="n1", name="鼓浪屿日光岩", lat=24.45, lon=118.07,
+                     type=POIType.ATTRACTION),
+            Location(id="n2", name="沙茶面", lat=24.45, lon=118.08,
+                     type=POIType.RESTAURANT, address="中山路12号"),
+            Location(id="n3", name="海景咖啡", lat=24.43, lon=118.15,
+                     type=POIType.RESTAURANT, address="曾厝垵"),
+        ]
+        visited = {'鼓浪屿': 1, '中山路': 2}
+        return [
+            {'current': current, 'next': poi,
+             'context': {'time_of_day': hour, 'visited_regions': visited}}
+            for poi in candidates
+            for hour in (9, 12, 17.5, 21)
+        ]
+
+    def test_batch_tensions_match_scalar(self, analyzer, tasks):
+        """批量张力与逐个计算一致"""
+        batch = analyzer._compute_tensions_batch(tasks)
+        rows = analyzer._split_tensions(batch)
+
+        assert rows == [analyzer._compute_tensions(task) for task in tasks]
+        assert batch['novelty'].shape == (len(tasks),)
+
+    def test_tensions_kernel_matches_numpy_fallback(self):
+        """JIT张力内核（若可用）与NumPy降级实现结果一致"""
+        rng = np.random.default_rng(0)
+        n = 257
+        args = (
+            rng.integers(0, 3, n).astype(np.int8),
+            rng.integers(0, 3, n).astype(np.int8),
+            rng.integers(0, 4, n).astype(np.int16),
+            rng.choice([8, 11, 12.5, 13, 16, 17, 18, 19, 21], n).astype(np.float32),
+            rng.random(n) > 0.5,
+            rng.random(n) > 0.5,
+        )
+
+        for jit_col, numpy_col in zip(_tensions_batch(*args), _tensions_numpy(*args)):
+            np.testing.assert_array_equal(jit_col, numpy_col)
+
+    def test_rule_results_match_simple_score(self, analyzer, tasks):
+        """纯规则批量结果的c_causal与简化规则分数一致"""
+        results = analyzer.batch_compute_causal_flow(tasks)
+
+        assert [r['c_causal'] for r in results] == [
+            analyzer._rule_causal_score_simple(task) for task in tasks
+        ]
+
+    def test_meal_time_restaurant_energy(self, analyzer, tasks):
+        """饭点的餐厅体力张力+0.4"""
+        lunch = next(t for t in tasks
+                     if t['next'].id == "n2" and t['context']['time_of_day'] == 12)
+
+        assert analyzer._compute_tensions(lunch)['energy'] == pytest.approx(0.6)
+
+    def test_region_priority_and_meta_cache(self, analyzer):
+        """多区域命中时按固定优先级取区域，元信息只计算一次"""
+        poi = Location(id="x", name="厦大白城", lat=24.43, lon=118.10,
+                       type=POIType.ATTRACTION, address="环岛路近鼓浪屿轮渡")
+
+        assert analyzer._get_region(poi) == "鼓浪屿"
+        assert analyzer._poi_meta["x"] == analyzer._get_poi_meta(poi)
+        assert analyzer._get_poi_meta(poi)[1] is True  # 名称含"厦大"
+
+    def test_spatial_reasoning_fallbacks(self, tasks):
+        """推理接口在初始化时解析；返回值无法转换时降级为0.6"""
+
+        class _Oracle:
+            def reason_causality(self, current, next_poi, context):
+                return 0.9 if next_poi.id == "n1" else "n/a"
+
+        analyzer = CausalFlowAnalyzer(spatial_intelligence=_Oracle())
+        scores = analyzer._batch_spatial_reason(tasks)
+
+        assert set(scores) == {0.9, 0.6}
+        assert CausalFlowAnalyzer(spatial_intelligence=object())._batch_spatial_reason(
+            tasks[:1]) == [0.6]
+
+    @pytest.fixture
+    def llm(self):
+        """假LLM客户端"""
+        return _FakeLLM()
+
+    def test_llm_prompts_from_template(self, tasks, llm):
+        """LLM路径按模板生成prompt，失败项降级为规则分数"""
+        analyzer = CausalFlowAnalyzer(llm_client=llm)
+        results = analyzer.batch_compute_causal_flow(tasks)
+        prompts = llm.calls[0]
+
+        assert any("候选：沙茶面（中山路区域）" in p and "该区域已访问：2次" in p
+                   for p in prompts)
+        assert any("时间：17.5点" in p for p in prompts)
+
+        failed = [r['c_causal'] != 0.8 for r in results]
+        assert sum(failed) == 1
+        task = tasks[failed.index(True)]
+        assert results[failed.index(True)]['c_causal'] == \
+            analyzer._rule_causal_score_simple(task)
+
+    def test_llm_prompts_deduplicated_and_cached(self, tasks, llm):
+        """重复任务只发送一次，成功的得分跨批次复用，失败的下次重试"""
+        analyzer = CausalFlowAnalyzer(llm_client=llm)
+
+        first = analyzer.batch_compute_causal_flow(tasks + tasks)
+        second = analyzer.batch_compute_causal_flow(tasks)
+
+        assert len(llm.calls[0]) == len(tasks)
+        assert len(llm.calls[1]) == 1  # 仅上次失败的prompt
+        assert first[:len(tasks)] == first[len(tasks):]
+        assert [r['c_causal'] for r in second].count(0.8) == len(tasks) - 1
+
+    def test_prompt_cache_per_analyzer(self, tasks, llm):
+        """prompt得分只在同一分析器内复用，另一客户端与清空缓存后重新请求"""
+        analyzer = CausalFlowAnalyzer(llm_client=llm)
+        other_llm = _FakeLLM()
+
+        analyzer.batch_compute_causal_flow(tasks)
+        CausalFlowAnalyzer(llm_client=other_llm).batch_compute_causal_flow(tasks)
+        assert len(other_llm.calls[0]) == len(tasks)
+
+        analyzer.clear_caches()
+        analyzer.batch_compute_causal_flow(tasks)
+        assert len(llm.calls[1]) == len(tasks)
+
+
+class TestSemanticCausalFlow:
+    """W轴整体测试类"""
+
+    def test_w_axis_force_with_remote_reasoning(self):
+        """因果推理在线程池中执行，结果与F_wc公式一致"""
+        class _Oracle:
+            def __init__(self):
+                self.thread = None
+
+            def reason_causality(self, current, next_poi, context):
+                self.thread = threading.current_thread()
+                return 0.9
+
+        oracle = _Oracle()
+        w_axis = SemanticCausalFlow(spatial_intelligence=oracle, delta=0.1, epsilon=0.2)
+        current = Location(id="a", name="南普陀寺", lat=24.44, lon=118.10,
+                           type=POIType.ATTRACTION)
+        nxt = Location(id="b", name="沙茶面", lat=24.45, lon=118.08,
+                       type=POIType.RESTAURANT)
+        state = State(current_location=current, current_time=12.0)
+        user_state = UserStateVector(0.6, 0.6, 0.6, 0.2, 0.3)
+
+        f_wc, details = w_axis.compute_w_axis_force(
+            current, nxt, user_state, {'weather': 'sunny'}, state, []
+        )
+
+        assert oracle.thread is not threading.current_thread()
+        assert details['C_causal'] == pytest.approx(0.5 * 0.9 + 0.5 * 0.8)
+        assert f_wc == pytest.approx(0.1 * details['S_sem'] + 0.2 * details['C_causal'])
+
+        w_axis.close()
+        assert w_axis._exec is None
+
+    def test_rule_only_w_axis_creates_no_pool(self):
+        """纯规则推理不创建线程池，close可重复调用"""
+        w_axis = SemanticCausalFlow()
+        current = Location(id="a", name="南普陀寺", lat=24.44, lon=118.10,
+                           type=POIType.ATTRACTION)
+        state = State(current_location=current, current_time=12.0)
+
+        w_axis.compute_w_axis_force(
+            current, current, UserStateVector(0.6, 0.6, 0.6, 0.5, 0.3), {}, state, []
+        )
+
+        assert w_axis._exec is None
+        w_axis.close()
+        w_axis.close()
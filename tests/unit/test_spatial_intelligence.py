@@ -0,0 +1,410 @@
+"""
+空间智能核心单元测试
+验证向量化的空间网络构建与逐对计算一致
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src.core.models import Location, POIType, State, PlanningSession
+import src.core.spatial_intelligence as spatial_intelligence
+from src.core.spatial_intelligence import (
+    SpatialIntelligenceCore, _haversine_from, _haversine_kernel, _haversine_matrix,
+    _impact_kernel, _impact_numpy
+)
+
+# 节点坐标以float32存储（经度约0.4m分辨率），网络内的距离与逐点计算相差在米级以内
+COORD_ATOL_KM = 1e-3
+COORD_ATOL_H = COORD_ATOL_KM / 5
+
+
+class TestSpatialIntelligenceCore:
+    """空间智能核心测试类"""
+
+    @pytest.fixture
+    def core(self):
+        """创建SpatialIntelligenceCore实例"""
+        return SpatialIntelligenceCore()
+
+    @pytest.fixture
+    def pois(self):
+        """候选POI（含1km内的近邻）"""
+        return [
+            Location(id="a", name="南普陀寺", lat=24.4400, lon=118.1000,
+                     type=POIType.ATTRACTION, ticket_price=0.0),
+            Location(id="b", name="厦门大学", lat=24.4380, lon=118.0980,
+                     type=POIType.ATTRACTION, ticket_price=0.0),
+            Location(id="c", name="沙茶面", lat=24.4550, lon=118.0800,
+                     type=POIType.RESTAURANT, average_visit_time=1.0,
+                     ticket_price=30.0),
+            Location(id="d", name="鼓浪屿", lat=24.4470, lon=118.0660,
+                     type=POIType.ATTRACTION, average_visit_time=4.0,
+                     ticket_price=100.0),
+        ]
+
+    @pytest.fixture
+    def state(self, pois):
+        """当前状态（位于南普陀寺）"""
+        return State(current_location=pois[0], current_time=5.0,
+                     remaining_budget=300.0)
+
+    @pytest.fixture
+    def session(self):
+        """规划会话（8小时）"""
+        return PlanningSession(duration=8.0, budget=500.0)
+
+    def test_initialize_matches_pairwise(self, core, pois):
+        """向量化构建的距离与时间与逐对haversine一致"""
+        core.initialize(pois)
+        engine = core.foresight_engine
+        network = core.spatial_network
+
+        for p in pois:
+            for q in pois:
+                if p.id == q.id:
+                    continue
+                expected = engine._haversine_distance(p.lat, p.lon, q.lat, q.lon)
+                assert network.get_distance(p.id, q.id) == pytest.approx(
+                    expected, abs=COORD_ATOL_KM)
+                assert network.get_travel_time(p.id, q.id) == pytest.approx(
+                    engine._estimate_travel_time(expected), abs=COORD_ATOL_H
+                )
+
+        assert network.get_distance("a", "zzz") == float('inf')
+
+    def test_network_matrices(self, core, pois):
+        """边存储为float32矩阵，按id_to_idx索引，自环为inf"""
+        core.initialize(pois)
+        network = core.spatial_network
+
+        assert network.dist_matrix.dtype == np.float32
+        assert network.dist_matrix.shape == (len(pois), len(pois))
+        assert [network.id_to_idx[p.id] for p in pois] == list(range(len(pois)))
+        assert network.get_distance("a", "a") == float('inf')
+
+        network.add_node(Location(id="e", name="新节点", lat=24.5, lon=118.1,
+                                  type=POIType.SHOPPING))
+        network.add_edge("a", "e", 1.5, 0.2)
+        assert network.get_distance("a", "e") == pytest.approx(1.5)
+        assert network.get_travel_time("e", "a") == float('inf')
+        assert network.get_distance("c", "d") == pytest.approx(
+            core._calculate_distance(pois[2], pois[3]), abs=COORD_ATOL_KM
+        )
+
+    def test_batch_impact_matches_scalar(self, core, pois, state, session):
+        """批量影响分析（取距离矩阵行）与逐个分析一致"""
+        core.initialize(pois)
+        engine = core.foresight_engine
+        batch = engine.analyze_choice_impact_batch(pois, state, session)
+
+        assert len(batch) == len(pois)
+        for poi, impact in zip(pois, batch):
+            expected = engine.analyze_choice_impact(poi, state, session)
+            for field in ('spatial_impact', 'time_impact', 'budget_impact',
+                          'reachability_impact'):
+                got, want = getattr(impact, field), getattr(expected, field)
+                assert got.keys() == want.keys()
+                for key, value in want.items():
+                    if isinstance(value, str):
+                        assert got[key] == value
+                    else:
+                        # 交通费用按每公里3元放大距离误差
+                        assert got[key] == pytest.approx(value, abs=3 * COORD_ATOL_KM)
+
+        assert engine.analyze_choice_impact_batch([], state, session) == []
+
+    def test_return_constraint_uses_precomputed_times(self, core, pois, state, session):
+        """回程时间取自预计算向量，与逐个计算一致"""
+        core.initialize(pois)
+        station = Location(id="station", name="厦门站", lat=24.4690, lon=118.1150,
+                           type=POIType.TRANSPORT_HUB)
+        session.hard_constraints['return'] = {'time': 9.0, 'location': station}
+
+        for poi in pois:
+            expected = core._estimate_time(core._calculate_distance(poi, station))
+            assert core._return_travel_time(poi, station) == pytest.approx(
+                expected, abs=COORD_ATOL_H)
+
+        risk = core.analyze_with_risk_level(pois[3], state, session)
+        assert risk.risk_level == 'critical'
+        assert risk.risk_type == 'return'
+        assert risk.constraint_violations[0]['details']['return_travel_time'] == pytest.approx(
+            core._estimate_time(core._calculate_distance(pois[3], station)), abs=COORD_ATOL_H
+        )
+
+    @pytest.mark.parametrize("budget,current_time", [
+        (300.0, 5.0), (120.0, 5.0), (60.0, 1.0), (1000.0, 6.8), (1000.0, 1.0),
+    ])
+    def test_risk_batch_matches_scalar(self, core, pois, session, budget, current_time):
+        """批量风险评估与逐个analyze_with_risk_level一致"""
+        core.initialize(pois)
+        station = Location(id="station", name="厦门站", lat=24.4690, lon=118.1150,
+                           type=POIType.TRANSPORT_HUB)
+        session.hard_constraints['return'] = {'time': 10.0, 'location': station,
+                                              'mode': '动车'}
+        state = State(current_location=pois[0], current_time=current_time,
+                      remaining_budget=budget)
+
+        batch = core.analyze_with_risk_level_batch(pois, state, session)
+        for poi, risk in zip(pois, batch):
+            expected = core.analyze_with_risk_level(poi, state, session)
+            assert (risk.risk_level, risk.risk_type) == (expected.risk_level, expected.risk_type)
+            assert len(risk.constraint_violations) == len(expected.constraint_violations)
+            for got, want in zip(risk.constraint_violations, expected.constraint_violations):
+                assert got['details'].keys() == want['details'].keys()
+                assert got['details']['arrive_time'] == want['details']['arrive_time']
+                assert got['details']['late_by'] == pytest.approx(
+                    want['details']['late_by'], abs=COORD_ATOL_H)
+
+    def test_kernels_match_numpy_fallback(self):
+        """JIT内核与NumPy降级实现结果一致"""
+        rng = np.random.default_rng(0)
+        n = 257
+        lats = 24.4 + rng.random(n) * 0.1
+        lons = 118.0 + rng.random(n) * 0.1
+        np.testing.assert_allclose(
+            _haversine_kernel(24.45, 118.05, lats, lons),
+            _haversine_from(24.45, 118.05, lats, lons), rtol=1e-12
+        )
+
+        args = (rng.random(n) * 8, rng.random(n) * 3, rng.random(n) * 200,
+                4.0, 8.0, 250.0, rng.random(n), 9.0)
+        for got, want in zip(_impact_kernel(*args), _impact_numpy(*args)):
+            np.testing.assert_allclose(got, want, rtol=1e-12)
+
+    def test_sklearn_matrix_matches_numpy(self, monkeypatch):
+        """scikit-learn两两距离与NumPy广播实现一致"""
+        pytest.importorskip("sklearn")
+        rng = np.random.default_rng(1)
+        lats = 24.4 + rng.random(50) * 0.1
+        lons = 118.0 + rng.random(50) * 0.1
+
+        with_sklearn = _haversine_matrix(lats, lons)
+        monkeypatch.setattr(spatial_intelligence, 'SKLEARN_AVAILABLE', False)
+        np.testing.assert_allclose(with_sklearn, _haversine_matrix(lats, lons),
+                                   rtol=1e-9, atol=1e-9)
+
+    @pytest.mark.parametrize("rate,level", [
+        (0.0, 'low'), (0.3, 'medium'), (0.69, 'medium'), (0.7, 'high'),
+        (0.9, 'critical'), (1.5, 'critical'),
+    ])
+    def test_describe_usage_thresholds(self, core, rate, level):
+        """使用率查表分档与阈值边界一致"""
+        assert core.constraint_monitor._describe_usage(rate)['level'] == level
+
+    def test_travel_time_threshold(self, core):
+        """1km内步行，1km起打车加等待时间"""
+        engine = core.foresight_engine
+        assert engine._estimate_travel_time(0.5) == pytest.approx(0.1)
+        assert engine._estimate_travel_time(1.0) == pytest.approx(0.15)
+
+    def test_get_cluster_reverse_index(self, core, pois):
+        """get_cluster通过poi_id反向索引查簇"""
+        core.initialize(pois)
+        network = core.spatial_network
+
+        for name, members in network.clusters.items():
+            for poi in members:
+                assert network.get_cluster(poi) == name
+        assert network.get_cluster(Location(id="zzz", name="未知", lat=0.0, lon=0.0,
+                                            type=POIType.SHOPPING)) is None
+
+    def test_analyze_candidates_top_clusters(self, core, pois, state, session):
+        """只分析最近簇内的候选；默认分析全部"""
+        far = [
+            Location(id=f"far{i}", name=f"远郊{i}", lat=24.80 + i * 0.001, lon=118.30,
+                     type=POIType.ATTRACTION)
+            for i in range(3)
+        ]
+        everything = pois + far
+        core.initialize(everything)
+        network = core.spatial_network
+
+        assert network.get_cluster(far[0]) == network.get_cluster(far[2])
+        assert network.get_cluster(far[0]) != network.get_cluster(pois[0])
+
+        assert len(core.analyze_candidates(everything, state, session)) == len(everything)
+        nearest = core.analyze_candidates(everything, state, session, top_k_clusters=1)
+        kept_ids = {a['poi'].id for a in nearest}
+        assert kept_ids
+        assert not kept_ids & {p.id for p in far}
+        assert "a" in kept_ids
+
+    def test_reachability_filters_time_and_budget(self, core, pois, session):
+        """可达性：空间索引近邻 + 时间/预算精确过滤，排除已访问与自身"""
+        core.initialize(pois)
+        state = State(current_location=pois[0], current_time=1.0,
+                      remaining_budget=1000.0, visited_history={"a"})
+        engine = core.foresight_engine
+
+        reach = engine._analyze_reachability(pois[1], state, session, 5.0, 1000.0)
+        assert set(reach['reachable_ids']) == {"c", "d"}
+        assert reach['reachable_count'] == 2
+
+        # 预算不够鼓浪屿门票，时间不够鼓浪屿游览
+        assert engine._analyze_reachability(
+            pois[1], state, session, 5.0, 60.0)['reachable_ids'] == ["c"]
+        assert engine._analyze_reachability(
+            pois[1], state, session, 2.0, 1000.0)['reachable_ids'] == ["c"]
+        assert engine._analyze_reachability(
+            pois[1], state, session, 0.0, 1000.0)['reachable_count'] == 0
+
+    def test_reachability_without_network(self, core, pois, state, session):
+        """空间网络未初始化时只返回基本说明"""
+        reach = core.foresight_engine._analyze_reachability(pois[1], state, session)
+        assert 'reachable_count' not in reach
+        assert reach['description']
+
+    def test_descriptions_generated_on_demand(self, core, pois, state, session):
+        """describe=False只含数值，to_user_message时再补齐描述"""
+        core.initialize(pois)
+        engine = core.foresight_engine
+
+        lazy = engine.analyze_choice_impact(pois[2], state, session, describe=False)
+        assert 'time_status' not in lazy.time_impact
+        assert 'description' not in lazy.spatial_impact
+
+        eager = engine.analyze_choice_impact(pois[2], state, session)
+        assert lazy.to_user_message() == eager.to_user_message()
+        assert lazy.time_impact == eager.time_impact
+
+        risk = core.analyze_with_risk_level(pois[2], state, session)
+        assert 'budget_status' not in risk.impact.budget_impact
+
+        status = core.constraint_monitor.monitor(state, session, describe=False)
+        assert 'description' not in status.time_usage
+        assert status.describe().time_usage['description'] == \
+            core.get_global_status(state, session)['time']['description']
+
+    def test_prepared_session_cached(self, core, pois, state, session):
+        """会话常量按会话缓存，回程约束被替换时重建"""
+        station = Location(id="station", name="厦门站", lat=24.4690, lon=118.1150,
+                           type=POIType.TRANSPORT_HUB)
+        session.hard_constraints['return'] = {
+            'time': datetime(2024, 5, 1, 9, 30), 'location': station
+        }
+
+        prep = core._get_prep(session)
+        assert prep.deadline_hours == 9.0
+        assert (prep.return_lat, prep.return_lon) == (24.4690, 118.1150)
+        assert core._get_prep(session) is prep
+
+        session.hard_constraints['return'] = {'time': 20.5, 'location': station}
+        assert core._get_prep(session).deadline_hours == 20.5
+        assert core.analyze_with_risk_level(pois[3], state, session).risk_type != 'return'
+
+        session.hard_constraints.pop('return')
+        assert core._get_prep(session).return_location is None
+
+    def test_cluster_meta(self, core, pois):
+        """簇汇总与成员逐个计算一致"""
+        core.initialize(pois)
+        network = core.spatial_network
+
+        assert network.cluster_meta.keys() == network.clusters.keys()
+        for name, members in network.clusters.items():
+            meta = network.cluster_meta[name]
+            assert meta['count'] == len(members)
+            assert sorted(network.node_ids[i] for i in meta['ids']) == sorted(p.id for p in members)
+            assert meta['centroid'] == pytest.approx(
+                (np.mean([p.lat for p in members]), np.mean([p.lon for p in members])), abs=1e-5
+            )
+            assert meta['avg_ticket'] == pytest.approx(np.mean([p.ticket_price for p in members]))
+
+    def test_monitor_incremental(self, core, pois, state, session):
+        """同一会话连续监控只重算变化的部分，结果与全新监控一致"""
+        monitor = core.constraint_monitor
+        first = monitor.monitor(state, session)
+        cached = monitor._states[id(session)].status
+        again = monitor.monitor(state, session)
+        assert again == first
+        assert monitor._states[id(session)].status.time_usage is cached.time_usage
+        assert monitor._states[id(session)].status.budget_usage is cached.budget_usage
+
+        moved = state.copy()
+        moved.current_time += 1.5
+        moved.visited_history.add("c")
+        status = monitor.monitor(moved, session)
+        assert monitor._states[id(session)].status.time_usage is not cached.time_usage
+        assert monitor._states[id(session)].status.budget_usage is cached.budget_usage
+
+        fresh = type(monitor)().monitor(moved, session)
+        assert status == fresh
+        assert first.time_usage['used'] == state.current_time
+
+    def test_monitor_returns_copies(self, core, state, session):
+        """修改返回的状态不影响缓存，也不影响之后复用的结果"""
+        monitor = core.constraint_monitor
+        first = monitor.monitor(state, session)
+        expected = monitor.monitor(state, session)
+
+        first.time_usage['used'] = -1.0
+        first.budget_usage['status']['level'] = "tampered"
+        first.spatial_coverage['visited_ids'].append("tampered")
+        first.variety.clear()
+
+        assert monitor.monitor(state, session) == expected
+        assert expected.time_usage['used'] == state.current_time
+
+    def test_return_violation_short_circuits(self, core, pois, state, session):
+        """网络内候选赶不上回程时跳过影响分析，违反记录与完整检查一致"""
+        core.initialize(pois)
+        station = Location(id="station", name="厦门站", lat=24.4690, lon=118.1150,
+                           type=POIType.TRANSPORT_HUB)
+        session.hard_constraints['return'] = {'time': 9.0, 'location': station,
+                                              'mode': '动车'}
+
+        fast = core.analyze_with_risk_level(pois[3], state, session)
+        assert fast.impact is None
+        assert (fast.risk_level, fast.risk_type) == ('critical', 'return')
+
+        impact = core.foresight_engine.analyze_choice_impact(pois[3], state, session)
+        full = core._check_hard_constraints(pois[3], state, session, impact)
+        got, want = fast.constraint_violations[0]['details'], full[0]['details']
+        assert got['arrive_time'] == want['arrive_time']
+        assert got['consequence'] == want['consequence'] == "错过动车"
+        assert got['late_by'] == pytest.approx(want['late_by'], abs=COORD_ATOL_H)
+
+        # 赶得上回程时照常做完整分析
+        assert core.analyze_with_risk_level(pois[1], state, session).impact is not None
+
+    def test_prepare_session_matches_engine(self, core, pois, state, session):
+        """会话专用分析函数与analyze_choice_impact一致"""
+        core.initialize(pois)
+        analyze = core.prepare_session(session)
+
+        for poi in pois:
+            got = analyze(poi, state)
+            want = core.foresight_engine.analyze_choice_impact(poi, state, session)
+            assert got == want
+
+        lazy = core.prepare_session(session, describe=False)(pois[2], state)
+        assert 'time_status' not in lazy.time_impact
+
+    def test_reachability_batch_chunks_match_scalar(self, core, pois, session, monkeypatch):
+        """分块（多线程）批量可达性与逐个分析一致"""
+        monkeypatch.setattr(spatial_intelligence, '_REACH_CHUNK_ROWS', 1)
+        core.initialize(pois)
+        state = State(current_location=pois[0], current_time=1.0,
+                      remaining_budget=200.0, visited_history={"b"})
+        engine = core.foresight_engine
+
+        batch = engine.analyze_choice_impact_batch(pois, state, session, describe=False)
+        for poi, impact in zip(pois, batch):
+            expected = engine._analyze_reachability(
+                poi, state, session,
+                impact.time_impact['remaining_after'],
+                impact.budget_impact['remaining_after']
+            )
+            assert impact.reachability_impact == expected
+        assert any(i.reachability_impact['reachable_count'] for i in batch)
+
+        # 线程池跨调用复用，close()后释放
+        executor = engine._exec
+        assert executor is not None
+        assert engine.analyze_choice_impact_batch(pois, state, session, describe=False) == batch
+        assert engine._exec is executor
+        core.close()
+        assert engine._exec is None
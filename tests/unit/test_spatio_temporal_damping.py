@@ -97,6 +97,45 @@ class TestSpatioTemporalDamping:
         assert result.zone_factor >= 1.0, "商业区夜间应该正常或加成"
         assert result.edge_color in ["green", "yellow"], "应该是绿色或黄色边"
     
+    @pytest.mark.parametrize("hour,expected_factor", [
+        (7.0, 0.4),    # 夜间区间右端点（含）
+        (7.25, 0.7),
+        (18.0, 0.4),   # 夜间区间左端点（含）
+        (24.0, 0.4),
+        (25.0, 0.7),   # 超出规则区间走兜底
+    ])
+    def test_industrial_zone_hour_boundaries(self, damping, hour, expected_factor):
+        """测试分桶查表与闭区间边界一致"""
+        factor = damping._calculate_zone_factor("工业园区", hour)
+        
+        assert factor.score_modifier == expected_factor
+    
+    def test_zone_reasons_formatted_lazily(self, damping):
+        """测试区域理由在计算路径上保持为(模板, 区域)对，访问reasons时才格式化"""
+        result = damping.calculate_damping(
+            from_zone="居住区",
+            to_zone="金鸡湖",
+            current_hour=14.0
+        )
+        
+        assert result.reason_parts[0] == ("{zone}为CBD，工作时段交通便利", "金鸡湖")
+        assert result.reasons[0] == "金鸡湖为CBD，工作时段交通便利"
+        assert "金鸡湖为CBD" in str(result)
+    
+    @pytest.mark.parametrize("hour,expected_flow", [
+        (7.5, TrafficFlow.AGAINST_FLOW),
+        (9.5, TrafficFlow.AGAINST_FLOW),
+        (9.75, TrafficFlow.NEUTRAL),
+        (19.5, TrafficFlow.WITH_FLOW),
+    ])
+    def test_flow_factor_table(self, damping, hour, expected_flow):
+        """测试潮汐因子查表（出CBD方向）"""
+        damping._zone_cache.update({"国贸": ZoneType.CBD, "小区": ZoneType.RESIDENTIAL})
+        factor = damping._calculate_flow_factor("国贸", "小区", hour)
+        
+        assert factor.flow_type == expected_flow
+        assert factor is damping._calculate_flow_factor("国贸", "小区", hour)
+    
     # ========================================================================
     # 测试活力因子（L_activity）
     # ========================================================================
@@ -133,6 +172,18 @@ class TestSpatioTemporalDamping:
         assert result.activity_factor == expected_factor, \
             f"{expected_level}级别活跃度应该是{expected_factor}"
     
+    @pytest.mark.parametrize("active_devices,expected_level", [
+        (9.9, 'ghost'), (10, 'low'), (49, 'low'), (50, 'medium'),
+        (199, 'medium'), (200, 'high'), (500, 'overload'),
+    ])
+    def test_activity_thresholds(self, damping, active_devices, expected_level):
+        """测试活跃度分档边界（阈值本身归入较高一档）"""
+        factor = damping._calculate_activity_factor(
+            "测试区域", {'active_devices': active_devices}
+        )
+        
+        assert factor.activity_level == expected_level
+    
     def test_overload_crowd_warning(self, damping):
         """测试过载时的人群警告"""
         result = damping.calculate_damping(
@@ -212,6 +263,13 @@ class TestSpatioTemporalDamping:
         )
         assert result_low.edge_color == "red"
     
+    @pytest.mark.parametrize("modifier,expected_color", [
+        (0.59, "red"), (0.6, "yellow"), (0.99, "yellow"), (1.0, "green"), (1.5, "green")
+    ])
+    def test_edge_color_thresholds(self, damping, modifier, expected_color):
+        """测试边颜色分档边界（阈值本身归入较好一档）"""
+        assert damping._determine_edge_color(modifier) == expected_color
+    
     # ========================================================================
     # 测试机会卡片生成
     # ========================================================================
@@ -265,3 +323,29 @@ class TestZoneIdentification:
         """测试未知区域"""
         zone_type = damping._identify_zone_type("某随机地点")
         assert zone_type == ZoneType.UNKNOWN
+    
+    def test_identify_industrial_precedes_cbd(self, damping):
+        """同时命中工业区关键词与CBD区域时，工业区优先"""
+        assert "工业园区" in damping.cbd_areas['苏州']
+        assert damping._identify_zone_type("工业园区") == ZoneType.INDUSTRIAL
+    
+    def test_automaton_matches_linear_scan(self, damping):
+        """Aho-Corasick自动机与逐关键词扫描的识别结果一致（含优先级）"""
+        pytest.importorskip("ahocorasick")
+        zones = ["苏州工业园区", "陆家嘴商场", "国贸物流园", "金鸡湖", "南京西路步行街", "某随机地点"]
+        
+        with_automaton = [damping._identify_zone_type(z) for z in zones]
+        linear = SpatioTemporalDamping()
+        linear._zone_automaton = None
+        
+        assert with_automaton == [linear._identify_zone_type(z) for z in zones]
+        assert with_automaton[:3] == [ZoneType.INDUSTRIAL, ZoneType.COMMERCIAL, ZoneType.INDUSTRIAL]
+    
+    def test_identify_cached(self, damping):
+        """同一区域名第二次识别直接命中缓存"""
+        first = damping._identify_zone_type("陆家嘴")
+        damping._zone_keywords = ()  # 清空索引后仍应返回缓存结果
+        damping._zone_automaton = None
+        
+        assert damping._identify_zone_type("陆家嘴") == first == ZoneType.CBD
+        assert damping._identify_zone_type("国贸") == ZoneType.UNKNOWN
@@ -0,0 +1,216 @@
+"""
+三维决策空间单元测试
+验证静态快照与写时复制工作区的隔离
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.core.models import Location, POIType
+from src.core.neural_net_service import NeuralNetService
+from src.core.three_dimensional_plan import (
+    ThreeDimensionalPlan, TimelineNode, DecisionPoint, NodeStatus
+)
+
+
+def _build_timeline(y_steps=4, x_alternatives=3):
+    """构造y_steps个时间节点、每个节点x_alternatives个备选的时间线"""
+    start = datetime(2024, 12, 2, 9, 0)
+    timeline = []
+    for y in range(y_steps):
+        time = start + timedelta(hours=2.5 * y)
+        node = TimelineNode(y_index=y, time=time, duration=2.0)
+        for x in range(x_alternatives):
+            node.decision_points.append(DecisionPoint(
+                x=x, y=y, z=0.9 - 0.1 * x,
+                option=Location(id=f"y{y}x{x}", name=f"POI{y}-{x}",
+                                lat=24.45, lon=118.08, type=POIType.ATTRACTION),
+                time=time,
+                duration=2.0,
+                status=NodeStatus.SELECTED if x == 0 else NodeStatus.ALTERNATIVE
+            ))
+        timeline.append(node)
+    return timeline
+
+
+def _selection(nodes):
+    """各节点的(选中下标, 选中时间, 各备选状态)"""
+    return [
+        (node.selected_x, node.time,
+         [(point.status, point.time, point.is_adjusted) for point in node.decision_points])
+        for node in nodes
+    ]
+
+
+def _full_scan_diff(plan):
+    """逐节点对比快照与工作区（版本向量优化前的实现），作为参照"""
+    diffs = []
+    for y_idx, (static_node, working_node) in enumerate(
+            zip(plan.current_snapshot.nodes, plan.working_timeline)):
+        static_point = static_node.selected_point
+        working_point = working_node.selected_point
+        if not static_point or not working_point:
+            continue
+        if static_point.option.id != working_point.option.id:
+            diffs.append({
+                'y_index': y_idx,
+                'type': 'option_changed',
+                'from': {'name': static_point.option.name, 'x': static_point.x},
+                'to': {'name': working_point.option.name, 'x': working_point.x}
+            })
+        if working_point.is_adjusted:
+            diffs.append({
+                'y_index': y_idx,
+                'type': 'time_adjusted',
+                'original': working_point.original_time.isoformat() if working_point.original_time else None,
+                'current': working_point.time.isoformat(),
+                'reason': working_point.adjustment_reason
+            })
+    return diffs
+
+
+@pytest.fixture
+def plan():
+    """已生成时间线的规划（不经过规划器）"""
+    plan = ThreeDimensionalPlan(SimpleNamespace(), NeuralNetService(), enable_4d=False)
+    plan.timeline = _build_timeline()
+    plan._z_buffer = np.array([node.selected_point.z for node in plan.timeline])
+    return plan
+
+
+class TestCoWTimeline:
+    """写时复制工作区测试类"""
+
+    def test_working_changes_leave_snapshot_untouched(self, plan):
+        """工作区的切换与调整不影响快照节点和主时间线"""
+        snapshot = plan.commit_snapshot()
+        before = _selection(snapshot.nodes)
+
+        assert plan.switch_alternative(1, 2)
+        assert plan.dynamic_adjust(2, 30, "排队")
+
+        assert _selection(snapshot.nodes) == before
+        assert _selection(plan.timeline) == before
+        assert all(a is b for a, b in zip(plan.timeline, snapshot.nodes))
+        assert plan.working_timeline[1].selected_x == 2
+        assert plan.working_timeline[2].selected_point.is_adjusted
+        # 未修改的节点与快照共享
+        assert plan.working_timeline[0] is snapshot.nodes[0]
+        assert set(plan.working_timeline.overrides) == {1, 2, 3}
+
+    def test_negative_indices(self, plan):
+        """负索引与list语义一致，越界返回False"""
+        snapshot = plan.commit_snapshot()
+
+        assert plan.switch_alternative(-1, 1)
+        assert plan.working_timeline[3].selected_x == 1
+        assert snapshot.nodes[3].selected_x == 0
+
+        assert plan.dynamic_adjust(-2, 15)
+        assert [node.selected_point.is_adjusted for node in plan.working_timeline] == [
+            False, False, True, True
+        ]
+        assert plan.working_timeline[-1] is plan.working_timeline[3]
+        assert not plan.switch_alternative(1, 5)
+        with pytest.raises(IndexError):
+            plan.switch_alternative(-5, 0)
+
+    def test_switch_back_to_original(self, plan):
+        """切回原方案后与快照无差异，只影响工作区副本"""
+        snapshot = plan.commit_snapshot()
+
+        assert plan.switch_alternative(1, 2)
+        assert plan.switch_alternative(1, 0)
+
+        working = plan.working_timeline[1]
+        assert working is not snapshot.nodes[1]
+        assert working.selected_x == 0
+        assert [p.status for p in working.decision_points] == [
+            NodeStatus.SELECTED, NodeStatus.ALTERNATIVE, NodeStatus.ALTERNATIVE
+        ]
+        assert snapshot.nodes[1].decision_points[2].status is NodeStatus.ALTERNATIVE
+        assert plan.get_diff() == []
+
+    def test_switch_without_snapshot_updates_timeline(self, plan):
+        """未提交快照时直接切换主时间线并同步场强缓冲"""
+        assert plan.switch_alternative(-1, 2)
+
+        assert plan.timeline[3].selected_x == 2
+        assert plan._z_buffer[3] == pytest.approx(0.7)
+
+
+class TestVersionVectorDiff:
+    """版本向量差异检测测试类"""
+
+    @pytest.mark.parametrize("operations", [
+        [('switch', 1, 2), ('switch', 1, 0)],
+        [('switch', 0, 1), ('adjust', 0, 20), ('switch', 0, 0)],
+        [('adjust', 2, 10), ('switch', 3, 1), ('switch', 3, 0), ('switch', 2, 2)],
+        [('switch', -1, 2), ('adjust', -2, 5), ('switch', 2, 1), ('switch', -1, 0)],
+        [('switch', 1, 1), ('switch', 1, 2), ('adjust', 1, 15), ('adjust', 0, 5),
+         ('switch', 1, 0), ('switch', 1, 1)],
+    ])
+    def test_diff_matches_full_scan(self, plan, operations):
+        """切换、切回与调整混合操作后，每一步的差异都与全量对比一致"""
+        plan.commit_snapshot()
+
+        for op, y, arg in operations:
+            if op == 'switch':
+                plan.switch_alternative(y, arg)
+            else:
+                plan.dynamic_adjust(y, arg, "延误")
+            assert plan.get_diff() == _full_scan_diff(plan)
+
+    def test_random_operations_match_full_scan(self, plan):
+        """随机操作序列（含负索引与越界下标）下差异与全量对比一致"""
+        rng = np.random.default_rng(7)
+        plan.commit_snapshot()
+
+        for _ in range(60):
+            y = int(rng.integers(-4, 4))
+            if rng.random() < 0.75:
+                plan.switch_alternative(y, int(rng.integers(0, 4)))
+            else:
+                plan.dynamic_adjust(y, int(rng.integers(5, 30)))
+            assert plan.get_diff() == _full_scan_diff(plan)
+
+
+class TestDecisionPointSerialization:
+    """决策点序列化缓存测试类"""
+
+    def test_adjust_and_switch_invalidate_cache(self, plan):
+        """调整与切换后to_dict反映新状态，快照节点的结果不变"""
+        snapshot = plan.commit_snapshot()
+        static_before = snapshot.nodes[1].selected_point.to_dict()
+        plan.working_timeline[1].selected_point.to_dict()
+
+        plan.dynamic_adjust(1, 30, "排队")
+        adjusted = plan.working_timeline[1].selected_point.to_dict()
+        assert adjusted['status'] == NodeStatus.ADJUSTED.value
+        assert adjusted['is_adjusted']
+        assert adjusted['time'] == "2024-12-02T12:00:00"
+        assert static_before['time'] == "2024-12-02T11:30:00"
+
+        plan.switch_alternative(1, 2)
+        points = plan.working_timeline[1].decision_points
+        assert points[0].to_dict()['status'] == NodeStatus.ALTERNATIVE.value
+        assert points[2].to_dict()['status'] == NodeStatus.SELECTED.value
+        assert snapshot.nodes[1].selected_point.to_dict() == static_before
+
+    def test_returned_dict_is_a_copy(self, plan):
+        """修改返回的字典不影响缓存"""
+        point = plan.timeline[0].selected_point
+        first = point.to_dict()
+
+        first['status'] = "tampered"
+        first['option']['name'] = "tampered"
+        first['factors'].append({'name': "tampered"})
+
+        second = point.to_dict()
+        assert second['status'] == NodeStatus.SELECTED.value
+        assert second['option']['name'] == "POI0-0"
+        assert second['factors'] == []
+        assert plan.export_current_plan()['timeline'][0]['selected'] == second
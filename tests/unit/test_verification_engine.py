@@ -0,0 +1,381 @@
+"""
+验证引擎单元测试
+验证批量验证与逐节点验证的一致性
+"""
+
+import json
+import math
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src.core.models import Location, POIType, State, PlanningSession
+from src.core.neural_net_service import NeuralNetService
+import src.core.verification_engine as verification_engine
+from src.core.verification_engine import (
+    VerificationEngine, _haversine_batch, _haversine_batch_kernel,
+    _haversine_batch_numpy
+)
+
+
+class FakeCollector:
+    """固定返回多源评分与评论的采集器（记录调用次数）"""
+
+    def __init__(self):
+        self.calls = {'sources': 0, 'reviews': 0}
+
+    def collect_multi_source(self, node):
+        self.calls['sources'] += 1
+        return {
+            'gaode': {'rating': 4.5, 'review_count': 120, 'weight': 0.4},
+            'ctrip': {'rating': 4.2, 'review_count': 80, 'weight': 0.3},
+        }
+
+    def collect_reviews(self, node):
+        self.calls['reviews'] += 1
+        return [{'text': f"{node.name}景色优美，值得一去"}] * 12
+
+
+class ScalarNNService:
+    """只有逐条接口的模型服务：含“刷单”的评论判为虚假，含“差”的判为负面"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def detect_fake(self, text):
+        self.calls += 1
+        return 0.9 if "刷单" in text else 0.05
+
+    def sentiment_analysis(self, text):
+        self.calls += 1
+        if "坏" in text:
+            raise ValueError(text)
+        return 0.2 if "差" in text else 0.8
+
+
+class BatchNNService(ScalarNNService):
+    """额外提供批量接口的模型服务"""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_calls = 0
+
+    def detect_fake_batch(self, texts):
+        self.batch_calls += 1
+        return [0.9 if "刷单" in t else 0.05 for t in texts]
+
+    def sentiment_analysis_batch(self, texts):
+        self.batch_calls += 1
+        return np.array([0.5 if "坏" in t else 0.2 if "差" in t else 0.8 for t in texts])
+
+
+class ReviewCollector(FakeCollector):
+    """12条评论：2条刷单、3条差评、1条会让情感模型出错"""
+
+    def collect_reviews(self, node):
+        self.calls['reviews'] += 1
+        return ([{'text': "刷单好评"}] * 2 + [{'text': "体验很差"}] * 3
+                + [{'text': "坏数据"}] + [{'text': "很棒"}] * 6)
+
+
+class TestVerificationEngine:
+    """验证引擎测试类"""
+
+    @pytest.fixture
+    def engine(self):
+        """创建VerificationEngine实例"""
+        return VerificationEngine(
+            FakeCollector(), NeuralNetService(config={'enabled': False}), None
+        )
+
+    @pytest.fixture
+    def nodes(self):
+        """候选节点（含与当前位置重合的节点）"""
+        return [
+            Location(id="a", name="南普陀寺", lat=24.44, lon=118.10,
+                     type=POIType.ATTRACTION),
+            Location(id="b", name="沙茶面", lat=24.45, lon=118.08,
+                     type=POIType.RESTAURANT, average_visit_time=1.0),
+            Location(id="c", name="鼓浪屿", lat=24.447, lon=118.066,
+                     type=POIType.ATTRACTION, average_visit_time=4.0),
+            Location(id="d", name="集美学村", lat=24.58, lon=118.10,
+                     type=POIType.ATTRACTION),
+        ]
+
+    @pytest.fixture
+    def state(self, nodes):
+        """当前状态（位于南普陀寺）"""
+        return State(current_location=nodes[0], current_time=10.0)
+
+    @pytest.fixture
+    def session(self):
+        """规划会话（24小时）"""
+        return PlanningSession(duration=24.0)
+
+    def test_haversine_batch_matches_scalar(self, engine, nodes):
+        """批量球面距离与逐点_haversine一致"""
+        origin = nodes[0]
+        lats = np.array([n.lat for n in nodes])
+        lons = np.array([n.lon for n in nodes])
+
+        batch = _haversine_batch(origin.lat, origin.lon, lats, lons)
+
+        np.testing.assert_allclose(
+            batch, [engine._haversine(origin, n) for n in nodes], atol=1e-9
+        )
+        assert batch[0] == 0.0
+
+    def test_small_angle_approximation_bound(self):
+        """城市尺度（≤50km）使用小角度近似，与精确asin公式相差不超过0.2m"""
+        lats = 24.44 + np.linspace(0.0, 0.45, 50)
+        lons = np.full(50, 118.10)
+        rlat0, rlats = np.radians(24.44), np.radians(lats)
+        a = np.sin((rlats - rlat0) / 2) ** 2
+        exact = 6371 * 2 * np.arcsin(np.sqrt(a))
+
+        approx = _haversine_batch_numpy(24.44, 118.10, lats, lons)
+
+        assert exact.max() > 49.0
+        np.testing.assert_allclose(approx, exact, atol=2e-4)
+
+    def test_batch_kernel_matches_numpy_fallback(self):
+        """JIT内核（若可用）与NumPy降级实现结果一致"""
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(20.0, 40.0, 257)
+        lons = rng.uniform(100.0, 125.0, 257)
+        lats[:64] = rng.uniform(31.0, 31.6, 64)  # 含小角度近似分支
+        lons[:64] = rng.uniform(120.3, 120.9, 64)
+
+        np.testing.assert_allclose(
+            _haversine_batch_kernel(31.3, 120.6, lats, lons),
+            _haversine_batch_numpy(31.3, 120.6, lats, lons),
+            atol=1e-9
+        )
+
+    @pytest.mark.parametrize("values", [[4.5], [4.5, 4.2], [4.8, 3.1, 4.4, 4.0], [0.0, 0.0]])
+    def test_multi_source_stats_match_two_pass(self, engine, nodes, values):
+        """单遍累积的均值/方差与两遍np.mean/np.var一致"""
+        sources = {f"s{i}": {'rating': r, 'weight': 0.2} for i, r in enumerate(values)}
+        engine.collector.collect_multi_source = lambda node: sources
+
+        result = engine._multi_source_verification(nodes[0])
+
+        assert result.mu == pytest.approx(np.mean(values), abs=1e-12)
+        assert result.variance == pytest.approx(np.var(values), abs=1e-12)
+        assert result.weighted_rating == pytest.approx(np.mean(values), abs=1e-12)
+
+    def test_verify_batch_matches_verify(self, engine, nodes, state, session):
+        """批量验证与逐个verify结果一致（模型服务的Mock输出带随机性，只比较确定性字段）"""
+        batch = engine.verify_batch(nodes, state, session)
+        scalar = [engine.verify(n, state, session) for n in nodes]
+
+        assert len(batch) == len(nodes)
+        for b, s in zip(batch, scalar):
+            assert b.spatial_score == pytest.approx(s.spatial_score, abs=1e-9)
+            assert b.distance_from_current == pytest.approx(s.distance_from_current, abs=1e-9)
+            assert b.detour_rate == pytest.approx(s.detour_rate, abs=1e-9)
+            assert b.consistency_score == s.consistency_score
+            assert b.weighted_rating == s.weighted_rating
+            assert b.total_reviews == s.total_reviews
+
+    def test_sequential_matches_pooled(self, nodes, state, session):
+        """workers=1顺序执行与线程池并发执行结果一致"""
+        sequential = VerificationEngine(FakeCollector(), None, None, workers=1)
+        pooled = VerificationEngine(FakeCollector(), None, None)
+
+        for node in nodes:
+            a = sequential.verify(node, state, session)
+            b = pooled.verify(node, state, session)
+            assert (a.spatial_score, a.temporal_score, a.consistency_score, a.valid_reviews) == \
+                (b.spatial_score, b.temporal_score, b.consistency_score, b.valid_reviews)
+        assert [v.temporal_score for v in sequential.verify_batch(nodes, state, session)] == \
+            [v.temporal_score for v in pooled.verify_batch(nodes, state, session)]
+
+        pooled.close()
+        assert pooled._pool is None
+
+    def test_verify_batch_shares_update_time(self, engine, nodes, state, session):
+        """同一批验证的所有数据源共用一次取得的更新时间"""
+        batch = engine.verify_batch(nodes, state, session)
+
+        assert len({ds.last_update for v in batch for ds in v.data_sources}) == 1
+
+    def test_verify_batch_without_location(self, engine, nodes, session):
+        """当前位置缺失时批量验证与逐个验证同样降级为默认空间结果"""
+        state = State(current_location=None, current_time=10.0)
+
+        batch = engine.verify_batch(nodes, state, session)
+
+        assert [v.spatial_score for v in batch] == [
+            engine.verify(n, state, session).spatial_score for n in nodes
+        ]
+        assert all(math.isclose(v.distance_from_current, 5.0) for v in batch)
+
+    def test_verify_batch_empty(self, engine, state, session):
+        """空候选返回空列表"""
+        assert engine.verify_batch([], state, session) == []
+
+    def test_temporal_closed_skips_lstm(self, nodes, state, session):
+        """未营业时直接记0分，不调用LSTM预测拥挤度"""
+        service = ScalarNNService()
+        lstm_calls = []
+        service.lstm_predict_crowd = lambda node, time: lstm_calls.append(time) or 0.1
+        engine = VerificationEngine(FakeCollector(), service, None)
+        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday',
+                'Friday', 'Saturday', 'Sunday']
+        node = nodes[1]
+        node.opening_hours = {day: (20.0, 22.0) for day in days}
+
+        result = engine._temporal_verification(node, state, session)
+
+        assert not result.is_open
+        assert result.score == 0.0
+        assert result.crowd_level == 0.5
+        assert result.time_sufficient
+        assert lstm_calls == []
+
+    def test_collector_results_cached_per_node(self, engine, nodes, state, session):
+        """同一节点重复验证只采集一次，clear_cache后重新采集"""
+        for _ in range(3):
+            engine.verify_batch(nodes, state, session)
+
+        assert engine.collector.calls == {'sources': len(nodes), 'reviews': len(nodes)}
+
+        engine.clear_cache()
+        engine.verify(nodes[0], state, session)
+        assert engine.collector.calls['sources'] == len(nodes) + 1
+
+    def test_collector_cache_persisted(self, nodes, state, session, tmp_path):
+        """SQLite持久化缓存跨引擎实例复用，过期后重新采集"""
+        path = str(tmp_path / "poi_cache.db")
+        VerificationEngine(FakeCollector(), None, None, cache_path=path).verify(
+            nodes[1], state, session
+        )
+
+        collector = FakeCollector()
+        engine = VerificationEngine(collector, None, None, cache_path=path)
+        result = engine.verify(nodes[1], state, session)
+
+        assert collector.calls == {'sources': 0, 'reviews': 0}
+        assert result.total_reviews == 12
+        assert [ds.name for ds in result.data_sources] == ['gaode', 'ctrip']
+
+        expired = VerificationEngine(collector, None, None, cache_path=path, cache_ttl=0)
+        expired.verify(nodes[1], state, session)
+        assert collector.calls == {'sources': 1, 'reviews': 1}
+
+    def test_collector_cache_stored_as_json(self, nodes, tmp_path):
+        """持久化缓存以JSON存储，时间字段还原为datetime，无法解析的旧记录视为未命中"""
+        path = str(tmp_path / "poi_cache.db")
+        reviewed_at = datetime(2024, 12, 1, 10, 30)
+        collector = FakeCollector()
+        collector.collect_reviews = lambda node: [
+            {'text': "排队很久", 'timestamp': reviewed_at, 'rating': np.float64(3.5)}
+        ]
+        VerificationEngine(collector, None, None, cache_path=path)._get_reviews(nodes[0])
+
+        db = sqlite3.connect(path)
+        stored = db.execute("SELECT reviews FROM poi_cache WHERE id = ?", (nodes[0].id,)).fetchone()[0]
+        assert json.loads(stored)[0][0]['timestamp'] == reviewed_at.isoformat()
+
+        reviews, total = VerificationEngine(
+            FakeCollector(), None, None, cache_path=path
+        )._get_reviews(nodes[0])
+        assert reviews == [{'text': "排队很久", 'timestamp': reviewed_at, 'rating': 3.5}]
+        assert total == 1
+
+        db.execute("UPDATE poi_cache SET reviews = ?", (sqlite3.Binary(b"\x80\x04legacy"),))
+        db.commit()
+        db.close()
+        fresh = FakeCollector()
+        reviews, total = VerificationEngine(fresh, None, None, cache_path=path)._get_reviews(nodes[0])
+        assert fresh.calls['reviews'] == 1
+        assert total == 12
+
+    @pytest.mark.parametrize("service_cls", [ScalarNNService, BatchNNService])
+    def test_review_cleaning_batched(self, nodes, service_cls):
+        """批量接口与逐条接口清洗结果一致，批量接口每个节点只推理两次"""
+        service = service_cls()
+        engine = VerificationEngine(ReviewCollector(), service, None)
+
+        result = engine._data_cleaning(nodes[0], {})
+
+        assert result.total_reviews == 12
+        assert result.valid_reviews == 10
+        assert result.fake_rate == pytest.approx(2 / 12)
+        assert result.positive_rate == pytest.approx(6 / 10)
+        assert result.negative_rate == pytest.approx(3 / 10)
+        if service_cls is BatchNNService:
+            assert (service.batch_calls, service.calls) == (2, 0)
+
+    def test_multi_source_weighted_rating(self, engine, nodes):
+        """一致性与加权评分按 1-σ/μ 与 Σ(w·r·c)/Σw 计算"""
+        result = engine._multi_source_verification(nodes[0])
+
+        assert result.mu == pytest.approx(4.35)
+        assert result.sigma == pytest.approx(0.15)
+        assert result.variance == pytest.approx(0.15 ** 2)
+        assert result.consistency == pytest.approx(1 - 0.15 / 4.35)
+        assert result.weighted_rating == pytest.approx((4.5 * 0.4 + 4.2 * 0.3) / 0.7)
+        assert [(ds.name, ds.weight) for ds in result.sources] == [
+            ('gaode', 0.4), ('ctrip', 0.3)
+        ]
+
+    def test_review_cleaning_sampled(self, nodes):
+        """评论超过抽样上限时只对样本推理，并按样本比例外推有效评论数"""
+        service = BatchNNService()
+        engine = VerificationEngine(ReviewCollector(), service, None)
+        engine.collector.collect_reviews = lambda node: [{'text': "刷单好评"}] * 300 + [{'text': "很棒"}] * 900
+        engine.config['review_sample_size'] = 400
+
+        result = engine._data_cleaning(nodes[0], {})
+
+        assert result.total_reviews == 1200
+        assert 0.15 < result.fake_rate < 0.35
+        assert result.valid_reviews == int((1 - result.fake_rate) * 1200)
+        assert result.positive_rate == 1.0
+
+    def test_review_stream_capped(self, nodes):
+        """流式采集器只读取max_reviews条，评论总数取review_count元数据"""
+        class StreamCollector(FakeCollector):
+            consumed = 0
+
+            def iter_reviews(self, node):
+                while True:
+                    StreamCollector.consumed += 1
+                    yield {'text': "很棒"}
+
+            def review_count(self, node):
+                return 50000
+
+        engine = VerificationEngine(StreamCollector(), BatchNNService(), None)
+        engine.config['max_reviews'] = 300
+
+        result = engine._data_cleaning(nodes[0], {})
+
+        assert StreamCollector.consumed == 300
+        assert engine.collector.calls['reviews'] == 0
+        assert result.total_reviews == 50000
+        assert result.valid_reviews == 50000
+
+    def test_review_keywords_tfidf(self, nodes):
+        """正/负面评论分别按TF-IDF提取关键词"""
+        pytest.importorskip("sklearn")
+        engine = VerificationEngine(ReviewCollector(), BatchNNService(), None)
+
+        result = engine._data_cleaning(nodes[0], {})
+
+        assert result.key_positive == ['很棒']
+        assert set(result.key_negative) == {'体验', '验很', '很差'}
+
+    def test_review_keywords_placeholder_without_sklearn(self, nodes, monkeypatch):
+        """未安装sklearn时保留占位关键词"""
+        monkeypatch.setattr(verification_engine, 'SKLEARN_AVAILABLE', False)
+        engine = VerificationEngine(ReviewCollector(), BatchNNService(), None)
+
+        result = engine._data_cleaning(nodes[0], {})
+
+        assert result.key_positive == ['服务好', '环境好', '值得']
+        assert result.key_negative == ['人多', '排队', '贵']